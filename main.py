@@ -23,15 +23,17 @@ from rpython.rlib.jit import set_user_param
 from typhon import rsodium, ruv
 from typhon.arguments import Configuration
 from typhon.debug import enableDebugPrint, TyphonJitHooks
-from typhon.errors import LoadFailed, UserException
-from typhon.importing import obtainModule
+from typhon.errors import LoadFailed, UsageError, UserException
+from typhon.importing import compiledCache, obtainModule
 from typhon.log import log
 from typhon.metrics import globalRecorder
+from typhon.nano.interp import backendSettings
 from typhon.objects.auditors import deepFrozenGuard
 from typhon.objects.collections.maps import ConstMap, monteMap, unwrapMap
 from typhon.objects.constants import NullObject
 from typhon.objects.data import IntObject, StrObject, unwrapStr
 from typhon.objects.guards import anyGuard
+from typhon.objects.processvats import serveProcessVat
 from typhon.objects.refs import resolution
 from typhon.objects.slots import finalBinding
 from typhon.objects.timeit import benchmarkSettings
@@ -81,19 +83,24 @@ def loadPrelude(config, recorder, vat):
     return prelude
 
 
-def runUntilDone(vatManager, uv_loop, recorder):
+def runUntilDone(vatManager, uv_loop, recorder, pollEvery):
     # This may take a while.
     anyVatHasTurns = vatManager.anyVatHasTurns()
+    # Scheduling passes since we last polled for I/O.
+    passes = 0
     while anyVatHasTurns or ruv.loopAlive(uv_loop):
-        for vat in vatManager.vats:
-            if vat.hasTurns():
-                with scopedVat(vat) as vat:
-                    with recorder.context("Time spent in vats"):
-                        vat.takeSomeTurns()
-
-        if ruv.loopAlive(uv_loop):
+        with recorder.context("Time spent in vats"):
+            vatManager.takeSomeTurns()
+        passes += 1
+
+        # While there's work to do, only poll every so often, so that the
+        # cost of polling is spread across several passes.
+        if ruv.loopAlive(uv_loop) and (not anyVatHasTurns or
+                                       passes >= pollEvery):
+            passes = 0
+            # Housekeeping, like closing finalized streams, happens on the
+            # loop's prepare handle when we poll.
             with recorder.context("Time spent in I/O"):
-                ruv.cleanup()
                 try:
                     if anyVatHasTurns:
                         # More work to be done, so don't block.
@@ -104,6 +111,10 @@ def runUntilDone(vatManager, uv_loop, recorder):
                 except UserException as ue:
                     debug_print("Caught exception while reacting:",
                             ue.formatError())
+        elif ruv.loopAlive(uv_loop):
+            # Not polling this pass, so do the housekeeping here; it
+            # shouldn't wait on the poll interval.
+            ruv.housekeeping.runChores()
 
         anyVatHasTurns = vatManager.anyVatHasTurns()
 
@@ -161,13 +172,23 @@ def runTyphon(argv):
         print "Couldn't initialize libsodium!"
         return 1
 
-    config = Configuration(argv)
+    try:
+        config = Configuration(argv)
+    except UsageError as ue:
+        print ue.msg
+        return 1
 
     if config.verbose:
         enableDebugPrint()
 
     config.enableLogging()
 
+    if config.cachePath is not None:
+        compiledCache.enable(config.cachePath)
+
+    if config.bytecode:
+        backendSettings.enableBytecode()
+
     if len(config.argv) < 2:
         print "No file provided?"
         return 1
@@ -177,12 +198,15 @@ def runTyphon(argv):
 
     # Intialize our loop.
     uv_loop = ruv.alloc_loop()
+    ruv.housekeeping.install(uv_loop)
 
     # Usurp SIGPIPE, as libuv does not handle it.
     rsignal.pypysig_ignore(rsignal.SIGPIPE)
 
     # Initialize our first vat. It shall be immortal.
     vatManager = VatManager()
+    vatManager.turnBudget = config.turnBudget
+    vatManager.timeBudget = config.timeBudget
     vat = Vat(vatManager, uv_loop, checkpoints=-1)
     vatManager.vats.append(vat)
 
@@ -205,17 +229,17 @@ def runTyphon(argv):
 
     scope = safeScope()
     scope.update(prelude)
-    ss = scope.copy()
     reflectedSS = monteMap()
-    for k, b in ss.iteritems():
-        reflectedSS[StrObject(u"&&" + k)] = b
-    ss[u"safeScope"] = finalBinding(ConstMap(reflectedSS), deepFrozenGuard)
-    reflectedSS[StrObject(u"&&safeScope")] = ss[u"safeScope"]
-    scope[u"safeScope"] = ss[u"safeScope"]
-    scope.update(unsafeScope(config))
-    reflectedUnsafeScope = monteMap()
-    unsafeScopeDict = {}
     for k, b in scope.iteritems():
+        reflectedSS[StrObject(u"&&" + k)] = b
+    ssBinding = finalBinding(ConstMap(reflectedSS), deepFrozenGuard)
+    reflectedSS[StrObject(u"&&safeScope")] = ssBinding
+    scope[u"safeScope"] = ssBinding
+    # The unsafe scope is a superset of the safe scope, so start from the
+    # safe scope's reflection instead of rewrapping every name again.
+    reflectedUnsafeScope = reflectedSS.copy()
+    unsafeScopeDict = scope.copy()
+    for k, b in unsafeScope(config).iteritems():
         reflectedUnsafeScope[StrObject(u"&&" + k)] = b
         unsafeScopeDict[k] = b
     rus = finalBinding(ConstMap(reflectedUnsafeScope), anyGuard)
@@ -245,12 +269,19 @@ def runTyphon(argv):
         if result is None:
             return 1
 
+        if config.processVat is not None:
+            try:
+                serveProcessVat(vat, config.processVat, result)
+            except OSError as ose:
+                print "Couldn't serve process vat:", ose.strerror
+                return 1
+
         # Exit status code.
         exitStatus = 0
         # Update loop timing information.
         ruv.update_time(uv_loop)
         try:
-            runUntilDone(vatManager, uv_loop, recorder)
+            runUntilDone(vatManager, uv_loop, recorder, config.pollEvery)
             rv = resolution(result) if result is not None else NullObject
             if isinstance(rv, IntObject):
                 exitStatus = rv.getInt()
@@ -261,6 +292,7 @@ def runTyphon(argv):
         finally:
             recorder.stop()
             recorder.printResults()
+            vatManager.printResults()
 
     # Clean up and exit.
     cleanUpEverything()
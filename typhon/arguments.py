@@ -12,6 +12,8 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+from typhon.errors import UsageError
+
 
 class ListStream(object):
 
@@ -30,6 +32,13 @@ class ListStream(object):
         self._counter += 1
         return rv
 
+    def nextInt(self, flag):
+        item = self.nextItem()
+        try:
+            return int(item)
+        except ValueError:
+            raise UsageError("%s expects an integer, not '%s'" % (flag, item))
+
 
 class Configuration(object):
     """
@@ -53,6 +62,29 @@ class Configuration(object):
     # Whether to run benchmarks.
     benchmark = False
 
+    # Where to keep lowered modules between runs, if anywhere.
+    cachePath = None
+
+    # Whether to run code on the bytecode machine instead of the AST
+    # evaluator.
+    bytecode = False
+
+    # How many messages a batch-priority vat may deliver before other vats
+    # get a chance; higher priorities get more. Negative for no limit.
+    turnBudget = 1000
+
+    # How long, in seconds, a vat may take turns before other vats get a
+    # chance. Zero for no limit.
+    timeBudget = 0.0
+
+    # How many scheduling passes to make between polls for I/O while vats
+    # are busy.
+    pollEvery = 1
+
+    # The prefix of the queues over which to serve the script's result, if
+    # this process is a process vat.
+    processVat = None
+
     # User settings for the JIT. By default:
     # * The trace limit is over 9000 and prime.
     jit = "trace_limit=9001"
@@ -94,6 +126,19 @@ class Configuration(object):
                 self.benchmark = True
             elif item == "--jit":
                 self.jit = stream.nextItem()
+            elif item == "--cache":
+                self.cachePath = stream.nextItem()
+            elif item == "--bytecode":
+                self.bytecode = True
+            elif item == "--turn-budget":
+                self.turnBudget = stream.nextInt(item)
+            elif item == "--time-budget":
+                # Given in milliseconds.
+                self.timeBudget = stream.nextInt(item) / 1000.0
+            elif item == "--poll-every":
+                self.pollEvery = max(1, stream.nextInt(item))
+            elif item == "--process-vat":
+                self.processVat = stream.nextItem()
             else:
                 self.argv.append(item)
 
@@ -29,6 +29,15 @@ class LoadFailed(Exception):
     """
 
 
+class UsageError(Exception):
+    """
+    The command line couldn't be understood.
+    """
+
+    def __init__(self, msg):
+        self.msg = msg
+
+
 class UserException(Exception):
     """
     An error occurred in user code.
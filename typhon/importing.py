@@ -12,14 +12,18 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import os
+
 from rpython.rlib.jit import dont_look_inside
 from rpython.rlib.rpath import rjoin
+from rpython.rlib.rsha import RSHA
 
 from typhon import log
 from typhon.debug import debugPrint
 from typhon.errors import userError
 from typhon.load.nano import loadMASTBytes as nanoLoad
-from typhon.nano.interp import evalMonte
+from typhon.nano.cache import MAGIC, InvalidCache, dumpLowered, loadLowered
+from typhon.nano.interp import lowerMonte, runLowered
 from typhon.objects.root import Object
 
 
@@ -34,6 +38,75 @@ class ModuleCache(object):
 moduleCache = ModuleCache()
 
 
+class CompiledCache(object):
+    """
+    An on-disk cache of lowered modules.
+
+    Entries are keyed by the content of the module's MAST, together with
+    everything else which lowering depends upon, so stale entries are never
+    used; they are simply never looked up again.
+    """
+
+    path = None
+
+    def enable(self, path):
+        self.path = path
+
+    def keyFor(self, sourceDigest, outerNames, fqnPrefix):
+        sha = RSHA(MAGIC)
+        sha.update(fqnPrefix.encode("utf-8"))
+        for name in outerNames:
+            sha.update("\x00")
+            sha.update(name.encode("utf-8"))
+        sha.update("\x00\x00")
+        sha.update(sourceDigest)
+        return sha.hexdigest()
+
+    def entryPath(self, key):
+        return rjoin(self.path, key + ".tyc")
+
+    def fetch(self, key):
+        """
+        Retrieve a lowered module, or None if it's not cached.
+        """
+
+        if self.path is None:
+            return None
+        path = self.entryPath(key)
+        try:
+            with open(path, "rb") as handle:
+                bs = handle.read()
+        except IOError:
+            return None
+        try:
+            return loadLowered(bs)
+        except InvalidCache:
+            log.log(["import", "error"], u"Ignoring invalid cache entry %s" %
+                    path.decode("utf-8"))
+            return None
+
+    def store(self, key, lowered, source, mast):
+        if self.path is None:
+            return
+        try:
+            bs = dumpLowered(lowered, source, mast)
+        except InvalidCache:
+            return
+        path = self.entryPath(key)
+        # Write to the side and then rename, so that concurrent readers only
+        # ever see complete entries.
+        temp = "%s.%d" % (path, os.getpid())
+        try:
+            with open(temp, "wb") as handle:
+                handle.write(bs)
+            os.rename(temp, path)
+        except (IOError, OSError):
+            log.log(["import", "error"], u"Couldn't write cache entry %s" %
+                    path.decode("utf-8"))
+
+compiledCache = CompiledCache()
+
+
 def tryExtensions(filePath, recorder):
     # Leaving this in loop form in case we change formats again.
     for extension in [".mast"]:
@@ -51,6 +124,10 @@ def tryExtensions(filePath, recorder):
 
 
 def obtainModule(libraryPaths, recorder, filePath):
+    # Modules are obtained one at a time, on the calling thread. Imports are
+    # resolved by running Monte code (see the prelude's loader), so the set
+    # of modules to fetch isn't known ahead of time, and we aren't built with
+    # thread support anyway. The compiled cache is what keeps this cheap.
     for libraryPath in libraryPaths:
         path = rjoin(libraryPath, filePath)
 
@@ -78,6 +155,8 @@ class Module(Object):
     def __init__(self, recorder, origin):
         self.recorder = recorder
         self.origin = origin
+        self.source = None
+        self.sourceDigest = None
         self.astSource = None
         self.smallcapsSource = None
         self.locals = {}
@@ -85,9 +164,36 @@ class Module(Object):
 
 class AstModule(Module):
     def load(self, source):
+        # Deserialization is deferred until we know that the compiled cache
+        # can't help us.
+        self.source = source
+        self.sourceDigest = RSHA(source).digest()
+        self.lowered = {}
+
+    def getAST(self):
+        if self.astSource is None:
+            with self.recorder.context("Deserialization"):
+                self.astSource = nanoLoad(self.source)
+        return self.astSource
+
+    def lower(self, outerNames):
+        key = compiledCache.keyFor(self.sourceDigest, outerNames, self.origin)
+        lowered = self.lowered.get(key, None)
+        if lowered is not None:
+            return lowered
+
         with self.recorder.context("Deserialization"):
-            self.astSource = nanoLoad(source)
+            lowered = compiledCache.fetch(key)
+        if lowered is None:
+            mast = self.getAST()
+            lowered = lowerMonte(mast, outerNames, self.origin)
+            compiledCache.store(key, lowered, self.source, mast)
+        self.lowered[key] = lowered
+        # Once lowered, the decoded MAST is dead weight; if we're ever
+        # evaluated against a different scope, it can be decoded again.
+        self.astSource = None
+        return lowered
 
     @dont_look_inside
     def eval(self, env):
-            return evalMonte(self.astSource, env, self.origin)
+        return runLowered(self.lower(env.keys()), env)
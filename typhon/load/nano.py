@@ -2,8 +2,9 @@
 The MAST format, version zero, nanopass version.
 """
 
+from rpython.rlib.rarithmetic import LONG_BIT
 from rpython.rlib.rbigint import rbigint
-from rpython.rlib.rstruct.ieee import unpack_float
+from rpython.rlib.rstruct.ieee import float_pack, unpack_float
 from rpython.rlib.runicode import str_decode_utf_8
 
 from typhon.nano.mast import MastIR
@@ -17,6 +18,10 @@ class InvalidMAST(Exception):
 
 MAGIC = "Mont\xe0MAST\x00"
 
+# The largest shift at which another seven bits still fit into a
+# non-negative machine int.
+VARINT_SHIFT_LIMIT = LONG_BIT - 1 - 7
+
 
 class MASTStream(object):
 
@@ -57,9 +62,21 @@ class MASTStream(object):
         except ValueError:
             raise InvalidMAST("Couldn't decode invalid double")
 
+    def remaining(self):
+        return len(self.bytes) - self.index
+
     def nextVarInt(self):
+        # Almost every varint fits in a machine word, so accumulate into one
+        # and only switch over to a bigint when we run out of room.
         shift = 0
-        bi = rbigint.fromint(0)
+        i = 0
+        while shift <= VARINT_SHIFT_LIMIT:
+            b = ord(self.nextByte())
+            i |= (b & 0x7f) << shift
+            shift += 7
+            if not b & 0x80:
+                return rbigint.fromint(i)
+        bi = rbigint.fromint(i)
         cont = True
         while cont:
             b = ord(self.nextByte())
@@ -69,10 +86,39 @@ class MASTStream(object):
         return bi
 
     def nextInt(self):
-        try:
-            return self.nextVarInt().toint()
-        except OverflowError:
-            raise InvalidMAST("String length overflows integer bounds")
+        shift = 0
+        i = 0
+        while shift <= VARINT_SHIFT_LIMIT:
+            b = ord(self.nextByte())
+            i |= (b & 0x7f) << shift
+            shift += 7
+            if not b & 0x80:
+                return i
+        raise InvalidMAST("String length overflows integer bounds")
+
+    def nextBigInt(self):
+        """
+        Read a zigzagged varint, returning a bigint.
+
+        Small values are un-zigzagged on machine ints.
+        """
+
+        start = self.index
+        shift = 0
+        i = 0
+        while shift <= VARINT_SHIFT_LIMIT:
+            b = ord(self.nextByte())
+            i |= (b & 0x7f) << shift
+            shift += 7
+            if not b & 0x80:
+                return rbigint.fromint((i >> 1) ^ -(i & 1))
+        # Too big; rewind and take the slow path.
+        self.index = start
+        bi = self.nextVarInt()
+        shifted = bi.rshift(1)
+        if bi.int_and_(1).toint():
+            shifted = shifted.int_xor(-1)
+        return shifted
 
     def nextStr(self):
         size = self.nextInt()
@@ -114,9 +160,20 @@ class MASTContext(object):
             raise InvalidMAST("Expected expr")
         return expr
 
-    def nextExprs(self, stream):
+    def nextSize(self, stream):
+        # Every element costs at least one byte, so a size larger than the
+        # rest of the stream is bogus; checking lets us pre-size lists.
         size = stream.nextInt()
-        return [self.nextExpr(stream) for _ in range(size)]
+        if size > stream.remaining():
+            raise InvalidMAST("Sequence size %d is too large" % size)
+        return size
+
+    def nextExprs(self, stream):
+        size = self.nextSize(stream)
+        rv = [None] * size
+        for i in range(size):
+            rv[i] = self.nextExpr(stream)
+        return rv
 
     def nextMethods(self, stream):
         size = stream.nextInt()
@@ -138,8 +195,11 @@ class MASTContext(object):
         return self.pattAt(stream.nextInt())
 
     def nextPatts(self, stream):
-        size = stream.nextInt()
-        return [self.nextPatt(stream) for _ in range(size)]
+        size = self.nextSize(stream)
+        rv = [None] * size
+        for i in range(size):
+            rv[i] = self.nextPatt(stream)
+        return rv
 
     def nextNamedExprs(self, stream):
         size = stream.nextInt()
@@ -181,11 +241,7 @@ class MASTContext(object):
                 self.exprs.append(MastIR.DoubleExpr(stream.nextDouble()))
             elif literalTag == 'I':
                 # Int. Read a varint and un-zz it.
-                bi = stream.nextVarInt()
-                shifted = bi.rshift(1)
-                if bi.int_and_(1).toint():
-                    shifted = shifted.int_xor(-1)
-                self.exprs.append(MastIR.IntExpr(shifted))
+                self.exprs.append(MastIR.IntExpr(stream.nextBigInt()))
             elif literalTag == 'N':
                 # Null.
                 self.exprs.append(MastIR.NullExpr())
@@ -366,3 +422,318 @@ def loadMASTHandle(handle, noisy=False):
 def loadMAST(path, noisy=False):
     with open(path, "rb") as handle:
         return loadMASTHandle(handle, noisy)
+
+
+class MASTWriter(object):
+    """
+    The inverse of MASTStream; accumulates bytes.
+    """
+
+    def __init__(self):
+        self.buf = []
+
+    def getvalue(self):
+        return "".join(self.buf)
+
+    def writeByte(self, b):
+        self.buf.append(b)
+
+    def writeBytes(self, bs):
+        self.buf.append(bs)
+
+    def writeDouble(self, d):
+        # Big-endian, to match nextDouble().
+        bits = float_pack(d, 8)
+        for i in range(8):
+            shift = 8 * (7 - i)
+            self.buf.append(chr(int((bits >> shift) & 0xff)))
+
+    def writeInt(self, i):
+        assert i >= 0, "writeInt: Negative varint"
+        while i >= 0x80:
+            self.buf.append(chr((i & 0x7f) | 0x80))
+            i >>= 7
+        self.buf.append(chr(i))
+
+    def writeBigInt(self, bi):
+        """
+        Write a zigzagged varint, as read by the 'I' literal tag.
+        """
+
+        if bi.int_lt(0):
+            bi = bi.int_xor(-1).lshift(1).int_or_(1)
+        else:
+            bi = bi.lshift(1)
+        while bi.int_ge(0x80):
+            self.buf.append(chr(bi.int_and_(0x7f).toint() | 0x80))
+            bi = bi.rshift(7)
+        self.buf.append(chr(bi.toint()))
+
+    def writeStr(self, s):
+        bs = s.encode("utf-8")
+        self.writeInt(len(bs))
+        self.buf.append(bs)
+
+
+class DumpMAST(MastIR.makePassTo(None)):
+    """
+    Serialize an expression back into MAST.
+
+    Exprs and patts are appended to their tables in post-order; every visitor
+    returns the index of the node that it wrote.
+    """
+
+    def __init__(self):
+        self.writer = MASTWriter()
+        self.exprCount = 0
+        self.pattCount = 0
+        self.writer.writeBytes(MAGIC)
+
+    def getvalue(self):
+        return self.writer.getvalue()
+
+    def nextExprIndex(self):
+        rv = self.exprCount
+        self.exprCount += 1
+        return rv
+
+    def nextPattIndex(self):
+        rv = self.pattCount
+        self.pattCount += 1
+        return rv
+
+    def writeIndices(self, indices):
+        self.writer.writeInt(len(indices))
+        for index in indices:
+            self.writer.writeInt(index)
+
+    def visitNullExpr(self):
+        self.writer.writeBytes("LN")
+        return self.nextExprIndex()
+
+    def visitCharExpr(self, c):
+        self.writer.writeBytes("LC")
+        self.writer.writeBytes(c.encode("utf-8"))
+        return self.nextExprIndex()
+
+    def visitDoubleExpr(self, d):
+        self.writer.writeBytes("LD")
+        self.writer.writeDouble(d)
+        return self.nextExprIndex()
+
+    def visitIntExpr(self, i):
+        self.writer.writeBytes("LI")
+        self.writer.writeBigInt(i)
+        return self.nextExprIndex()
+
+    def visitStrExpr(self, s):
+        self.writer.writeBytes("LS")
+        self.writer.writeStr(s)
+        return self.nextExprIndex()
+
+    def visitAssignExpr(self, name, rvalue):
+        rvalue = self.visitExpr(rvalue)
+        self.writer.writeByte("A")
+        self.writer.writeStr(name)
+        self.writer.writeInt(rvalue)
+        return self.nextExprIndex()
+
+    def visitBindingExpr(self, name):
+        self.writer.writeByte("B")
+        self.writer.writeStr(name)
+        return self.nextExprIndex()
+
+    def visitCallExpr(self, obj, verb, args, namedArgs):
+        obj = self.visitExpr(obj)
+        args = [self.visitExpr(arg) for arg in args]
+        namedArgs = [self.visitNamedArg(namedArg) for namedArg in namedArgs]
+        self.writer.writeByte("C")
+        self.writer.writeInt(obj)
+        self.writer.writeStr(verb)
+        self.writeIndices(args)
+        self.writer.writeInt(len(namedArgs))
+        for key, value in namedArgs:
+            self.writer.writeInt(key)
+            self.writer.writeInt(value)
+        return self.nextExprIndex()
+
+    def visitDefExpr(self, patt, ex, rvalue):
+        patt = self.visitPatt(patt)
+        ex = self.visitExpr(ex)
+        rvalue = self.visitExpr(rvalue)
+        self.writer.writeByte("D")
+        self.writer.writeInt(patt)
+        self.writer.writeInt(ex)
+        self.writer.writeInt(rvalue)
+        return self.nextExprIndex()
+
+    def visitEscapeOnlyExpr(self, patt, body):
+        patt = self.visitPatt(patt)
+        body = self.visitExpr(body)
+        self.writer.writeByte("e")
+        self.writer.writeInt(patt)
+        self.writer.writeInt(body)
+        return self.nextExprIndex()
+
+    def visitEscapeExpr(self, ejPatt, ejBody, catchPatt, catchBody):
+        ejPatt = self.visitPatt(ejPatt)
+        ejBody = self.visitExpr(ejBody)
+        catchPatt = self.visitPatt(catchPatt)
+        catchBody = self.visitExpr(catchBody)
+        self.writer.writeByte("E")
+        self.writer.writeInt(ejPatt)
+        self.writer.writeInt(ejBody)
+        self.writer.writeInt(catchPatt)
+        self.writer.writeInt(catchBody)
+        return self.nextExprIndex()
+
+    def visitFinallyExpr(self, body, atLast):
+        body = self.visitExpr(body)
+        atLast = self.visitExpr(atLast)
+        self.writer.writeByte("F")
+        self.writer.writeInt(body)
+        self.writer.writeInt(atLast)
+        return self.nextExprIndex()
+
+    def visitHideExpr(self, body):
+        body = self.visitExpr(body)
+        self.writer.writeByte("H")
+        self.writer.writeInt(body)
+        return self.nextExprIndex()
+
+    def visitIfExpr(self, test, cons, alt):
+        test = self.visitExpr(test)
+        cons = self.visitExpr(cons)
+        alt = self.visitExpr(alt)
+        self.writer.writeByte("I")
+        self.writer.writeInt(test)
+        self.writer.writeInt(cons)
+        self.writer.writeInt(alt)
+        return self.nextExprIndex()
+
+    def visitMetaContextExpr(self):
+        self.writer.writeByte("X")
+        return self.nextExprIndex()
+
+    def visitMetaStateExpr(self):
+        self.writer.writeByte("T")
+        return self.nextExprIndex()
+
+    def visitNounExpr(self, name):
+        self.writer.writeByte("N")
+        self.writer.writeStr(name)
+        return self.nextExprIndex()
+
+    def visitObjectExpr(self, doc, patt, auditors, methods, matchers):
+        # The loader always produces at least the as-auditor.
+        assert auditors, "DumpMAST: Object without as-auditor"
+        patt = self.visitPatt(patt)
+        auditors = [self.visitExpr(auditor) for auditor in auditors]
+        methods = [self.visitMethod(method) for method in methods]
+        matchers = [self.visitMatcher(matcher) for matcher in matchers]
+        self.writer.writeByte("O")
+        self.writer.writeStr(doc)
+        self.writer.writeInt(patt)
+        self.writer.writeInt(auditors[0])
+        self.writeIndices(auditors[1:])
+        self.writeIndices(methods)
+        self.writeIndices(matchers)
+        return self.nextExprIndex()
+
+    def visitSeqExpr(self, exprs):
+        exprs = [self.visitExpr(expr) for expr in exprs]
+        self.writer.writeByte("S")
+        self.writeIndices(exprs)
+        return self.nextExprIndex()
+
+    def visitTryExpr(self, body, catchPatt, catchBody):
+        body = self.visitExpr(body)
+        catchPatt = self.visitPatt(catchPatt)
+        catchBody = self.visitExpr(catchBody)
+        self.writer.writeByte("Y")
+        self.writer.writeInt(body)
+        self.writer.writeInt(catchPatt)
+        self.writer.writeInt(catchBody)
+        return self.nextExprIndex()
+
+    def visitIgnorePatt(self, guard):
+        guard = self.visitExpr(guard)
+        self.writer.writeBytes("PI")
+        self.writer.writeInt(guard)
+        return self.nextPattIndex()
+
+    def visitBindingPatt(self, name):
+        self.writer.writeBytes("PB")
+        self.writer.writeStr(name)
+        return self.nextPattIndex()
+
+    def visitFinalPatt(self, name, guard):
+        guard = self.visitExpr(guard)
+        self.writer.writeBytes("PF")
+        self.writer.writeStr(name)
+        self.writer.writeInt(guard)
+        return self.nextPattIndex()
+
+    def visitVarPatt(self, name, guard):
+        guard = self.visitExpr(guard)
+        self.writer.writeBytes("PV")
+        self.writer.writeStr(name)
+        self.writer.writeInt(guard)
+        return self.nextPattIndex()
+
+    def visitListPatt(self, patts):
+        patts = [self.visitPatt(patt) for patt in patts]
+        self.writer.writeBytes("PL")
+        self.writeIndices(patts)
+        return self.nextPattIndex()
+
+    def visitViaPatt(self, trans, patt):
+        trans = self.visitExpr(trans)
+        patt = self.visitPatt(patt)
+        self.writer.writeBytes("PA")
+        self.writer.writeInt(trans)
+        self.writer.writeInt(patt)
+        return self.nextPattIndex()
+
+    def visitNamedArgExpr(self, key, value):
+        return self.visitExpr(key), self.visitExpr(value)
+
+    def visitNamedPattern(self, key, patt, default):
+        return self.visitExpr(key), self.visitPatt(patt), self.visitExpr(default)
+
+    def visitMatcherExpr(self, patt, body):
+        patt = self.visitPatt(patt)
+        body = self.visitExpr(body)
+        self.writer.writeByte("R")
+        self.writer.writeInt(patt)
+        self.writer.writeInt(body)
+        return self.nextExprIndex()
+
+    def visitMethodExpr(self, doc, verb, patts, namedPatts, guard, body):
+        patts = [self.visitPatt(patt) for patt in patts]
+        namedPatts = [self.visitNamedPatt(namedPatt)
+                      for namedPatt in namedPatts]
+        guard = self.visitExpr(guard)
+        body = self.visitExpr(body)
+        self.writer.writeByte("M")
+        self.writer.writeStr(doc)
+        self.writer.writeStr(verb)
+        self.writeIndices(patts)
+        self.writer.writeInt(len(namedPatts))
+        for key, patt, default in namedPatts:
+            self.writer.writeInt(key)
+            self.writer.writeInt(patt)
+            self.writer.writeInt(default)
+        self.writer.writeInt(guard)
+        self.writer.writeInt(body)
+        return self.nextExprIndex()
+
+
+def dumpMAST(expr):
+    """
+    Serialize a MAST expression into MAST bytes, suitable for loadMASTBytes().
+    """
+
+    dumper = DumpMAST()
+    dumper.visitExpr(expr)
+    return dumper.getvalue()
@@ -8,6 +8,48 @@ def percent(part, whole):
     return "(%f%%)" % f
 
 
+class Histogram(object):
+    """
+    A histogram of durations, in power-of-two buckets of microseconds.
+
+    Bucket i counts samples of less than 2**i microseconds which didn't fit
+    in any smaller bucket; the last bucket catches everything else.
+    """
+
+    BUCKETS = 32
+
+    def __init__(self):
+        self.buckets = [0] * self.BUCKETS
+        self.count = 0
+
+    def record(self, elapsed, samples=1):
+        """
+        Record `samples` samples, each of which took `elapsed` seconds.
+        """
+
+        us = int(elapsed * 1000000)
+        bucket = 0
+        while us > 0 and bucket < self.BUCKETS - 1:
+            us >>= 1
+            bucket += 1
+        self.buckets[bucket] += samples
+        self.count += samples
+
+    def percentile(self, p):
+        """
+        An upper bound, in seconds, on the `p`th percentile sample.
+        """
+
+        if not self.count:
+            return 0.0
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen * 100 >= self.count * p:
+                return (1 << i) / 1000000.0
+        return (1 << (self.BUCKETS - 1)) / 1000000.0
+
+
 class RecorderContext(object):
 
     startTime = 0
@@ -0,0 +1,826 @@
+"""
+A bytecode compiler and stack machine, as an alternative to the AST
+evaluator.
+
+Each method, matcher, and module body is compiled to a flat list of
+instructions. Control flow which can unwind (escapes, try, finally) is
+compiled into separate blocks, which the machine runs recursively; all other
+control flow is done with jumps within a block.
+
+Instructions are pairs of ints: an opcode and a single argument, which is
+usually an index into one of the code object's pools.
+"""
+
+from rpython.rlib import rvmprof
+from rpython.rlib.jit import promote, unroll_safe, we_are_jitted
+from rpython.rlib.objectmodel import import_from_mixin
+
+from typhon.atoms import getAtom
+from typhon.errors import Ejecting, UserException, userError
+from typhon.nano.interp import (EMPTY_STORAGE, MIRANDA_ARGS, NULL_BINDING,
+                                ProfileNameIR, makeCallSite, makeLocals,
+                                retrieveGuard)
+from typhon.nano.mix import ARITH_ATOMS, fastArith
+from typhon.nano.scopes import SCOPE_FRAME, SCOPE_LOCAL
+from typhon.objects.collections.lists import unwrapList
+from typhon.objects.collections.maps import (ConstMap, EMPTY_MAP, monteMap,
+                                             unwrapMap)
+from typhon.objects.constants import NullObject, unwrapBool
+from typhon.objects.data import StrObject
+from typhon.objects.ejectors import Ejector, theThrower, throw
+from typhon.objects.exceptions import sealException
+from typhon.objects.guards import anyGuard
+from typhon.objects.root import Object
+from typhon.objects.slots import FinalSlot, VarSlot, finalBinding, varBinding
+from typhon.objects.user import UserObjectHelper
+from typhon.profile import profileTyphon
+
+RUN_2 = getAtom(u"run", 2)
+
+# Expressions. Every expression pushes exactly one value.
+LIVE = 0
+RAISE = 1
+LOCAL = 2
+FRAME = 3
+ARG = 4
+POP = 5
+CALL = 6
+CALL_NAMED = 7
+BUILD_MAP = 8
+DEF_PREP = 9
+JUMP_IF_FALSE = 10
+JUMP = 11
+ESCAPE_ONLY = 12
+ESCAPE = 13
+FINALLY = 14
+TRY = 15
+CLEAR_OBJECT = 16
+OBJECT = 17
+# Patterns. Every pattern consumes a specimen and an ejector.
+PATT_DROP = 18
+PATT_IGNORE = 19
+PATT_STORE = 20
+PATT_COERCE = 21
+STORE = 22
+PATT_FINAL_BINDING = 23
+PATT_VAR_BINDING = 24
+PATT_FINAL_SLOT = 25
+PATT_VAR_SLOT = 26
+PATT_LIST = 27
+PATT_VIA = 28
+# Method prologues and epilogues.
+NAMED_ARG = 29
+NAMED_ARG_OR = 30
+RETURN_GUARDED = 31
+# Arithmetic; the argument is a call site, which knows its op from t.n.mix.
+ARITH = 32
+
+OPS = ["LIVE", "RAISE", "LOCAL", "FRAME", "ARG", "POP", "CALL", "CALL_NAMED",
+       "BUILD_MAP", "DEF_PREP", "JUMP_IF_FALSE", "JUMP", "ESCAPE_ONLY",
+       "ESCAPE", "FINALLY", "TRY", "CLEAR_OBJECT", "OBJECT", "PATT_DROP",
+       "PATT_IGNORE", "PATT_STORE", "PATT_COERCE", "STORE",
+       "PATT_FINAL_BINDING", "PATT_VAR_BINDING", "PATT_FINAL_SLOT",
+       "PATT_VAR_SLOT", "PATT_LIST", "PATT_VIA", "NAMED_ARG", "NAMED_ARG_OR",
+       "RETURN_GUARDED", "ARITH"]
+
+
+class Code(object):
+    """
+    A block of compiled instructions, along with its pools.
+    """
+
+    _immutable_ = True
+    _immutable_fields_ = ("name", "instructions[*]", "constants[*]",
+                          "calls[*]", "exceptions[*]", "objects[*]",
+                          "blocks[*]")
+
+    def __init__(self, name, instructions, constants, calls, exceptions,
+                 objects, blocks):
+        self.name = name
+        self.instructions = instructions
+        self.constants = constants
+        self.calls = calls
+        self.exceptions = exceptions
+        self.objects = objects
+        self.blocks = blocks
+
+    def disassemble(self):
+        lines = []
+        for pc in range(0, len(self.instructions), 2):
+            lines.append("%d %s %d" % (pc, OPS[self.instructions[pc]],
+                                       self.instructions[pc + 1]))
+        return "\n".join(lines)
+
+
+class ObjectInfo(object):
+    """
+    Everything needed to build an object at runtime, except for the values
+    of its auditors.
+    """
+
+    _immutable_ = True
+    _immutable_fields_ = "auditorCount", "script", "layout"
+
+    def __init__(self, doc, patt, guards, auditorCount, script, layout,
+                 clipboard):
+        self.doc = doc
+        self.patt = patt
+        self.guards = guards
+        self.auditorCount = auditorCount
+        self.script = script
+        self.layout = layout
+        self.clipboard = clipboard
+
+
+class CompiledMethod(object):
+
+    _immutable_ = True
+
+    def __init__(self, source, code):
+        self.source = source
+        self.doc = source.doc
+        self.atom = source.atom
+        self.arity = len(source.patts)
+        self.localSize = source.localSize
+        self.code = code
+
+
+class CompiledMatcher(object):
+
+    _immutable_ = True
+
+    def __init__(self, source, code):
+        self.source = source
+        self.localSize = source.localSize
+        self.code = code
+
+
+class CompiledScript(object):
+
+    _immutable_ = True
+    _immutable_fields_ = "stamps[*]", "methods[*]", "matchers[*]"
+
+    def __init__(self, stamps, methods, matchers, methodTable):
+        self.stamps = stamps
+        self.methods = methods
+        self.matchers = matchers
+        self.methodTable = methodTable
+
+
+def isBindingPatt(patt):
+    return (isinstance(patt, ProfileNameIR.FinalBindingPatt) or
+            isinstance(patt, ProfileNameIR.VarBindingPatt) or
+            isinstance(patt, ProfileNameIR.FinalSlotPatt) or
+            isinstance(patt, ProfileNameIR.VarSlotPatt))
+
+
+class Compiler(ProfileNameIR.makePassTo(None)):
+    """
+    Compile a single block of code.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.instructions = []
+        self.constants = []
+        self.calls = []
+        self.exceptions = []
+        self.objects = []
+        self.blocks = []
+
+    def makeCode(self):
+        return Code(self.name, self.instructions[:], self.constants[:],
+                    self.calls[:], self.exceptions[:], self.objects[:],
+                    self.blocks[:])
+
+    def emit(self, op, arg=0):
+        """
+        Emit an instruction and return its address.
+        """
+
+        pc = len(self.instructions)
+        self.instructions.append(op)
+        self.instructions.append(arg)
+        return pc
+
+    def patch(self, pc):
+        """
+        Point the instruction at pc to the next instruction to be emitted.
+        """
+
+        self.instructions[pc + 1] = len(self.instructions)
+
+    def constant(self, obj):
+        for i, c in enumerate(self.constants):
+            if c is obj:
+                return i
+        self.constants.append(obj)
+        return len(self.constants) - 1
+
+    def callSite(self, atom):
+        self.calls.append(CallSite(atom))
+        return len(self.calls) - 1
+
+    def emitLive(self, obj):
+        self.emit(LIVE, self.constant(obj))
+
+    def block(self, patt, body):
+        """
+        Compile a sub-block, which optionally binds a pattern before running
+        its body, and return its index.
+        """
+
+        compiler = Compiler(self.name)
+        if patt is not None:
+            compiler.visitPatt(patt)
+        compiler.visitExpr(body)
+        self.blocks.append(compiler.makeCode())
+        return len(self.blocks) - 1
+
+    def emitGuard(self, guard):
+        if isinstance(guard, self.src.NullExpr):
+            self.emitLive(anyGuard)
+        else:
+            self.visitExpr(guard)
+
+    def visitLiveExpr(self, obj):
+        self.emitLive(obj)
+
+    def visitExceptionExpr(self, exception):
+        self.exceptions.append(exception)
+        self.emit(RAISE, len(self.exceptions) - 1)
+
+    def visitNullExpr(self):
+        self.emitLive(NullObject)
+
+    def visitLocalExpr(self, name, idx):
+        self.emit(LOCAL, idx)
+
+    def visitFrameExpr(self, name, idx):
+        self.emit(FRAME, idx)
+
+    def visitCallExpr(self, obj, atom, args, namedArgs, cache):
+        # The evaluator's call site caches don't fit our objects, so each
+        # call instruction gets a cache of its own.
+        self.visitExpr(obj)
+        for arg in args:
+            self.visitExpr(arg)
+        if namedArgs:
+            for namedArg in namedArgs:
+                self.visitNamedArg(namedArg)
+            self.emit(BUILD_MAP, len(namedArgs))
+            self.emit(CALL_NAMED, self.callSite(atom))
+        else:
+            self.emit(CALL, self.callSite(atom))
+
+    def visitArithExpr(self, op, receiver, args, cache):
+        self.visitExpr(receiver)
+        for arg in args:
+            self.visitExpr(arg)
+        self.calls.append(ArithSite(op))
+        self.emit(ARITH, len(self.calls) - 1)
+
+    def visitNamedArgExpr(self, key, value):
+        self.visitExpr(key)
+        self.visitExpr(value)
+
+    def visitDefExpr(self, patt, ex, rvalue):
+        self.visitExpr(ex)
+        self.visitExpr(rvalue)
+        self.emit(DEF_PREP)
+        self.visitPatt(patt)
+
+    def visitEscapeOnlyExpr(self, patt, body):
+        self.emit(ESCAPE_ONLY, self.block(patt, body))
+
+    def visitEscapeExpr(self, ejPatt, ejBody, catchPatt, catchBody):
+        index = self.block(ejPatt, ejBody)
+        self.block(catchPatt, catchBody)
+        self.emit(ESCAPE, index)
+
+    def visitFinallyExpr(self, body, atLast):
+        index = self.block(None, body)
+        self.block(None, atLast)
+        self.emit(FINALLY, index)
+
+    def visitTryExpr(self, body, catchPatt, catchBody):
+        index = self.block(None, body)
+        self.block(catchPatt, catchBody)
+        self.emit(TRY, index)
+
+    def visitIfExpr(self, test, cons, alt):
+        self.visitExpr(test)
+        jumpToAlt = self.emit(JUMP_IF_FALSE)
+        self.visitExpr(cons)
+        jumpToEnd = self.emit(JUMP)
+        self.patch(jumpToAlt)
+        self.visitExpr(alt)
+        self.patch(jumpToEnd)
+
+    def visitSeqExpr(self, exprs):
+        if not exprs:
+            self.emitLive(NullObject)
+            return
+        for i, expr in enumerate(exprs):
+            if i:
+                self.emit(POP)
+            self.visitExpr(expr)
+
+    def visitClearObjectExpr(self, doc, patt, script, layout):
+        if isBindingPatt(patt):
+            self.emitGuard(patt.guard)
+        else:
+            self.emitLive(anyGuard)
+        info = ObjectInfo(doc, patt, None, 0, compileScript(script), layout,
+                          None)
+        self.objects.append(info)
+        self.emit(CLEAR_OBJECT, len(self.objects) - 1)
+
+    def visitObjectExpr(self, doc, patt, guards, auditors, script, mast,
+                        layout, clipboard):
+        assert auditors, "hyacinth"
+        for auditor in auditors:
+            self.visitExpr(auditor)
+        info = ObjectInfo(doc, patt, guards, len(auditors),
+                          compileScript(script), layout, clipboard)
+        self.objects.append(info)
+        self.emit(OBJECT, len(self.objects) - 1)
+
+    def visitIgnorePatt(self, guard):
+        if isinstance(guard, self.src.NullExpr):
+            self.emit(PATT_DROP)
+        else:
+            self.visitExpr(guard)
+            self.emit(PATT_IGNORE)
+
+    def visitNounPatt(self, name, guard, idx):
+        if isinstance(guard, self.src.NullExpr):
+            self.emit(PATT_STORE, idx)
+        else:
+            self.visitExpr(guard)
+            self.emit(PATT_COERCE)
+            self.emit(STORE, idx)
+
+    def visitBindingPatt(self, name, idx):
+        self.emit(PATT_STORE, idx)
+
+    def visitFinalBindingPatt(self, name, guard, idx):
+        self.emitGuard(guard)
+        self.emit(PATT_FINAL_BINDING, idx)
+
+    def visitVarBindingPatt(self, name, guard, idx):
+        self.emitGuard(guard)
+        self.emit(PATT_VAR_BINDING, idx)
+
+    def visitFinalSlotPatt(self, name, guard, idx):
+        self.emitGuard(guard)
+        self.emit(PATT_FINAL_SLOT, idx)
+
+    def visitVarSlotPatt(self, name, guard, idx):
+        self.emitGuard(guard)
+        self.emit(PATT_VAR_SLOT, idx)
+
+    def visitListPatt(self, patts):
+        self.emit(PATT_LIST, len(patts))
+        for patt in patts:
+            self.visitPatt(patt)
+
+    def visitViaPatt(self, trans, patt):
+        self.visitExpr(trans)
+        self.emit(PATT_VIA)
+        self.visitPatt(patt)
+
+
+def compileMethod(method):
+    compiler = Compiler(method.profileName)
+    for i, patt in enumerate(method.patts):
+        compiler.emit(ARG, i)
+        compiler.emitLive(theThrower)
+        compiler.visitPatt(patt)
+    for np in method.namedPatts:
+        compiler.visitExpr(np.key)
+        if isinstance(np.default, ProfileNameIR.NullExpr):
+            compiler.emit(NAMED_ARG)
+        else:
+            skipDefault = compiler.emit(NAMED_ARG_OR)
+            compiler.visitExpr(np.default)
+            compiler.patch(skipDefault)
+        compiler.emitLive(theThrower)
+        compiler.visitPatt(np.patt)
+    compiler.visitExpr(method.guard)
+    compiler.visitExpr(method.body)
+    compiler.emit(RETURN_GUARDED)
+    return CompiledMethod(method, compiler.makeCode())
+
+
+def compileMatcher(matcher):
+    # The message and ejector are already on the stack.
+    compiler = Compiler(matcher.profileName)
+    compiler.visitPatt(matcher.patt)
+    compiler.visitExpr(matcher.body)
+    return CompiledMatcher(matcher, compiler.makeCode())
+
+
+def compileScript(script):
+    methods = [compileMethod(method) for method in script.methods]
+    matchers = [compileMatcher(matcher) for matcher in script.matchers]
+    methodTable = {}
+    for method in methods:
+        if method.atom not in methodTable:
+            methodTable[method.atom] = method
+    return CompiledScript(script.stamps, methods, matchers, methodTable)
+
+
+def compileModule(expr):
+    compiler = Compiler("mt:<module>")
+    compiler.visitExpr(expr)
+    return compiler.makeCode()
+
+
+class Machine(object):
+    """
+    The state of a single method, matcher, or module invocation.
+    """
+
+    _immutable_fields_ = "locals", "frame", "args", "namedArgs"
+
+    def __init__(self, frame, localSize, args, namedArgs):
+        self.locals = makeLocals(localSize)
+        self.frame = frame
+        self.args = args
+        self.namedArgs = namedArgs
+
+    @unroll_safe
+    def popN(self, stack, count):
+        rv = [None] * count
+        i = count - 1
+        while i >= 0:
+            rv[i] = stack.pop()
+            i -= 1
+        return rv
+
+    def lookupBinding(self, scope, idx):
+        if scope is SCOPE_LOCAL:
+            return self.locals[idx]
+        elif scope is SCOPE_FRAME:
+            return self.frame[idx]
+        else:
+            assert False, "teacher"
+
+    @unroll_safe
+    def buildFrame(self, frameTable):
+        if not frameTable.frameInfo:
+            return EMPTY_STORAGE
+        return [self.lookupBinding(scope, index) for (_, scope, index, _)
+                in frameTable.frameInfo]
+
+    def bindSelf(self, patt, val, guard):
+        """
+        Set up the self-binding of a freshly-built object, returning whatever
+        should be placed into its frame.
+        """
+
+        if isinstance(patt, ProfileNameIR.IgnorePatt):
+            return NULL_BINDING
+        elif isinstance(patt, ProfileNameIR.FinalBindingPatt):
+            b = finalBinding(val, guard)
+        elif isinstance(patt, ProfileNameIR.VarBindingPatt):
+            b = varBinding(val, guard)
+        elif isinstance(patt, ProfileNameIR.FinalSlotPatt):
+            b = FinalSlot(val, guard)
+        elif isinstance(patt, ProfileNameIR.VarSlotPatt):
+            b = VarSlot(val, guard)
+        elif isinstance(patt, ProfileNameIR.NounPatt):
+            b = val
+        else:
+            raise userError(u"Unsupported object pattern")
+        self.locals[patt.index] = b
+        return b
+
+    def buildClearObject(self, info, selfGuard):
+        patt = info.patt
+        if isinstance(patt, ProfileNameIR.IgnorePatt):
+            objName = u"_"
+        else:
+            objName = patt.name
+        frameTable = info.layout.frameTable
+        frame = self.buildFrame(frameTable)
+        val = BytecodeObject(info.doc, objName, info.script, frame,
+                             info.layout.fqn)
+        b = self.bindSelf(patt, val, selfGuard)
+        position = frameTable.positionOf(objName)
+        if position != -1:
+            frame[position] = b
+        return val
+
+    @unroll_safe
+    def buildObject(self, info, auds):
+        patt = info.patt
+        if isinstance(patt, ProfileNameIR.IgnorePatt):
+            objName = u"_"
+        else:
+            objName = patt.name
+        guardAuditor = auds[0]
+        if guardAuditor is NullObject:
+            guardAuditor = anyGuard
+            auds = auds[1:]
+        frameTable = info.layout.frameTable
+        frame = self.buildFrame(frameTable)
+        # Grab any remaining dynamic guards, without disturbing the original
+        # dict.
+        guards = info.guards.copy()
+        for name, index in frameTable.dynamicGuards.items():
+            if name == objName:
+                guards[name] = guardAuditor
+            else:
+                _, scope, idx, severity = frameTable.frameInfo[index]
+                guards[name] = retrieveGuard(severity,
+                        self.lookupBinding(scope, idx))
+
+        o = BytecodeObject(info.doc, objName, info.script, frame,
+                           info.layout.fqn)
+        if auds and (len(auds) != 1 or auds[0] is not NullObject):
+            o.report = info.clipboard.audit(auds, guards)
+        val = guardAuditor.call(u"coerce", [o, theThrower])
+        b = self.bindSelf(patt, val, guardAuditor)
+        position = frameTable.positionOf(objName)
+        if position != -1:
+            frame[position] = b
+        return val
+
+    # Compiled code only ever jumps forward, since Monte's loops are calls
+    # to _loop(); there's no loop header here for the JIT to find. Instead,
+    # the JIT traces _loop() and unrolls this dispatch loop into its traces,
+    # which it can do because the code and pc are constant.
+    @unroll_safe
+    def run(self, code, stack):
+        code = promote(code)
+        pc = 0
+        while pc < len(code.instructions):
+            op = code.instructions[pc]
+            arg = code.instructions[pc + 1]
+            pc += 2
+
+            if op == LIVE:
+                stack.append(code.constants[arg])
+            elif op == RAISE:
+                raise code.exceptions[arg]
+            elif op == LOCAL:
+                stack.append(self.locals[arg])
+            elif op == FRAME:
+                stack.append(self.frame[arg])
+            elif op == ARG:
+                stack.append(self.args[arg])
+            elif op == POP:
+                stack.pop()
+            elif op == CALL:
+                site = code.calls[arg]
+                args = self.popN(stack, site.atom.arity)
+                rcvr = stack.pop()
+                stack.append(site.call(rcvr, args, EMPTY_MAP))
+            elif op == CALL_NAMED:
+                site = code.calls[arg]
+                namedArgs = stack.pop()
+                args = self.popN(stack, site.atom.arity)
+                rcvr = stack.pop()
+                stack.append(site.call(rcvr, args, namedArgs))
+            elif op == BUILD_MAP:
+                pairs = self.popN(stack, arg * 2)
+                d = monteMap()
+                for i in range(arg):
+                    d[pairs[i * 2]] = pairs[i * 2 + 1]
+                stack.append(ConstMap(d))
+            elif op == DEF_PREP:
+                # [ej, val] -> [val, val, ej]
+                val = stack.pop()
+                ej = stack.pop()
+                stack.append(val)
+                stack.append(val)
+                stack.append(ej)
+            elif op == JUMP_IF_FALSE:
+                if not unwrapBool(stack.pop()):
+                    pc = arg
+            elif op == JUMP:
+                pc = arg
+            elif op == ESCAPE_ONLY:
+                ej = Ejector()
+                try:
+                    val = self.run(code.blocks[arg], [ej, theThrower])
+                    ej.disable()
+                except Ejecting as e:
+                    if e.ejector is not ej:
+                        raise
+                    ej.disable()
+                    val = e.value
+                stack.append(val)
+            elif op == ESCAPE:
+                ej = Ejector()
+                try:
+                    val = self.run(code.blocks[arg], [ej, theThrower])
+                    ej.disable()
+                except Ejecting as e:
+                    if e.ejector is not ej:
+                        raise
+                    ej.disable()
+                    val = self.run(code.blocks[arg + 1],
+                                   [e.value, theThrower])
+                stack.append(val)
+            elif op == FINALLY:
+                try:
+                    val = self.run(code.blocks[arg], [])
+                finally:
+                    self.run(code.blocks[arg + 1], [])
+                stack.append(val)
+            elif op == TRY:
+                try:
+                    val = self.run(code.blocks[arg], [])
+                except UserException as ue:
+                    val = self.run(code.blocks[arg + 1],
+                                   [sealException(ue), theThrower])
+                stack.append(val)
+            elif op == CLEAR_OBJECT:
+                selfGuard = stack.pop()
+                stack.append(self.buildClearObject(code.objects[arg],
+                                                   selfGuard))
+            elif op == OBJECT:
+                info = code.objects[arg]
+                auds = self.popN(stack, info.auditorCount)
+                stack.append(self.buildObject(info, auds))
+            elif op == PATT_DROP:
+                stack.pop()
+                stack.pop()
+            elif op == PATT_IGNORE:
+                guard = stack.pop()
+                ej = stack.pop()
+                specimen = stack.pop()
+                guard.call(u"coerce", [specimen, ej])
+            elif op == PATT_STORE:
+                stack.pop()
+                self.locals[arg] = stack.pop()
+            elif op == PATT_COERCE:
+                guard = stack.pop()
+                ej = stack.pop()
+                specimen = stack.pop()
+                stack.append(guard.call(u"coerce", [specimen, ej]))
+            elif op == STORE:
+                self.locals[arg] = stack.pop()
+            elif (op == PATT_FINAL_BINDING or op == PATT_VAR_BINDING or
+                  op == PATT_FINAL_SLOT or op == PATT_VAR_SLOT):
+                guard = stack.pop()
+                ej = stack.pop()
+                specimen = stack.pop()
+                val = guard.call(u"coerce", [specimen, ej])
+                if op == PATT_FINAL_BINDING:
+                    self.locals[arg] = finalBinding(val, guard)
+                elif op == PATT_VAR_BINDING:
+                    self.locals[arg] = varBinding(val, guard)
+                elif op == PATT_FINAL_SLOT:
+                    self.locals[arg] = FinalSlot(val, guard)
+                else:
+                    self.locals[arg] = VarSlot(val, guard)
+            elif op == PATT_LIST:
+                ej = stack.pop()
+                specimen = stack.pop()
+                items = unwrapList(specimen, ej=ej)
+                if arg != len(items):
+                    throw(ej, StrObject(
+                        u"Failed list pattern (needed %d, got %d)" %
+                        (arg, len(items))))
+                # Push in reverse, so that the first pattern finds its
+                # specimen on top.
+                i = arg - 1
+                while i >= 0:
+                    stack.append(items[i])
+                    stack.append(ej)
+                    i -= 1
+            elif op == PATT_VIA:
+                trans = stack.pop()
+                ej = stack.pop()
+                specimen = stack.pop()
+                stack.append(trans.callAtom(RUN_2, [specimen, ej],
+                                            MIRANDA_ARGS))
+                stack.append(ej)
+            elif op == NAMED_ARG:
+                key = stack.pop()
+                if key not in self.namedArgs:
+                    raise userError(u"Named arg %s missing in call" % (
+                        key.toString(),))
+                stack.append(self.namedArgs[key])
+            elif op == NAMED_ARG_OR:
+                key = stack.pop()
+                if key in self.namedArgs:
+                    stack.append(self.namedArgs[key])
+                    pc = arg
+            elif op == ARITH:
+                site = code.calls[arg]
+                assert isinstance(site, ArithSite)
+                args = self.popN(stack, site.atom.arity)
+                rcvr = stack.pop()
+                val = fastArith(site.op, rcvr, args)
+                if val is None:
+                    val = site.call(rcvr, args, EMPTY_MAP)
+                stack.append(val)
+            elif op == RETURN_GUARDED:
+                val = stack.pop()
+                guard = stack.pop()
+                if guard is not NullObject:
+                    val = guard.call(u"coerce", [val, theThrower])
+                stack.append(val)
+            else:
+                assert False, "marmalade"
+        return stack.pop()
+
+
+class BytecodeObject(Object):
+    """
+    An object whose script is executed by the bytecode machine.
+    """
+
+    import_from_mixin(UserObjectHelper)
+
+    _immutable_fields_ = "doc", "displayName", "script", "report"
+
+    def __init__(self, doc, name, script, frame, fqn):
+        self.fqn = fqn
+        self.doc = doc
+        self.displayName = name
+        self.script = script
+        self.frame = frame
+
+        self.report = None
+
+    def docString(self):
+        return self.doc
+
+    def getDisplayName(self):
+        return self.displayName
+
+    # Justified by the immutability of stamps on the script. ~ C.
+    @unroll_safe
+    @profileTyphon("_auditedBy.run/2")
+    def auditedBy(self, prospect):
+        prospect = promote(prospect)
+        if prospect in self.script.stamps:
+            return True
+        return Object.auditedBy(self, prospect)
+
+    @unroll_safe
+    def getMethod(self, atom):
+        if we_are_jitted():
+            for method in promote(self.script).methods:
+                if method.atom is atom:
+                    return promote(method)
+        else:
+            return self.script.methodTable.get(atom, None)
+
+    def getMatchers(self):
+        return promote(self.script).matchers
+
+    def respondingAtoms(self):
+        d = {}
+        for method in self.script.methods:
+            d[method.atom] = method.doc
+        return d
+
+    @rvmprof.vmprof_execute_code("method",
+            lambda self, method, args, namedArgs: method.source,
+            result_class=Object)
+    def runMethod(self, method, args, namedArgs):
+        if len(args) != method.arity:
+            raise userError(u"Method '%s.%s' expected %d args, got %d" % (
+                self.getDisplayName(), method.atom.verb, method.arity,
+                len(args)))
+        machine = Machine(self.frame, method.localSize, args,
+                          unwrapMap(namedArgs))
+        return machine.run(method.code, [])
+
+    @rvmprof.vmprof_execute_code("matcher",
+            lambda self, matcher, message, ej: matcher.source,
+            result_class=Object)
+    def runMatcher(self, matcher, message, ej):
+        machine = Machine(self.frame, matcher.localSize, None, None)
+        return machine.run(matcher.code, [message, ej])
+
+CallSite = makeCallSite(BytecodeObject)
+
+
+class ArithSite(CallSite):
+    """
+    The call site of an ARITH instruction, for when its receiver isn't
+    simple enough for fastArith().
+    """
+
+    def __init__(self, op):
+        CallSite.__init__(self, ARITH_ATOMS[op])
+        self.op = op
+
+
+def runModule(expr, localSize):
+    """
+    Compile and run a module body, returning its result and its top-level
+    locals.
+    """
+
+    machine = Machine([], localSize, None, None)
+    result = machine.run(compileModule(expr), [])
+    return result, machine.locals
@@ -0,0 +1,617 @@
+"""
+A compact binary form for lowered modules.
+
+Everything up to mixing depends only on the MAST and on the names (but not
+the values) of the environment, so the result of lowering can be saved and
+reused across processes. Expressions are written in prefix order.
+
+Audited objects need their original MAST, so that auditors may still examine
+it. The module's MAST is saved once, alongside the lowered module, and each
+audited object refers to its place within it. It's only decoded if an
+auditor actually looks.
+"""
+
+from collections import OrderedDict
+
+from typhon.atoms import getAtom
+from typhon.errors import userError
+from typhon.load.nano import InvalidMAST, MASTStream, MASTWriter
+from typhon.load.nano import loadMASTBytes
+from typhon.nano.mast import MastIR
+from typhon.nano.scopes import (SCOPE_FRAME, SCOPE_LOCAL, SCOPE_OUTER,
+                                SEV_BINDING, SEV_NOUN, SEV_SLOT, ScopeFrame)
+from typhon.nano.structure import SplitAuditorsIR
+from typhon.objects.auditors import deepFrozenStamp
+from typhon.objects.user import AuditClipboard
+
+
+class InvalidCache(Exception):
+    """
+    A lowered module could not be saved or restored.
+    """
+
+
+# Bump this whenever the lowered IR or this format changes shape.
+MAGIC = "Mont\xe0IR\x00\x02"
+
+scopes = [SCOPE_OUTER, SCOPE_FRAME, SCOPE_LOCAL]
+severities = [SEV_NOUN, SEV_SLOT, SEV_BINDING]
+# The only stamps which are handed out statically.
+knownStamps = [deepFrozenStamp]
+
+
+class LoweredModule(object):
+    """
+    A module which has been run through the pipeline up to, but not
+    including, mixing.
+    """
+
+    def __init__(self, ast, outerNames, topLocalNames, localSize):
+        self.ast = ast
+        self.outerNames = outerNames
+        self.topLocalNames = topLocalNames
+        self.localSize = localSize
+
+
+class CollectObjects(MastIR.selfPass()):
+    """
+    Gather the object expressions in some MAST, in prefix order.
+
+    Each is rebuilt just as t.n.mast.SaveScripts builds the MAST which it
+    saves for auditors, so that they share all of their fields.
+    """
+
+    def __init__(self):
+        self.objects = []
+
+    def visitObjectExpr(self, doc, patt, auditors, methods, matchers):
+        self.objects.append(MastIR.ObjectExpr(doc, patt, auditors, methods,
+                                              matchers))
+        return self.super.visitObjectExpr(self, doc, patt, auditors, methods,
+                                          matchers)
+
+def collectObjects(mast):
+    collector = CollectObjects()
+    collector.visitExpr(mast)
+    return collector.objects
+
+
+class ModuleMAST(object):
+    """
+    The MAST of a cached module, decoded on first use.
+    """
+
+    objects = None
+
+    def __init__(self, source, count):
+        self.source = source
+        self.count = count
+
+    def objectAt(self, position):
+        if self.objects is None:
+            try:
+                mast = loadMASTBytes(self.source)
+            except InvalidMAST:
+                raise userError(u"Compiled cache entry has corrupt MAST")
+            objects = collectObjects(mast)
+            if len(objects) != self.count:
+                raise userError(u"Compiled cache entry has corrupt MAST")
+            self.objects = objects
+        return self.objects[position]
+
+
+class CachedClipboard(AuditClipboard):
+    """
+    An audit clipboard for an object from a cached module. Its MAST is only
+    fetched if an auditor wants to look.
+    """
+
+    def __init__(self, fqn, moduleMAST, position):
+        AuditClipboard.__init__(self, fqn, None)
+        self.moduleMAST = moduleMAST
+        self.position = position
+
+    def getMAST(self):
+        if self.mast is None:
+            self.mast = self.moduleMAST.objectAt(self.position)
+        return self.mast
+
+
+class DumpIR(SplitAuditorsIR.makePassTo(None)):
+
+    def __init__(self, mast):
+        self.writer = MASTWriter()
+        self.audited = 0
+        # Where each object in the module's MAST is, by pattern; the patterns
+        # of objects are shared with the MAST saved for their audits.
+        self.objects = collectObjects(mast)
+        self.positions = {}
+        for position, obj in enumerate(self.objects):
+            if obj.patt not in self.positions:
+                self.positions[obj.patt] = []
+            self.positions[obj.patt].append(position)
+
+    def positionOf(self, mast):
+        if mast.patt in self.positions:
+            for position in self.positions[mast.patt]:
+                obj = self.objects[position]
+                if (obj.doc == mast.doc and obj.auditors is mast.auditors and
+                    obj.methods is mast.methods and
+                    obj.matchers is mast.matchers):
+                    return position
+        raise InvalidCache("Audited object isn't in the module's MAST")
+
+    def writeLayout(self, layout):
+        w = self.writer
+        w.writeStr(layout.fqn)
+        w.writeInt(len(layout.frameNames))
+        for name, (_, scope, idx, severity) in layout.frameNames.items():
+            w.writeStr(name)
+            w.writeInt(scope.asInt)
+            w.writeInt(idx)
+            w.writeInt(severity.asInt)
+        w.writeInt(len(layout.outerNames))
+        for name, (idx, severity) in layout.outerNames.items():
+            w.writeStr(name)
+            w.writeInt(idx)
+            w.writeInt(severity.asInt)
+
+    def writeAtom(self, atom):
+        self.writer.writeStr(atom.verb)
+        self.writer.writeInt(atom.arity)
+
+    def writeExprs(self, exprs):
+        self.writer.writeInt(len(exprs))
+        for expr in exprs:
+            self.visitExpr(expr)
+
+    def writePatts(self, patts):
+        self.writer.writeInt(len(patts))
+        for patt in patts:
+            self.visitPatt(patt)
+
+    def visitNullExpr(self):
+        self.writer.writeByte("n")
+
+    def visitCharExpr(self, c):
+        self.writer.writeByte("c")
+        self.writer.writeStr(c)
+
+    def visitDoubleExpr(self, d):
+        self.writer.writeByte("d")
+        self.writer.writeDouble(d)
+
+    def visitIntExpr(self, i):
+        self.writer.writeByte("i")
+        self.writer.writeBigInt(i)
+
+    def visitStrExpr(self, s):
+        self.writer.writeByte("s")
+        self.writer.writeStr(s)
+
+    def visitCallExpr(self, obj, atom, args, namedArgs):
+        self.writer.writeByte("C")
+        self.visitExpr(obj)
+        self.writeAtom(atom)
+        self.writeExprs(args)
+        self.writer.writeInt(len(namedArgs))
+        for namedArg in namedArgs:
+            self.visitNamedArg(namedArg)
+
+    def visitDefExpr(self, patt, ex, rvalue):
+        self.writer.writeByte("D")
+        self.visitPatt(patt)
+        self.visitExpr(ex)
+        self.visitExpr(rvalue)
+
+    def visitEscapeOnlyExpr(self, patt, body):
+        self.writer.writeByte("e")
+        self.visitPatt(patt)
+        self.visitExpr(body)
+
+    def visitEscapeExpr(self, ejPatt, ejBody, catchPatt, catchBody):
+        self.writer.writeByte("E")
+        self.visitPatt(ejPatt)
+        self.visitExpr(ejBody)
+        self.visitPatt(catchPatt)
+        self.visitExpr(catchBody)
+
+    def visitFinallyExpr(self, body, atLast):
+        self.writer.writeByte("F")
+        self.visitExpr(body)
+        self.visitExpr(atLast)
+
+    def visitIfExpr(self, test, cons, alt):
+        self.writer.writeByte("I")
+        self.visitExpr(test)
+        self.visitExpr(cons)
+        self.visitExpr(alt)
+
+    def visitLocalExpr(self, name, index):
+        self.writer.writeByte("L")
+        self.writer.writeStr(name)
+        self.writer.writeInt(index)
+
+    def visitFrameExpr(self, name, index):
+        self.writer.writeByte("R")
+        self.writer.writeStr(name)
+        self.writer.writeInt(index)
+
+    def visitOuterExpr(self, name, index):
+        self.writer.writeByte("U")
+        self.writer.writeStr(name)
+        self.writer.writeInt(index)
+
+    def visitClearObjectExpr(self, doc, patt, script, layout):
+        self.writer.writeByte("o")
+        self.writer.writeStr(doc)
+        self.visitPatt(patt)
+        self.visitScript(script)
+        self.writeLayout(layout)
+
+    def visitObjectExpr(self, doc, patt, auditors, script, mast, layout,
+                        clipboard):
+        self.audited += 1
+        self.writer.writeByte("O")
+        self.writer.writeStr(doc)
+        self.visitPatt(patt)
+        self.writeExprs(auditors)
+        self.visitScript(script)
+        self.writer.writeInt(self.positionOf(mast))
+        self.writeLayout(layout)
+
+    def visitSeqExpr(self, exprs):
+        self.writer.writeByte("S")
+        self.writeExprs(exprs)
+
+    def visitTryExpr(self, body, catchPatt, catchBody):
+        self.writer.writeByte("Y")
+        self.visitExpr(body)
+        self.visitPatt(catchPatt)
+        self.visitExpr(catchBody)
+
+    def visitIgnorePatt(self, guard):
+        self.writer.writeByte("_")
+        self.visitExpr(guard)
+
+    def visitBindingPatt(self, name, index):
+        self.writer.writeByte("b")
+        self.writer.writeStr(name)
+        self.writer.writeInt(index)
+
+    def writeGuardedPatt(self, tag, name, guard, index):
+        self.writer.writeByte(tag)
+        self.writer.writeStr(name)
+        self.visitExpr(guard)
+        self.writer.writeInt(index)
+
+    def visitNounPatt(self, name, guard, index):
+        self.writeGuardedPatt("N", name, guard, index)
+
+    def visitFinalSlotPatt(self, name, guard, index):
+        self.writeGuardedPatt("f", name, guard, index)
+
+    def visitVarSlotPatt(self, name, guard, index):
+        self.writeGuardedPatt("v", name, guard, index)
+
+    def visitFinalBindingPatt(self, name, guard, index):
+        self.writeGuardedPatt("F", name, guard, index)
+
+    def visitVarBindingPatt(self, name, guard, index):
+        self.writeGuardedPatt("V", name, guard, index)
+
+    def visitListPatt(self, patts):
+        self.writer.writeByte("l")
+        self.writePatts(patts)
+
+    def visitViaPatt(self, trans, patt):
+        self.writer.writeByte("A")
+        self.visitExpr(trans)
+        self.visitPatt(patt)
+
+    def visitNamedArgExpr(self, key, value):
+        self.visitExpr(key)
+        self.visitExpr(value)
+
+    def visitNamedPattern(self, key, patt, default):
+        self.visitExpr(key)
+        self.visitPatt(patt)
+        self.visitExpr(default)
+
+    def visitMatcherExpr(self, patt, body, localSize):
+        self.visitPatt(patt)
+        self.visitExpr(body)
+        self.writer.writeInt(localSize)
+
+    def visitMethodExpr(self, doc, atom, patts, namedPatts, guard, body,
+                        localSize):
+        self.writer.writeStr(doc)
+        self.writeAtom(atom)
+        self.writePatts(patts)
+        self.writer.writeInt(len(namedPatts))
+        for namedPatt in namedPatts:
+            self.visitNamedPatt(namedPatt)
+        self.visitExpr(guard)
+        self.visitExpr(body)
+        self.writer.writeInt(localSize)
+
+    def visitScriptExpr(self, stamps, methods, matchers):
+        self.writer.writeInt(len(stamps))
+        for stamp in stamps:
+            if stamp not in knownStamps:
+                raise InvalidCache("Can't save unknown stamp")
+            self.writer.writeInt(knownStamps.index(stamp))
+        self.writer.writeInt(len(methods))
+        for method in methods:
+            self.visitMethod(method)
+        self.writer.writeInt(len(matchers))
+        for matcher in matchers:
+            self.visitMatcher(matcher)
+
+
+def dumpLowered(lowered, source, mast):
+    """
+    Serialize a lowered module.
+
+    The module was lowered from the MAST `mast`, which was decoded from the
+    bytes `source`.
+
+    Raises InvalidCache if the module can't be saved.
+    """
+
+    dumper = DumpIR(mast)
+    dumper.visitExpr(lowered.ast)
+    w = MASTWriter()
+    w.writeBytes(MAGIC)
+    w.writeInt(lowered.localSize)
+    w.writeInt(len(lowered.topLocalNames))
+    for name, severity in lowered.topLocalNames:
+        w.writeStr(name)
+        w.writeInt(severity.asInt)
+    w.writeInt(len(lowered.outerNames))
+    for name, (idx, severity) in lowered.outerNames.items():
+        w.writeStr(name)
+        w.writeInt(idx)
+        w.writeInt(severity.asInt)
+    # The MAST is only needed for audits.
+    if dumper.audited:
+        w.writeInt(len(source))
+        w.writeBytes(source)
+        w.writeInt(len(dumper.objects))
+    else:
+        w.writeInt(0)
+    w.writeBytes(dumper.writer.getvalue())
+    return w.getvalue()
+
+
+class LoadIR(object):
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.moduleMAST = None
+
+    def nextModuleMAST(self):
+        size = self.stream.nextInt()
+        if size:
+            source = self.stream.nextBytes(size)
+            self.moduleMAST = ModuleMAST(source, self.stream.nextInt())
+
+    def nextEnum(self, enum):
+        i = self.stream.nextInt()
+        if not 0 <= i < len(enum):
+            raise InvalidCache("Enum value %d is out of bounds" % i)
+        return enum[i]
+
+    def nextBigInt(self):
+        return self.stream.nextBigInt()
+
+    def nextAtom(self):
+        verb = self.stream.nextStr()
+        arity = self.stream.nextInt()
+        return getAtom(verb, arity)
+
+    def nextLayout(self):
+        stream = self.stream
+        layout = ScopeFrame(None, stream.nextStr())
+        for i in range(stream.nextInt()):
+            name = stream.nextStr()
+            scope = self.nextEnum(scopes)
+            idx = stream.nextInt()
+            severity = self.nextEnum(severities)
+            layout.frameNames[name] = i, scope, idx, severity
+        for _ in range(stream.nextInt()):
+            name = stream.nextStr()
+            idx = stream.nextInt()
+            severity = self.nextEnum(severities)
+            layout.outerNames[name] = idx, severity
+        layout.computeFrameTable()
+        return layout
+
+    def nextExprs(self):
+        return [self.nextExpr() for _ in range(self.stream.nextInt())]
+
+    def nextPatts(self):
+        return [self.nextPatt() for _ in range(self.stream.nextInt())]
+
+    def nextExpr(self):
+        ir = SplitAuditorsIR
+        stream = self.stream
+        tag = stream.nextByte()
+
+        if tag == "n":
+            return ir.NullExpr()
+        elif tag == "c":
+            return ir.CharExpr(stream.nextStr())
+        elif tag == "d":
+            return ir.DoubleExpr(stream.nextDouble())
+        elif tag == "i":
+            return ir.IntExpr(self.nextBigInt())
+        elif tag == "s":
+            return ir.StrExpr(stream.nextStr())
+        elif tag == "C":
+            obj = self.nextExpr()
+            atom = self.nextAtom()
+            args = self.nextExprs()
+            namedArgs = [ir.NamedArgExpr(self.nextExpr(), self.nextExpr())
+                         for _ in range(stream.nextInt())]
+            return ir.CallExpr(obj, atom, args, namedArgs)
+        elif tag == "D":
+            patt = self.nextPatt()
+            ex = self.nextExpr()
+            rvalue = self.nextExpr()
+            return ir.DefExpr(patt, ex, rvalue)
+        elif tag == "e":
+            patt = self.nextPatt()
+            body = self.nextExpr()
+            return ir.EscapeOnlyExpr(patt, body)
+        elif tag == "E":
+            ejPatt = self.nextPatt()
+            ejBody = self.nextExpr()
+            catchPatt = self.nextPatt()
+            catchBody = self.nextExpr()
+            return ir.EscapeExpr(ejPatt, ejBody, catchPatt, catchBody)
+        elif tag == "F":
+            body = self.nextExpr()
+            atLast = self.nextExpr()
+            return ir.FinallyExpr(body, atLast)
+        elif tag == "I":
+            test = self.nextExpr()
+            cons = self.nextExpr()
+            alt = self.nextExpr()
+            return ir.IfExpr(test, cons, alt)
+        elif tag == "L":
+            name = stream.nextStr()
+            return ir.LocalExpr(name, stream.nextInt())
+        elif tag == "R":
+            name = stream.nextStr()
+            return ir.FrameExpr(name, stream.nextInt())
+        elif tag == "U":
+            name = stream.nextStr()
+            return ir.OuterExpr(name, stream.nextInt())
+        elif tag == "o":
+            doc = stream.nextStr()
+            patt = self.nextPatt()
+            script = self.nextScript()
+            layout = self.nextLayout()
+            return ir.ClearObjectExpr(doc, patt, script, layout)
+        elif tag == "O":
+            doc = stream.nextStr()
+            patt = self.nextPatt()
+            auditors = self.nextExprs()
+            script = self.nextScript()
+            position = stream.nextInt()
+            moduleMAST = self.moduleMAST
+            if moduleMAST is None:
+                raise InvalidCache("Audited object without MAST")
+            if position >= moduleMAST.count:
+                raise InvalidCache("Audited object's MAST is out of bounds")
+            layout = self.nextLayout()
+            clipboard = CachedClipboard(layout.fqn, moduleMAST, position)
+            return ir.ObjectExpr(doc, patt, auditors, script, None, layout,
+                                 clipboard)
+        elif tag == "S":
+            return ir.SeqExpr(self.nextExprs())
+        elif tag == "Y":
+            body = self.nextExpr()
+            catchPatt = self.nextPatt()
+            catchBody = self.nextExpr()
+            return ir.TryExpr(body, catchPatt, catchBody)
+        else:
+            raise InvalidCache("Didn't know expr tag %s" % tag)
+
+    def nextPatt(self):
+        ir = SplitAuditorsIR
+        stream = self.stream
+        tag = stream.nextByte()
+
+        if tag == "_":
+            return ir.IgnorePatt(self.nextExpr())
+        elif tag == "b":
+            name = stream.nextStr()
+            return ir.BindingPatt(name, stream.nextInt())
+        elif tag == "l":
+            return ir.ListPatt(self.nextPatts())
+        elif tag == "A":
+            trans = self.nextExpr()
+            patt = self.nextPatt()
+            return ir.ViaPatt(trans, patt)
+
+        # Everything else is a guarded, indexed name.
+        name = stream.nextStr()
+        guard = self.nextExpr()
+        index = stream.nextInt()
+        if tag == "N":
+            return ir.NounPatt(name, guard, index)
+        elif tag == "f":
+            return ir.FinalSlotPatt(name, guard, index)
+        elif tag == "v":
+            return ir.VarSlotPatt(name, guard, index)
+        elif tag == "F":
+            return ir.FinalBindingPatt(name, guard, index)
+        elif tag == "V":
+            return ir.VarBindingPatt(name, guard, index)
+        else:
+            raise InvalidCache("Didn't know pattern tag %s" % tag)
+
+    def nextMethod(self):
+        stream = self.stream
+        doc = stream.nextStr()
+        atom = self.nextAtom()
+        patts = self.nextPatts()
+        namedPatts = []
+        for _ in range(stream.nextInt()):
+            key = self.nextExpr()
+            patt = self.nextPatt()
+            default = self.nextExpr()
+            namedPatts.append(SplitAuditorsIR.NamedPattern(key, patt,
+                                                           default))
+        guard = self.nextExpr()
+        body = self.nextExpr()
+        localSize = stream.nextInt()
+        return SplitAuditorsIR.MethodExpr(doc, atom, patts, namedPatts, guard,
+                                          body, localSize)
+
+    def nextMatcher(self):
+        patt = self.nextPatt()
+        body = self.nextExpr()
+        localSize = self.stream.nextInt()
+        return SplitAuditorsIR.MatcherExpr(patt, body, localSize)
+
+    def nextScript(self):
+        stream = self.stream
+        stamps = [self.nextEnum(knownStamps)
+                  for _ in range(stream.nextInt())]
+        methods = [self.nextMethod() for _ in range(stream.nextInt())]
+        matchers = [self.nextMatcher() for _ in range(stream.nextInt())]
+        return SplitAuditorsIR.ScriptExpr(stamps, methods, matchers)
+
+
+def loadLowered(bs):
+    """
+    Deserialize a lowered module.
+
+    Raises InvalidCache if the bytes aren't a valid lowered module.
+    """
+
+    if not bs.startswith(MAGIC):
+        raise InvalidCache("Wrong magic bytes")
+    stream = MASTStream(bs[len(MAGIC):])
+    loader = LoadIR(stream)
+    try:
+        localSize = stream.nextInt()
+        topLocalNames = []
+        for _ in range(stream.nextInt()):
+            name = stream.nextStr()
+            topLocalNames.append((name, loader.nextEnum(severities)))
+        outerNames = OrderedDict()
+        for _ in range(stream.nextInt()):
+            name = stream.nextStr()
+            idx = stream.nextInt()
+            outerNames[name] = idx, loader.nextEnum(severities)
+        loader.nextModuleMAST()
+        ast = loader.nextExpr()
+    except InvalidMAST:
+        raise InvalidCache("Truncated or corrupt lowered module")
+    if not stream.exhausted():
+        raise InvalidCache("Trailing garbage after lowered module")
+    return LoweredModule(ast, outerNames, topLocalNames, localSize)
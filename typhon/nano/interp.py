@@ -9,9 +9,10 @@ from rpython.rlib.objectmodel import import_from_mixin
 from typhon.atoms import getAtom
 from typhon.errors import Ejecting, UserException, userError
 from typhon.nano.auditors import dischargeAuditors
+from typhon.nano.cache import LoweredModule
 from typhon.nano.escapes import elideEscapes
 from typhon.nano.mast import saveScripts
-from typhon.nano.mix import MixIR, mix
+from typhon.nano.mix import ARITH_ATOMS, MixIR, fastArith, mix
 from typhon.nano.scopes import (SCOPE_FRAME, SCOPE_LOCAL,
                                 SEV_BINDING, SEV_NOUN, SEV_SLOT, layoutScopes,
                                 bindNouns)
@@ -48,6 +49,16 @@ MIRANDA_ARGS = mkMirandaArgs()
 ProfileNameIR = MixIR.extend("ProfileName",
     ["ProfileName"],
     {
+        "Expr": {
+            "CallExpr": [("obj", "Expr"), ("atom", None), ("args", "Expr*"),
+                         ("namedArgs", "NamedArg*"), ("cache", None)],
+            "ArithExpr": [("op", None), ("receiver", "Expr"),
+                          ("args", "Expr*"), ("cache", None)],
+        },
+        "Script": {
+            "ScriptExpr": [("stamps", "Object*"), ("methods", "Method*"),
+                           ("matchers", "Matcher*"), ("methodTable", None)],
+        },
         "Method": {
             "MethodExpr": [("profileName", "ProfileName"), ("doc", None),
                            ("atom", None), ("patts", "Patt*"),
@@ -105,6 +116,28 @@ class MakeProfileNames(_MakeProfileNames):
         self.objectNames.pop()
         return rv
 
+    def visitCallExpr(self, obj, atom, args, namedArgs):
+        obj = self.visitExpr(obj)
+        args = [self.visitExpr(arg) for arg in args]
+        namedArgs = [self.visitNamedArg(namedArg) for namedArg in namedArgs]
+        return self.dest.CallExpr(obj, atom, args, namedArgs, CallSite(atom))
+
+    def visitArithExpr(self, op, receiver, args):
+        receiver = self.visitExpr(receiver)
+        args = [self.visitExpr(arg) for arg in args]
+        return self.dest.ArithExpr(op, receiver, args,
+                                   CallSite(ARITH_ATOMS[op]))
+
+    def visitScriptExpr(self, stamps, methods, matchers):
+        methods = [self.visitMethod(method) for method in methods]
+        matchers = [self.visitMatcher(matcher) for matcher in matchers]
+        methodTable = {}
+        for method in methods:
+            # The first method for an atom wins, as in a linear scan.
+            if method.atom not in methodTable:
+                methodTable[method.atom] = method
+        return self.dest.ScriptExpr(stamps, methods, matchers, methodTable)
+
     def makeProfileName(self, inner):
         name, fqn = self.objectNames[-1]
         return "mt:%s.%s:1:%s" % (name, inner, fqn)
@@ -148,9 +181,6 @@ class InterpObject(Object):
 
     _immutable_fields_ = "doc", "displayName", "script", "report"
 
-    # Inline single-entry method cache.
-    cachedMethod = None, None
-
     def __init__(self, doc, name, script, frame, ast, fqn):
         self.objectAst = ast
         self.fqn = fqn
@@ -191,7 +221,7 @@ class InterpObject(Object):
 
     @unroll_safe
     def getMethod(self, atom):
-        # If we are JIT'd, then don't bother with the method cache. It will
+        # If we are JIT'd, then don't bother with the method table. It will
         # only slow things down. Instead, head directly to the script and find
         # the right method.
         if we_are_jitted():
@@ -199,12 +229,7 @@ class InterpObject(Object):
                 if method.atom is atom:
                     return promote(method)
         else:
-            if self.cachedMethod[0] is atom:
-                return self.cachedMethod[1]
-            for method in self.script.methods:
-                if method.atom is atom:
-                    self.cachedMethod = atom, method
-                    return method
+            return self.script.methodTable.get(atom, None)
 
     def getMatchers(self):
         return promote(self.script).matchers
@@ -255,6 +280,60 @@ class InterpObject(Object):
         return e.visitExpr(matcher.body)
 
 
+# How many receiver scripts a call site will remember.
+CALL_SITE_SIZE = 4
+
+
+def makeCallSite(ObjectClass):
+    """
+    Build a call site class for the user-defined objects of one backend.
+
+    Both backends share this implementation; each gets its own class, since
+    their objects' methods are different kinds of code objects.
+    """
+
+    class CallSite(object):
+        """
+        A polymorphic inline cache for a single call site.
+
+        Calls to user-defined objects whose scripts have been seen here
+        before go directly to the right method. Other receivers, and any
+        scripts beyond the first few, take the usual route through
+        recvNamed().
+        """
+
+        size = 0
+
+        def __init__(self, atom):
+            self.atom = atom
+            self.scripts = [None] * CALL_SITE_SIZE
+            self.methods = [None] * CALL_SITE_SIZE
+
+        def call(self, rcvr, args, namedArgs):
+            # The JIT would rather see the script promoted than consult a
+            # mutable cache; see InterpObject.getMethod().
+            if we_are_jitted():
+                return rcvr.recvNamed(self.atom, args, namedArgs)
+            if isinstance(rcvr, ObjectClass):
+                script = rcvr.script
+                for i in range(self.size):
+                    if self.scripts[i] is script:
+                        return rcvr.runMethod(self.methods[i], args,
+                                              namedArgs)
+                method = rcvr.getMethod(self.atom)
+                if method is not None:
+                    if self.size < CALL_SITE_SIZE:
+                        self.scripts[self.size] = script
+                        self.methods[self.size] = method
+                        self.size += 1
+                    return rcvr.runMethod(method, args, namedArgs)
+            return rcvr.recvNamed(self.atom, args, namedArgs)
+
+    return CallSite
+
+CallSite = makeCallSite(InterpObject)
+
+
 def retrieveGuard(severity, storage):
     """
     Get a guard from some storage.
@@ -278,22 +357,52 @@ def retrieveGuard(severity, storage):
         assert False, "landlord"
 
 
+# Shared by every method without locals, such as most getters, and every
+# object without a frame. It is never written to, since it has no slots.
+EMPTY_STORAGE = []
+
+
+def makeLocals(localSize):
+    if localSize == 0:
+        return EMPTY_STORAGE
+    return [NULL_BINDING] * localSize
+
+
 class Evaluator(ProfileNameIR.makePassTo(None)):
 
+    _immutable_fields_ = "locals", "frame"
+
     def __init__(self, frame, localSize):
-        self.locals = [NULL_BINDING] * localSize
+        self.locals = makeLocals(localSize)
         self.frame = frame
-        self.specimen = None
-        self.patternFailure = None
 
     def matchBind(self, patt, val, ej=theThrower):
-        oldSpecimen = self.specimen
-        oldPatternFailure = self.patternFailure
-        self.specimen = val
-        self.patternFailure = ej
-        self.visitPatt(patt)
-        self.specimen = oldSpecimen
-        self.patternFailure = oldPatternFailure
+        # The specimen and ejector are passed along explicitly, rather than
+        # being stashed on the evaluator, so that matching a pattern doesn't
+        # write to the heap.
+        if isinstance(patt, self.src.IgnorePatt):
+            self.matchIgnorePatt(patt.guard, val, ej)
+        elif isinstance(patt, self.src.NounPatt):
+            self.matchNounPatt(patt.name, patt.guard, patt.index, val, ej)
+        elif isinstance(patt, self.src.BindingPatt):
+            self.matchBindingPatt(patt.name, patt.index, val)
+        elif isinstance(patt, self.src.FinalBindingPatt):
+            self.matchFinalBindingPatt(patt.name, patt.guard, patt.index, val,
+                                       ej)
+        elif isinstance(patt, self.src.FinalSlotPatt):
+            self.matchFinalSlotPatt(patt.name, patt.guard, patt.index, val,
+                                    ej)
+        elif isinstance(patt, self.src.VarBindingPatt):
+            self.matchVarBindingPatt(patt.name, patt.guard, patt.index, val,
+                                     ej)
+        elif isinstance(patt, self.src.VarSlotPatt):
+            self.matchVarSlotPatt(patt.name, patt.guard, patt.index, val, ej)
+        elif isinstance(patt, self.src.ListPatt):
+            self.matchListPatt(patt.patts, val, ej)
+        elif isinstance(patt, self.src.ViaPatt):
+            self.matchViaPatt(patt.trans, patt.patt, val, ej)
+        else:
+            assert False, "radish"
 
     def runGuard(self, guard, specimen, ej):
         if ej is None:
@@ -323,7 +432,7 @@ class Evaluator(ProfileNameIR.makePassTo(None)):
 
     # Length of args and namedArgs are fixed. ~ C.
     @unroll_safe
-    def visitCallExpr(self, obj, atom, args, namedArgs):
+    def visitCallExpr(self, obj, atom, args, namedArgs, cache):
         jit_debug("CallExpr")
         rcvr = self.visitExpr(obj)
         argVals = [self.visitExpr(a) for a in args]
@@ -335,7 +444,18 @@ class Evaluator(ProfileNameIR.makePassTo(None)):
             namedArgMap = ConstMap(d)
         else:
             namedArgMap = EMPTY_MAP
-        return rcvr.recvNamed(atom, argVals, namedArgMap)
+        return cache.call(rcvr, argVals, namedArgMap)
+
+    # Length of args is fixed. ~ C.
+    @unroll_safe
+    def visitArithExpr(self, op, receiver, args, cache):
+        jit_debug("ArithExpr")
+        rcvr = self.visitExpr(receiver)
+        argVals = [self.visitExpr(a) for a in args]
+        rv = fastArith(op, rcvr, argVals)
+        if rv is None:
+            rv = cache.call(rcvr, argVals, EMPTY_MAP)
+        return rv
 
     def visitDefExpr(self, patt, ex, rvalue):
         jit_debug("DefExpr")
@@ -404,6 +524,13 @@ class Evaluator(ProfileNameIR.makePassTo(None)):
         else:
             assert False, "teacher"
 
+    @unroll_safe
+    def buildFrame(self, frameTable):
+        if not frameTable.frameInfo:
+            return EMPTY_STORAGE
+        return [self.lookupBinding(scope, index) for (_, scope, index, _)
+                in frameTable.frameInfo]
+
     # Everything passed to this method, except self, is immutable. ~ C.
     @unroll_safe
     def visitClearObjectExpr(self, doc, patt, script, layout):
@@ -414,8 +541,7 @@ class Evaluator(ProfileNameIR.makePassTo(None)):
             objName = patt.name
         ast = NullObject
         frameTable = layout.frameTable
-        frame = [self.lookupBinding(scope, index) for (_, scope, index, _)
-                 in frameTable.frameInfo]
+        frame = self.buildFrame(frameTable)
 
         # Build the object.
         val = InterpObject(doc, objName, script, frame, ast, layout.fqn)
@@ -469,8 +595,7 @@ class Evaluator(ProfileNameIR.makePassTo(None)):
         else:
             auds = [guardAuditor] + auds
         frameTable = layout.frameTable
-        frame = [self.lookupBinding(scope, index) for (_, scope, index, _)
-                 in frameTable.frameInfo]
+        frame = self.buildFrame(frameTable)
         # Grab any remaining dynamic guards. We use a copy here in order to
         # preserve the original dict for reuse.
         guards = guards.copy()
@@ -537,78 +662,72 @@ class Evaluator(ProfileNameIR.makePassTo(None)):
             self.matchBind(catchPatt, sealException(ex))
             return self.visitExpr(catchBody)
 
-    def visitIgnorePatt(self, guard):
+    def matchIgnorePatt(self, guard, specimen, ej):
         jit_debug("IgnorePatt")
         if not isinstance(guard, self.src.NullExpr):
             g = self.visitExpr(guard)
-            self.runGuard(g, self.specimen, self.patternFailure)
+            self.runGuard(g, specimen, ej)
 
-    def visitNounPatt(self, name, guard, index):
+    def matchNounPatt(self, name, guard, index, specimen, ej):
         jit_debug("NounPatt %s" % name.encode("utf-8"))
         if isinstance(guard, self.src.NullExpr):
-            val = self.specimen
+            val = specimen
         else:
             g = self.visitExpr(guard)
-            val = self.runGuard(g, self.specimen, self.patternFailure)
+            val = self.runGuard(g, specimen, ej)
         self.locals[index] = val
 
-    def visitBindingPatt(self, name, index):
+    def matchBindingPatt(self, name, index, specimen):
         jit_debug("BindingPatt %s" % name.encode("utf-8"))
-        self.locals[index] = self.specimen
+        self.locals[index] = specimen
+
+    def coerceForPatt(self, guard, specimen, ej):
+        """
+        Coerce a specimen for a binding or slot pattern, returning the guard
+        as well as the coerced value.
+        """
 
-    def visitFinalBindingPatt(self, name, guard, idx):
-        jit_debug("FinalBindingPatt %s" % name.encode("utf-8"))
         if isinstance(guard, self.src.NullExpr):
             guard = anyGuard
         else:
             guard = self.visitExpr(guard)
-        val = self.runGuard(guard, self.specimen, self.patternFailure)
+        return guard, self.runGuard(guard, specimen, ej)
+
+    def matchFinalBindingPatt(self, name, guard, idx, specimen, ej):
+        jit_debug("FinalBindingPatt %s" % name.encode("utf-8"))
+        guard, val = self.coerceForPatt(guard, specimen, ej)
         self.locals[idx] = finalBinding(val, guard)
 
-    def visitFinalSlotPatt(self, name, guard, idx):
+    def matchFinalSlotPatt(self, name, guard, idx, specimen, ej):
         jit_debug("FinalSlotPatt %s" % name.encode("utf-8"))
-        if isinstance(guard, self.src.NullExpr):
-            guard = anyGuard
-        else:
-            guard = self.visitExpr(guard)
-        val = self.runGuard(guard, self.specimen, self.patternFailure)
+        guard, val = self.coerceForPatt(guard, specimen, ej)
         self.locals[idx] = FinalSlot(val, guard)
 
-    def visitVarBindingPatt(self, name, guard, idx):
+    def matchVarBindingPatt(self, name, guard, idx, specimen, ej):
         jit_debug("VarBindingPatt %s" % name.encode("utf-8"))
-        if isinstance(guard, self.src.NullExpr):
-            guard = anyGuard
-        else:
-            guard = self.visitExpr(guard)
-        val = self.runGuard(guard, self.specimen, self.patternFailure)
+        guard, val = self.coerceForPatt(guard, specimen, ej)
         self.locals[idx] = varBinding(val, guard)
 
-    def visitVarSlotPatt(self, name, guard, idx):
+    def matchVarSlotPatt(self, name, guard, idx, specimen, ej):
         jit_debug("VarSlotPatt %s" % name.encode("utf-8"))
-        if isinstance(guard, self.src.NullExpr):
-            guard = anyGuard
-        else:
-            guard = self.visitExpr(guard)
-        val = self.runGuard(guard, self.specimen, self.patternFailure)
+        guard, val = self.coerceForPatt(guard, specimen, ej)
         self.locals[idx] = VarSlot(val, guard)
 
     # The list of patts is immutable. ~ C.
     @unroll_safe
-    def visitListPatt(self, patts):
+    def matchListPatt(self, patts, specimen, ej):
         jit_debug("ListPatt")
-        listSpecimen = unwrapList(self.specimen, ej=self.patternFailure)
-        ej = self.patternFailure
+        listSpecimen = unwrapList(specimen, ej=ej)
         if len(patts) != len(listSpecimen):
             throw(ej, StrObject(u"Failed list pattern (needed %d, got %d)" %
                                 (len(patts), len(listSpecimen))))
         for i in range(len(patts)):
             self.matchBind(patts[i], listSpecimen[i], ej)
 
-    def visitViaPatt(self, trans, patt):
+    def matchViaPatt(self, trans, patt, specimen, ej):
         jit_debug("ViaPatt")
-        ej = self.patternFailure
         v = self.visitExpr(trans)
-        newSpec = v.callAtom(RUN_2, [self.specimen, ej], MIRANDA_ARGS)
+        newSpec = v.callAtom(RUN_2, [specimen, ej], MIRANDA_ARGS)
         self.matchBind(patt, newSpec, ej)
 
     def visitNamedArgExpr(self, key, value):
@@ -638,24 +757,54 @@ def env2scope(outerNames, env):
     return scope
 
 
-def evalMonte(expr, environment, fqnPrefix, inRepl=False):
+def lowerMonte(expr, outerNames, fqnPrefix, inRepl=False):
+    """
+    Run every pass which doesn't need to know the values of the outer names.
+
+    The result only depends on the expression and the outer names, and can be
+    saved for later; see t.n.cache.
+    """
+
     ss = saveScripts(expr)
     slotted = recoverSlots(ss)
     ll, outerNames, topLocalNames, localSize = layoutScopes(slotted,
-            environment.keys(), fqnPrefix, inRepl)
+            outerNames, fqnPrefix, inRepl)
     bound = bindNouns(ll)
     ast = elideEscapes(bound)
     ast = dischargeAuditors(ast)
     ast = refactorStructure(ast)
-    outers = env2scope(outerNames, environment)
-    ast = mix(ast, outers)
+    return LoweredModule(ast, outerNames, topLocalNames, localSize)
+
+
+class BackendSettings(object):
+    """
+    Which backend runs lowered code: this module's Evaluator, or the
+    bytecode machine in t.n.bytecode.
+    """
+
+    bytecode = False
+
+    def enableBytecode(self):
+        self.bytecode = True
+
+
+backendSettings = BackendSettings()
+
+
+def runLowered(lowered, environment):
+    outers = env2scope(lowered.outerNames, environment)
+    ast = mix(lowered.ast, outers)
     ast = MakeProfileNames().visitExpr(ast)
-    result = NullObject
-    e = Evaluator([], localSize)
-    result = e.visitExpr(ast)
+    if backendSettings.bytecode:
+        from typhon.nano.bytecode import runModule
+        result, localValues = runModule(ast, lowered.localSize)
+    else:
+        e = Evaluator([], lowered.localSize)
+        result = e.visitExpr(ast)
+        localValues = e.locals
     topLocals = []
-    for i, (name, severity) in enumerate(topLocalNames):
-        local = e.locals[i]
+    for i, (name, severity) in enumerate(lowered.topLocalNames):
+        local = localValues[i]
         if severity is SEV_NOUN:
             local = finalBinding(local, anyGuard)
         elif severity is SEV_SLOT:
@@ -664,6 +813,11 @@ def evalMonte(expr, environment, fqnPrefix, inRepl=False):
     return result, topLocals
 
 
+def evalMonte(expr, environment, fqnPrefix, inRepl=False):
+    lowered = lowerMonte(expr, environment.keys(), fqnPrefix, inRepl)
+    return runLowered(lowered, environment)
+
+
 def evalToPair(expr, scopeMap, inRepl=False):
     scope = unwrapMap(scopeMap)
     result, topLocals = evalMonte(expr, scope2env(scope), u"<eval>", inRepl)
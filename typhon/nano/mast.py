@@ -6,7 +6,9 @@ from typhon.nanopass import makeIR
 from typhon.quoting import quoteChar, quoteStr
 
 def saveScripts(ast):
-    ast = SanityCheck().visitExpr(ast)
+    # The sanity check only raises; its copy of the tree is discarded, so
+    # that the MAST saved for audits is part of the module's own MAST.
+    SanityCheck().visitExpr(ast)
     ast = SaveScripts().visitExpr(ast)
     return ast
 
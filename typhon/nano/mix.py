@@ -10,10 +10,14 @@ The separation allows us to make the first part short and sweet.
 
 from collections import OrderedDict
 
+from rpython.rlib.rarithmetic import ovfcheck
+
+from typhon.atoms import getAtom
 from typhon.errors import Ejecting, UserException
 from typhon.nano.scopes import SEV_BINDING, SEV_NOUN, SEV_SLOT
 from typhon.nano.structure import SplitAuditorsIR
 from typhon.objects.auditors import deepFrozenGuard
+from typhon.objects.constants import FalseObject, TrueObject, wrapBool
 from typhon.objects.data import (BigInt, CharObject, DoubleObject, IntObject,
                                  StrObject)
 from typhon.objects.ejectors import Ejector
@@ -24,6 +28,8 @@ def mix(ast, outers):
     ast = FillOuters(outers).visitExpr(ast)
     ast = ThawLiterals().visitExpr(ast)
     ast = SpecializeCalls().visitExpr(ast)
+    ast = ElideDeadCode().visitExpr(ast)
+    ast = SpecializeArithmetic().visitExpr(ast)
     return ast
 
 NoOutersIR = SplitAuditorsIR.extend("NoOuters",
@@ -122,6 +128,8 @@ MixIR = NoLiteralsIR.extend("Mix",
     {
         "Expr": {
             "ExceptionExpr": [("exception", "Exception")],
+            "ArithExpr": [("op", None), ("receiver", "Expr"),
+                          ("args", "Expr*")],
         }
     }
 )
@@ -180,3 +188,137 @@ class SpecializeCalls(NoLiteralsIR.makePassTo(MixIR)):
                     except UserException as ue:
                         return self.dest.ExceptionExpr(ue)
         return self.dest.CallExpr(obj, atom, args, namedArgs)
+
+class ElideDeadCode(MixIR.selfPass()):
+    """
+    Remove code which can never run.
+
+    Folding calls leaves behind conditionals on live Booleans, especially in
+    expanded quasiliterals, and matchers after an irrefutable matcher can
+    never be reached.
+    """
+
+    def visitIfExpr(self, test, cons, alt):
+        test = self.visitExpr(test)
+        if isinstance(test, self.dest.LiveExpr):
+            # Anything else should still fail at runtime, so leave it be.
+            if test.obj is TrueObject:
+                return self.visitExpr(cons)
+            elif test.obj is FalseObject:
+                return self.visitExpr(alt)
+        return self.dest.IfExpr(test, self.visitExpr(cons),
+                                self.visitExpr(alt))
+
+    def irrefutable(self, patt):
+        if isinstance(patt, self.dest.IgnorePatt):
+            return isinstance(patt.guard, self.dest.NullExpr)
+        elif isinstance(patt, self.dest.NounPatt):
+            return isinstance(patt.guard, self.dest.NullExpr)
+        return isinstance(patt, self.dest.BindingPatt)
+
+    def visitScriptExpr(self, stamps, methods, matchers):
+        methods = [self.visitMethod(method) for method in methods]
+        live = []
+        for matcher in matchers:
+            live.append(self.visitMatcher(matcher))
+            assert isinstance(matcher, self.src.MatcherExpr)
+            if self.irrefutable(matcher.patt):
+                break
+        return self.dest.ScriptExpr(stamps, methods, live)
+
+
+# Arithmetic which is common enough to deserve a fast path. Each op is an
+# index into ARITH_ATOMS.
+ADD, SUBTRACT, MULTIPLY, CMP, ABOVE_ZERO, AT_LEAST_ZERO, AT_MOST_ZERO, \
+    BELOW_ZERO, IS_ZERO = range(9)
+
+ARITH_ATOMS = [
+    getAtom(u"add", 1),
+    getAtom(u"subtract", 1),
+    getAtom(u"multiply", 1),
+    getAtom(u"op__cmp", 1),
+    getAtom(u"aboveZero", 0),
+    getAtom(u"atLeastZero", 0),
+    getAtom(u"atMostZero", 0),
+    getAtom(u"belowZero", 0),
+    getAtom(u"isZero", 0),
+]
+
+class SpecializeArithmetic(MixIR.selfPass()):
+    """
+    Mark calls which might be simple arithmetic.
+
+    Nothing is known about the receivers yet; the evaluator checks their
+    types at runtime and falls back to a normal call when they aren't plain
+    Ints, Doubles, or Chars.
+    """
+
+    def visitCallExpr(self, obj, atom, args, namedArgs):
+        obj = self.visitExpr(obj)
+        args = [self.visitExpr(arg) for arg in args]
+        namedArgs = [self.visitNamedArg(namedArg) for namedArg in namedArgs]
+        if not namedArgs:
+            for op, arithAtom in enumerate(ARITH_ATOMS):
+                if atom is arithAtom:
+                    return self.dest.ArithExpr(op, obj, args)
+        return self.dest.CallExpr(obj, atom, args, namedArgs)
+
+def fastArith(op, rcvr, args):
+    """
+    Perform arithmetic without dispatching, or return None if the receiver
+    and arguments aren't simple enough.
+
+    The results must be exactly those of the corresponding methods on
+    t.o.data's IntObject, DoubleObject, and CharObject.
+    """
+
+    if isinstance(rcvr, IntObject):
+        i = rcvr.getInt()
+        if op == ABOVE_ZERO:
+            return wrapBool(i > 0)
+        elif op == AT_LEAST_ZERO:
+            return wrapBool(i >= 0)
+        elif op == AT_MOST_ZERO:
+            return wrapBool(i <= 0)
+        elif op == BELOW_ZERO:
+            return wrapBool(i < 0)
+        elif op == IS_ZERO:
+            return wrapBool(i == 0)
+        other = args[0]
+        if not isinstance(other, IntObject):
+            return None
+        j = other.getInt()
+        try:
+            if op == ADD:
+                return IntObject(ovfcheck(i + j))
+            elif op == SUBTRACT:
+                return IntObject(ovfcheck(i - j))
+            elif op == MULTIPLY:
+                return IntObject(ovfcheck(i * j))
+            elif op == CMP:
+                return IntObject(cmp(i, j))
+        except OverflowError:
+            # Let the slow path promote to BigInt.
+            return None
+    elif isinstance(rcvr, DoubleObject):
+        if op != ADD and op != SUBTRACT and op != MULTIPLY:
+            return None
+        d = rcvr.getDouble()
+        other = args[0]
+        if isinstance(other, DoubleObject):
+            e = other.getDouble()
+        elif isinstance(other, IntObject):
+            e = float(other.getInt())
+        else:
+            return None
+        if op == ADD:
+            return DoubleObject(d + e)
+        elif op == SUBTRACT:
+            return DoubleObject(d - e)
+        else:
+            return DoubleObject(d * e)
+    elif isinstance(rcvr, CharObject) and op == CMP:
+        other = args[0]
+        if isinstance(other, CharObject):
+            return IntObject(cmp(rcvr.getChar(), other.getChar()))
+    return None
@@ -153,7 +153,7 @@ class ScopeOuter(ScopeBase):
 class FrameTable(object):
     "Static frame layout information."
 
-    __immutable_fields_ = 'dynamicGuards', 'frameInfo[*]', 'names'
+    _immutable_fields_ = 'dynamicGuards', 'frameInfo[*]', 'names'
 
     def __init__(self, frameInfo):
         self.frameInfo = frameInfo
@@ -7,7 +7,6 @@ Structural refactoring to improve the efficiency of the AST interpreter.
 from rpython.rlib.rbigint import BASE10
 
 from typhon.atoms import getAtom
-from typhon.nano.mast import BuildKernelNodes
 from typhon.nano.auditors import DeepFrozenIR
 from typhon.objects.user import AuditClipboard
 from typhon.quoting import quoteChar, quoteStr
@@ -122,10 +121,10 @@ class SplitAuditors(AtomIR.makePassTo(SplitAuditorsIR)):
             # No more auditing.
             return self.dest.ClearObjectExpr(doc, patt, script, layout)
         else:
-            # Runtime auditing.
-            ast = BuildKernelNodes().visitExpr(mast)
-            clipboard = AuditClipboard(layout.fqn, ast)
-            return self.dest.ObjectExpr(doc, patt, auditors, script, ast,
+            # Runtime auditing. The clipboard keeps the MAST around and
+            # will only build kernel nodes if an audition actually happens.
+            clipboard = AuditClipboard(layout.fqn, mast)
+            return self.dest.ObjectExpr(doc, patt, auditors, script, mast,
                                         layout, clipboard)
 
 # Pretty-printer for the final pass.
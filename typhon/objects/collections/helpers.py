@@ -6,6 +6,7 @@ from rpython.rlib.objectmodel import r_ordereddict
 
 from typhon.errors import UserException, userError
 from typhon.objects.constants import unwrapBool
+from typhon.rhamt import makeOrderedTrieClass
 
 # Backing storage for maps and sets, including hash definitions.
 
@@ -36,12 +37,24 @@ def resolveKey(key):
     return key
 
 def keyEq(first, second):
+    # Most keys are Strs or Ints: named arguments, scopes, and JSON objects,
+    # for starters. Compare those directly, without resolving them or going
+    # through sameness dispatch.
+    from typhon.objects.data import IntObject, StrObject
+    if isinstance(first, StrObject) and isinstance(second, StrObject):
+        return first._s == second._s
+    if isinstance(first, IntObject) and isinstance(second, IntObject):
+        return first.getInt() == second.getInt()
+
     from typhon.objects.equality import isSameEver
     first = resolveKey(first)
     second = resolveKey(second)
     return isSameEver(first, second)
 
 def keyHash(key):
+    from typhon.objects.data import IntObject, StrObject
+    if isinstance(key, StrObject) or isinstance(key, IntObject):
+        return key.computeHash(0)
     return resolveKey(key).samenessHash()
 
 def monteMap():
@@ -65,6 +78,26 @@ def asSet(l):
 
 emptySet = monteSet()
 
+# Maps and sets are updated functionally, with `with`, `without`, and `|`.
+# Copying the whole dictionary each time makes building one up in a loop
+# quadratic, so once a ConstMap or ConstSet would grow past this size, it is
+# instead backed by a persistent trie, which keeps the same key equality and
+# the same insertion order. The dictionary is rebuilt lazily, for operations
+# which need it.
+
+TRIE_THRESHOLD = 64
+
+MonteTrie = makeOrderedTrieClass(keyEq, keyHash)
+
+def trieFromDict(d):
+    return MonteTrie.fromItems(d.items())
+
+def dictFromTrie(trie):
+    d = monteMap()
+    for k, v in trie.iteritems():
+        d[k] = v
+    return d
+
 
 # Comparison routines.
 
@@ -13,6 +13,7 @@
 # under the License.
 
 from rpython.rlib.jit import elidable
+from rpython.rlib.objectmodel import instantiate
 from rpython.rlib.rarithmetic import intmask
 
 from typhon.autohelp import autohelp, method
@@ -22,10 +23,11 @@ from typhon.objects.collections.helpers import MonteSorter
 from typhon.objects.data import IntObject, StrObject, unwrapInt
 from typhon.objects.ejectors import Ejector, throwStr
 from typhon.objects.printers import toString
-from typhon.objects.root import Object, audited
+from typhon.objects.root import Object, audited, memoizeHash
 from typhon.profile import profileTyphon
 from typhon.rstrategies import rstrategies
-from typhon.strategies.lists import strategyFactory
+from typhon.strategies.lists import (VECTOR_THRESHOLD, strategyFactory,
+                                     vectorStrategy)
 
 
 @autohelp
@@ -106,7 +108,7 @@ class FlexList(Object):
     @method("List")
     def _uncall(self):
         from typhon.objects.collections.maps import EMPTY_MAP
-        return [wrapList(self.snapshot()), StrObject(u"diverge"),
+        return [self.snapshot(), StrObject(u"diverge"),
                 wrapList([]), EMPTY_MAP]
 
     @method("List", "List")
@@ -257,16 +259,18 @@ class FlexList(Object):
             raise userError(u"slice/2: Negative stop")
         return self.strategy.slice(self, start, stop)
 
-    @method.py("List")
+    @method.py("Any")
     def snapshot(self):
-        return self.strategy.fetch_all(self)
+        l = instantiate(ConstList)
+        self.strategy.copy_into(self, l, 0, self.strategy.size(self))
+        return l
 
 
 def unwrapList(o, ej=None):
     from typhon.objects.refs import resolution
     l = resolution(o)
     if isinstance(l, ConstList):
-        return l.objs
+        return l.asList()
     if isinstance(l, FlexList):
         return l.strategy.fetch_all(l)
     throwStr(ej, u"Not a list!")
@@ -301,12 +305,52 @@ class ConstList(Object):
     A list of objects.
     """
 
-    _immutable_fields_ = "objs[*]",
+    rstrategies.make_accessors(strategy="strategy", storage="storage")
+
+    # The only strategy switch after a ConstList has been built is from
+    # unboxed to generic storage, the first time the boxed elements are
+    # needed.
+    _immutable_fields_ = "strategy?", "storage?"
+
+    strategy = None
 
     _isSettled = False
+    _hashMemo = None
 
     def __init__(self, objs):
-        self.objs = objs
+        strategy = strategyFactory.strategy_type_for(objs)
+        strategyFactory.set_initial_strategy(self, strategy, len(objs), objs)
+
+    @staticmethod
+    def fromFreshList(objs):
+        """
+        A ConstList which takes over objs, instead of copying it. Nothing
+        else may hold on to objs.
+        """
+
+        l = instantiate(ConstList)
+        strategy = strategyFactory.strategy_singleton_instance(
+            strategyFactory.strategy_type_for(objs))
+        strategyFactory.set_strategy(l, strategy)
+        strategy.adopt_all(l, objs)
+        return l
+
+    def asList(self):
+        """
+        The elements of this list, boxed. Don't mutate them.
+        """
+
+        return self.strategy.box_all(self)
+
+    def copy(self, start, stop):
+        """
+        A new ConstList of the elements from start to stop, sharing storage
+        with this list where possible.
+        """
+
+        l = instantiate(ConstList)
+        self.strategy.slice_into(self, l, start, stop)
+        return l
 
     # Do some voodoo for pretty-printing. Cargo-culted voodoo. ~ C.
 
@@ -319,9 +363,10 @@ class ConstList(Object):
     @method("Void", "Any")
     def _printOn(self, printer):
         printer.call(u"print", [StrObject(u"[")])
-        for i, obj in enumerate(self.objs):
+        objs = self.asList()
+        for i, obj in enumerate(objs):
             printer.call(u"quote", [obj])
-            if i + 1 < len(self.objs):
+            if i + 1 < len(objs):
                 printer.call(u"print", [StrObject(u", ")])
         printer.call(u"print", [StrObject(u"]")])
 
@@ -336,11 +381,17 @@ class ConstList(Object):
             else:
                 raise userError(u"Must be settled")
 
+        memo = self._hashMemo
+        if memo is not None and memo.has(depth):
+            return memo.hashes[depth]
+
         # Use the same sort of hashing as CPython's tuple hash.
         x = 0x345678
-        for obj in self.objs:
+        for obj in self.asList():
             y = obj.computeHash(depth - 1)
             x = intmask((1000003 * x) ^ y)
+        if self.isSettled():
+            self._hashMemo = memoizeHash(memo, depth, x)
         return x
 
     def isSettled(self, sofar=None):
@@ -351,7 +402,7 @@ class ConstList(Object):
         # No cache; do this the hard way.
         if sofar is None:
             sofar = {self: None}
-        for v in self.objs:
+        for v in self.asList():
             if v not in sofar and not v.isSettled(sofar=sofar):
                 return False
 
@@ -361,21 +412,34 @@ class ConstList(Object):
 
     @method("Bool")
     def empty(self):
-        return bool(self.objs)
+        return self.strategy.size(self) != 0
 
-    @method("List", "List")
+    @method("Any", "Any")
     @profileTyphon("List.add/1")
     def add(self, other):
-        if other:
-            return self.objs + other
+        from typhon.objects.refs import resolution
+        other = resolution(other)
+        if isinstance(other, ConstList) and other.strategy is self.strategy:
+            # Same storage on both sides, so just glue it together.
+            l = instantiate(ConstList)
+            self.strategy.concat_into(self, other, l)
+            return l
+        objs = unwrapList(other)
+        if not objs:
+            return self
+        elif self.strategy.size(self) >= VECTOR_THRESHOLD:
+            l = instantiate(ConstList)
+            vectorStrategy.extend_into(self, l, objs)
+            return l
         else:
-            return self.objs
+            return ConstList.fromFreshList(self.strategy.fetch_shared(self) +
+                                           objs)
 
-    @method("List", "List")
+    @method("Any", "List")
     @profileTyphon("List.join/1")
     def join(self, pieces):
         l = []
-        filler = self.objs
+        filler = self.strategy.fetch_shared(self)
         first = True
         for piece in pieces:
             # For all iterations except the first, append a copy of
@@ -386,12 +450,13 @@ class ConstList(Object):
                 l.extend(filler)
 
             l.append(piece)
-        return l[:]
+        return ConstList.fromFreshList(l)
 
     @method("Any")
     def diverge(self):
-        # XXX is this copy necessary?
-        return FlexList(self.objs[:])
+        l = instantiate(FlexList)
+        self.strategy.copy_into(self, l, 0, self.strategy.size(self))
+        return l
 
     @method("Any", "Int")
     def get(self, index):
@@ -400,34 +465,36 @@ class ConstList(Object):
             raise userError(u"get/1: Index %d cannot be negative" % index)
 
         try:
-            return self.objs[index]
+            return self.strategy.fetch(self, index)
         except IndexError:
             raise userError(u"get/1: Index %d is out of bounds" % index)
 
     @method("Any")
     def last(self):
-        if self.objs:
-            return self.objs[-1]
+        size = self.strategy.size(self)
+        if size:
+            return self.strategy.fetch(self, size - 1)
         else:
             raise userError(u"last/0: Empty list has no last element")
 
-    @method("List", "Int")
+    @method("Any", "Int")
     def multiply(self, count):
         # multiply/1: Create a new list by repeating this list's contents.
         if count < 0:
             raise userError(u"multiply/1: Can't multiply list %d times" % count)
         elif count == 0:
-            return []
+            return ConstList.fromFreshList([])
         else:
-            return self.objs * count
+            return ConstList.fromFreshList(
+                self.strategy.fetch_shared(self) * count)
 
-    @method("List")
+    @method("Any")
     def reverse(self):
-        l = self.objs[:]
+        l = self.strategy.fetch_all(self)
         l.reverse()
-        return l
+        return ConstList.fromFreshList(l)
 
-    @method("List", "Int", "Any", _verb="with")
+    @method("Any", "Int", "Any", _verb="with")
     def _with(self, index, value):
         # Replace by index.
         return self.put(index, value)
@@ -441,13 +508,13 @@ class ConstList(Object):
     @method("Any")
     def _makeIterator(self):
         # XXX could be more efficient with case analysis
-        return listIterator(self.objs)
+        return listIterator(self.asList())
 
     @method("Map")
     def asMap(self):
         from typhon.objects.collections.maps import monteMap
         d = monteMap()
-        for i, o in enumerate(self.objs):
+        for i, o in enumerate(self.asList()):
             d[IntObject(i)] = o
         return d
 
@@ -455,14 +522,15 @@ class ConstList(Object):
     def asSet(self):
         from typhon.objects.collections.sets import monteSet
         d = monteSet()
-        for o in self.objs:
+        for o in self.asList():
             d[o] = None
         return d
 
     @method("Int", "List")
     @profileTyphon("List.op__cmp/1")
     def op__cmp(self, other):
-        for i, left in enumerate(self.objs):
+        objs = self.asList()
+        for i, left in enumerate(objs):
             try:
                 right = other[i]
             except IndexError:
@@ -478,13 +546,13 @@ class ConstList(Object):
                 return 1
         # They could be longer than us but we were equal up to this point.
         # Do a final length check.
-        return 0 if len(self.objs) == len(other) else -1
+        return 0 if len(objs) == len(other) else -1
 
     @method("Bool", "Any")
     @profileTyphon("List.contains/1")
     def contains(self, needle):
         from typhon.objects.equality import EQUAL, optSame
-        for specimen in self.objs:
+        for specimen in self.asList():
             if optSame(needle, specimen) is EQUAL:
                 return True
         return False
@@ -493,62 +561,80 @@ class ConstList(Object):
     @profileTyphon("List.indexOf/1")
     def indexOf(self, needle):
         from typhon.objects.equality import EQUAL, optSame
-        for index, specimen in enumerate(self.objs):
+        for index, specimen in enumerate(self.asList()):
             if optSame(needle, specimen) is EQUAL:
                 return index
         return -1
 
-    @method.py("List", "Any", _verb="with")
+    @method.py("Any", "Any", _verb="with")
     @profileTyphon("List.with/1")
     def with_(self, obj):
-        if not self.objs:
-            return [obj]
-        else:
-            return self.objs + [obj]
-
-    @method.py("List", "Int", "Any")
+        size = self.strategy.size(self)
+        if self.strategy._check_can_handle(size, obj):
+            l = instantiate(ConstList)
+            self.strategy.append_into(self, l, obj)
+            return l
+        elif size >= VECTOR_THRESHOLD:
+            l = instantiate(ConstList)
+            vectorStrategy.extend_into(self, l, [obj])
+            return l
+        return ConstList.fromFreshList(self.strategy.fetch_shared(self) +
+                                       [obj])
+
+    @method.py("Any", "Int", "Any")
     def put(self, index, value):
-        top = len(self.objs)
+        top = self.strategy.size(self)
         if index == top:
             return self.with_(value)
+        elif 0 <= index < top:
+            if self.strategy._check_can_handle(index, value):
+                l = instantiate(ConstList)
+                self.strategy.put_into(self, l, index, value)
+                return l
+            objs = self.strategy.fetch_all(self)
+            objs[index] = value
+            return ConstList.fromFreshList(objs)
         else:
-            try:
-                objs = self.objs[:]
-                objs[index] = value
-                return objs
-            except IndexError:
-                raise userError(u"put/2: Index %d out of bounds for list of length %d" %
-                                (index, top))
+            raise userError(u"put/2: Index %d out of bounds for list of length %d" %
+                            (index, top))
 
     @method.py("Int")
     @elidable
     def size(self):
-        return len(self.objs)
+        return self.strategy.size(self)
 
-    @method("List", "Int")
+    @method("Any", "Int")
     def slice(self, start):
         if start < 0:
             raise userError(u"slice/1: Negative start")
-        return self.objs[start:]
+        return self._slice(start, self.strategy.size(self))
 
-    @method("List", "Int", "Int", _verb="slice")
+    @method.py("Any", "Int", "Int", _verb="slice")
     def _slice(self, start, stop):
         if start < 0:
             raise userError(u"slice/1: Negative start")
         if stop < 0:
             raise userError(u"slice/2: Negative stop")
-        return self.objs[start:stop]
+        # Clamp, as Python slicing would.
+        size = self.strategy.size(self)
+        if stop > size:
+            stop = size
+        if start > stop:
+            start = stop
+        if start == 0 and stop == size:
+            return self
+        return self.copy(start, stop)
 
     @method("Any")
     def snapshot(self):
         return self
 
-    @method("List")
+    @method("Any")
     @profileTyphon("List.sort/0")
     def sort(self):
-        l = self.objs[:]
+        l = self.strategy.fetch_all(self)
         MonteSorter(l).sort()
-        return l
+        return ConstList.fromFreshList(l)
 
     @method("Int", "List")
     def startOf(self, needleCL, start=0):
@@ -561,10 +647,11 @@ class ConstList(Object):
                     start)
         # This is quadratic. It could be better.
         from typhon.objects.equality import EQUAL, optSame
-        for index in range(start, len(self.objs)):
+        objs = self.asList()
+        for index in range(start, len(objs)):
             for needleIndex, needle in enumerate(needleCL):
                 offset = index + needleIndex
-                if optSame(self.objs[offset], needle) is not EQUAL:
+                if optSame(objs[offset], needle) is not EQUAL:
                     break
                 return index
         return -1
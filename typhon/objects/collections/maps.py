@@ -12,16 +12,18 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+from rpython.rlib.objectmodel import instantiate
 from rpython.rlib.rarithmetic import intmask
 
 from typhon.autohelp import autohelp, method
 from typhon.errors import WrongType, userError
-from typhon.objects.collections.helpers import (KeySorter, ValueSorter,
-                                                monteMap)
+from typhon.objects.collections.helpers import (TRIE_THRESHOLD, KeySorter,
+                                                ValueSorter, dictFromTrie,
+                                                monteMap, trieFromDict)
 from typhon.objects.data import StrObject
 from typhon.objects.ejectors import throwStr
 from typhon.objects.printers import toString
-from typhon.objects.root import Object, audited
+from typhon.objects.root import Object, audited, memoizeHash
 from typhon.profile import profileTyphon
 
 
@@ -59,24 +61,60 @@ class ConstMap(Object):
     An ordered map of objects.
     """
 
-    _immutable_fields_ = "objectMap",
+    # Either of these may be None until it's needed; see
+    # t.o.c.helpers.TRIE_THRESHOLD.
+    _immutable_fields_ = "objectMap?", "trie?"
+
+    trie = None
+    _isSettled = False
+    _hashMemo = None
 
     def __init__(self, objectMap):
         self.objectMap = objectMap
 
+    @staticmethod
+    def fromTrie(trie):
+        m = instantiate(ConstMap)
+        m.objectMap = None
+        m.trie = trie
+        return m
+
+    def asDict(self):
+        """
+        The dictionary backing this map. Don't mutate it.
+        """
+
+        if self.objectMap is None:
+            self.objectMap = dictFromTrie(self.trie)
+        return self.objectMap
+
+    def asTrie(self):
+        if self.trie is None:
+            self.trie = trieFromDict(self.objectMap)
+        return self.trie
+
+    def wantsTrie(self, growth):
+        """
+        Whether functional updates should go through the trie.
+        """
+
+        return (self.trie is not None or
+                len(self.objectMap) + growth > TRIE_THRESHOLD)
+
     @method("Void", "Any")
     def _printOn(self, printer):
         printer.call(u"print", [StrObject(u"[")])
+        d = self.asDict()
         i = 0
-        for k, v in self.objectMap.iteritems():
+        for k, v in d.iteritems():
             printer.call(u"quote", [k])
             printer.call(u"print", [StrObject(u" => ")])
             printer.call(u"quote", [v])
-            if i + 1 < len(self.objectMap):
+            if i + 1 < len(d):
                 printer.call(u"print", [StrObject(u", ")])
             i += 1
         printer.call(u"print", [StrObject(u"]")])
-        if len(self.objectMap) == 0:
+        if len(d) == 0:
             printer.call(u"print", [StrObject(u".asMap()")])
 
     def computeHash(self, depth):
@@ -90,14 +128,19 @@ class ConstMap(Object):
             else:
                 raise userError(u"Must be settled")
 
+        memo = self._hashMemo
+        if memo is not None and memo.has(depth):
+            return memo.hashes[depth]
 
         # Nest each item, hand-unwrapping the nested "tuple" of items.
         x = 0x345678
-        for k, v in self.objectMap.items():
+        for k, v in self.asDict().items():
             y = 0x345678
             y = intmask((1000003 * y) ^ k.computeHash(depth - 1))
             y = intmask((1000003 * y) ^ v.computeHash(depth - 1))
             x = intmask((1000003 * x) ^ y)
+        if self.isSettled():
+            self._hashMemo = memoizeHash(memo, depth, x)
         return x
 
     @staticmethod
@@ -115,55 +158,72 @@ class ConstMap(Object):
         return toString(self)
 
     def isSettled(self, sofar=None):
+        if self._isSettled:
+            return True
+
         if sofar is None:
             sofar = {self: None}
-        for k, v in self.objectMap.iteritems():
+        for k, v in self.asDict().iteritems():
             if k not in sofar and not k.isSettled(sofar=sofar):
                 return False
             if v not in sofar and not v.isSettled(sofar=sofar):
                 return False
+
+        # We can't become unsettled.
+        self._isSettled = True
         return True
 
     @method.py("Bool")
     def empty(self):
+        if self.trie is not None:
+            return self.trie.size == 0
         return not self.objectMap
 
     @method("Set")
     def asSet(self):
         # COW optimization.
-        return self.objectMap
+        return self.asDict()
 
     @method("Any")
     def diverge(self):
         # Split off a copy so that we are not mutated.
-        return FlexMap(self.objectMap.copy())
+        return FlexMap(self.asDict().copy())
 
     @method("Any", "Any", "Any")
     def fetch(self, key, thunk):
-        rv = self.objectMap.get(key, None)
+        if self.objectMap is None:
+            rv = self.trie.get(key, None)
+        else:
+            rv = self.objectMap.get(key, None)
         if rv is None:
             rv = thunk.call(u"run", [])
         return rv
 
     @method("List")
     def getKeys(self):
-        return self.objectMap.keys()
+        return self.asDict().keys()
 
     @method("List")
     def getValues(self):
-        return self.objectMap.values()
+        return self.asDict().values()
 
     @method("Any", "Any")
     def get(self, key):
-        try:
-            return self.objectMap[key]
-        except KeyError:
-            raise userError(u"Key not found: %s" % (key.toString(),))
+        if self.objectMap is None:
+            rv = self.trie.get(key, None)
+            if rv is not None:
+                return rv
+        else:
+            try:
+                return self.objectMap[key]
+            except KeyError:
+                pass
+        raise userError(u"Key not found: %s" % (key.toString(),))
 
     @method("Map")
     def reverse(self):
         d = monteMap()
-        l = [(k, v) for k, v in self.objectMap.iteritems()]
+        l = [(k, v) for k, v in self.asDict().iteritems()]
         # Reverse it!
         l.reverse()
         for k, v in l:
@@ -174,7 +234,7 @@ class ConstMap(Object):
     def sortKeys(self):
         # Extract a list, sort it, pack it back into a dict.
         d = monteMap()
-        l = [(k, v) for k, v in self.objectMap.iteritems()]
+        l = [(k, v) for k, v in self.asDict().iteritems()]
         KeySorter(l).sort()
         for k, v in l:
             d[k] = v
@@ -184,59 +244,71 @@ class ConstMap(Object):
     def sortValues(self):
         # Same as sortKeys/0.
         d = monteMap()
-        l = [(k, v) for k, v in self.objectMap.iteritems()]
+        l = [(k, v) for k, v in self.asDict().iteritems()]
         ValueSorter(l).sort()
         for k, v in l:
             d[k] = v
         return d
 
-    @method("Map", "Any", "Any", _verb="with")
+    @method("Any", "Any", "Any", _verb="with")
     def _with(self, key, value):
         # Replace by key.
+        if self.wantsTrie(1):
+            return ConstMap.fromTrie(self.asTrie().put(key, value))
         d = self.objectMap.copy()
         d[key] = value
-        return d
+        return ConstMap(d)
 
-    @method("Map", "Any")
+    @method("Any", "Any")
     def without(self, key):
+        if self.trie is not None:
+            trie = self.trie.remove(key)
+            return self if trie is self.trie else ConstMap.fromTrie(trie)
         # Ignore the case where the key wasn't in the map.
         if key in self.objectMap:
             d = self.objectMap.copy()
             del d[key]
-            return d
-        return self.objectMap
+            return ConstMap(d)
+        return self
 
     @method("Any")
     def _makeIterator(self):
-        return mapIterator(self.objectMap.items())
+        return mapIterator(self.asDict().items())
 
     @method("List")
     def _uncall(self):
         from typhon.objects.collections.lists import wrapList
         from typhon.scopes.safe import theMakeMap
-        rv = wrapList([wrapList([k, v]) for k, v in self.objectMap.items()])
+        rv = wrapList([wrapList([k, v]) for k, v in self.asDict().items()])
         return [theMakeMap, StrObject(u"fromPairs"), rv, EMPTY_MAP]
 
     @method.py("Bool", "Any")
     def contains(self, needle):
+        if self.objectMap is None:
+            return self.trie.contains(needle)
         return needle in self.objectMap
 
-    @method.py("Map", "Map", _verb="or")
+    @method.py("Any", "Map", _verb="or")
     @profileTyphon("Map.or/1")
     def _or(self, other):
-        # XXX This is currently linear time. Can it be better? If not, prove
-        # it, please.
+        # Linear in the size of the other map, at least.
+        if self.wantsTrie(len(other)):
+            trie = self.asTrie()
+            for ok, ov in other.items():
+                if not trie.contains(ok):
+                    trie = trie.put(ok, ov)
+            return ConstMap.fromTrie(trie)
         rv = self.objectMap.copy()
         for ok, ov in other.items():
             if ok not in rv:
                 rv[ok] = ov
-        return rv
+        return ConstMap(rv)
 
     @method("Map", "Int")
     def slice(self, start):
         if start < 0:
             raise userError(u"slice/1: Negative start")
-        items = self.objectMap.items()[start:]
+        items = self.asDict().items()[start:]
         rv = monteMap()
         for k, v in items:
             rv[k] = v
@@ -248,7 +320,7 @@ class ConstMap(Object):
             raise userError(u"slice/1: Negative start")
         if stop < 0:
             raise userError(u"slice/1: Negative stop")
-        items = self.objectMap.items()[start:stop]
+        items = self.asDict().items()[start:stop]
         rv = monteMap()
         for k, v in items:
             rv[k] = v
@@ -256,20 +328,22 @@ class ConstMap(Object):
 
     @method("Int")
     def size(self):
+        if self.objectMap is None:
+            return self.trie.size
         return len(self.objectMap)
 
     @method("Map")
     def snapshot(self):
         # This is a copy-on-write optimization; we are trusting the rest of
         # the functions on this map to not alter the map.
-        return self.objectMap
+        return self.asDict()
 
     def extractStringKey(self, k, default):
         """
         Extract a string key from this map. On failure, return `default`.
         """
 
-        return self.objectMap.get(StrObject(k), default)
+        return self.asDict().get(StrObject(k), default)
 
     def iteritems(self):
         """
@@ -278,7 +352,7 @@ class ConstMap(Object):
         The normal caveats apply.
         """
 
-        return self.objectMap.iteritems()
+        return self.asDict().iteritems()
 
 EMPTY_MAP = ConstMap(monteMap())
 
@@ -480,7 +554,7 @@ def unwrapMap(o):
     from typhon.objects.refs import resolution
     m = resolution(o)
     if isinstance(m, ConstMap):
-        return m.objectMap
+        return m.asDict()
     if isinstance(m, FlexMap):
         return m.objectMap
     raise WrongType(u"Not a map!")
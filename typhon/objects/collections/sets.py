@@ -12,15 +12,17 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+from rpython.rlib.objectmodel import instantiate
 from rpython.rlib.rarithmetic import intmask
 
 from typhon.autohelp import autohelp, method
 from typhon.errors import WrongType, userError
-from typhon.objects.collections.helpers import monteSet
+from typhon.objects.collections.helpers import (TRIE_THRESHOLD, dictFromTrie,
+                                                monteSet, trieFromDict)
 from typhon.objects.comparison import Incomparable
 from typhon.objects.data import IntObject, StrObject
 from typhon.objects.printers import toString
-from typhon.objects.root import Object, audited
+from typhon.objects.root import Object, audited, memoizeHash
 from typhon.profile import profileTyphon
 
 
@@ -31,11 +33,45 @@ class ConstSet(Object):
     An ordered set of distinct objects.
     """
 
-    _immutable_fields_ = "objectSet",
+    # Either of these may be None until it's needed; see
+    # t.o.c.helpers.TRIE_THRESHOLD.
+    _immutable_fields_ = "objectSet?", "trie?"
+
+    trie = None
+    _hashMemo = None
 
     def __init__(self, objectSet):
         self.objectSet = objectSet
 
+    @staticmethod
+    def fromTrie(trie):
+        s = instantiate(ConstSet)
+        s.objectSet = None
+        s.trie = trie
+        return s
+
+    def asDict(self):
+        """
+        The dictionary backing this set. Don't mutate it.
+        """
+
+        if self.objectSet is None:
+            self.objectSet = dictFromTrie(self.trie)
+        return self.objectSet
+
+    def asTrie(self):
+        if self.trie is None:
+            self.trie = trieFromDict(self.objectSet)
+        return self.trie
+
+    def wantsTrie(self, growth):
+        """
+        Whether functional updates should go through the trie.
+        """
+
+        return (self.trie is not None or
+                len(self.objectSet) + growth > TRIE_THRESHOLD)
+
     def toString(self):
         return toString(self)
 
@@ -50,21 +86,27 @@ class ConstSet(Object):
             else:
                 raise userError(u"Must be settled")
 
+        memo = self._hashMemo
+        if memo is not None and memo.has(depth):
+            return memo.hashes[depth]
 
         # Hash as if we were a list, but change our starting seed so that
         # we won't hash exactly equal.
         x = 0x3456789
-        for obj in self.objectSet.keys():
+        for obj in self.asDict().keys():
             y = obj.computeHash(depth - 1)
             x = intmask((1000003 * x) ^ y)
+        if self.isSettled():
+            self._hashMemo = memoizeHash(memo, depth, x)
         return x
 
     @method("Void", "Any")
     def _printOn(self, printer):
         printer.call(u"print", [StrObject(u"[")])
-        for i, obj in enumerate(self.objectSet.keys()):
+        d = self.asDict()
+        for i, obj in enumerate(d.keys()):
             printer.call(u"quote", [obj])
-            if i + 1 < len(self.objectSet):
+            if i + 1 < len(d):
                 printer.call(u"print", [StrObject(u", ")])
         printer.call(u"print", [StrObject(u"].asSet()")])
 
@@ -75,10 +117,12 @@ class ConstSet(Object):
         """
 
         from typhon.objects.collections.lists import listIterator
-        return listIterator(self.objectSet.keys())
+        return listIterator(self.asDict().keys())
 
     @method("Bool")
     def empty(self):
+        if self.trie is not None:
+            return self.trie.size == 0
         return not self.objectSet
 
     @method("Bool", "Any")
@@ -87,17 +131,19 @@ class ConstSet(Object):
         Determine whether an element is in this collection.
         """
 
+        if self.objectSet is None:
+            return self.trie.contains(needle)
         return needle in self.objectSet
 
     @method("Set", "Set", _verb="and")
     @profileTyphon("Set.and/1")
     def _and(self, other):
-        if (len(self.objectSet) > len(other)):
-            bigger = self.objectSet
+        if (len(self.asDict()) > len(other)):
+            bigger = self.asDict()
             smaller = other
         else:
             bigger = other
-            smaller = self.objectSet
+            smaller = self.asDict()
 
         rv = monteSet()
         for k in smaller:
@@ -105,22 +151,27 @@ class ConstSet(Object):
                 rv[k] = None
         return rv
 
-    @method("Set", "Set", _verb="or")
+    @method("Any", "Set", _verb="or")
     @profileTyphon("Set.or/1")
     def _or(self, other):
-        # XXX This is currently linear time. Can it be better? If not, prove
-        # it, please.
+        # Linear in the size of the other set, at least.
+        if self.wantsTrie(len(other)):
+            trie = self.asTrie()
+            for ok in other.keys():
+                if not trie.contains(ok):
+                    trie = trie.put(ok, None)
+            return ConstSet.fromTrie(trie)
         rv = self.objectSet.copy()
         for ok in other.keys():
             if ok not in rv:
                 rv[ok] = None
-        return rv
+        return ConstSet(rv)
 
     # XXX Decide if we follow python-style '-' or E-style '&!' here.
     @method.py("Set", "Set")
     @profileTyphon("Set.subtract/1")
     def subtract(self, other):
-        rv = self.objectSet.copy()
+        rv = self.asDict().copy()
         for ok in other.keys():
             if ok in rv:
                 del rv[ok]
@@ -134,7 +185,7 @@ class ConstSet(Object):
     def slice(self, start):
         if start < 0:
             raise userError(u"slice/2: Negative start")
-        keys = self.objectSet.keys()[start:]
+        keys = self.asDict().keys()[start:]
         rv = monteSet()
         for k in keys:
             rv[k] = None
@@ -146,7 +197,7 @@ class ConstSet(Object):
             raise userError(u"slice/2: Negative start")
         if stop < 0:
             raise userError(u"slice/2: Negative stop")
-        keys = self.objectSet.keys()[start:stop]
+        keys = self.asDict().keys()[start:stop]
         rv = monteSet()
         for k in keys:
             rv[k] = None
@@ -154,47 +205,54 @@ class ConstSet(Object):
 
     @method("Int")
     def size(self):
+        if self.objectSet is None:
+            return self.trie.size
         return len(self.objectSet)
 
     @method("Set")
     def snapshot(self):
-        return self.objectSet.copy()
+        return self.asDict().copy()
 
     @method("List")
     def _uncall(self):
         from typhon.objects.collections.lists import wrapList
         from typhon.objects.collections.maps import EMPTY_MAP
         # [1,2,3].asSet() -> [[1,2,3], "asSet"]
-        rv = wrapList(self.objectSet.keys())
+        rv = wrapList(self.asDict().keys())
         return [rv, StrObject(u"asSet"), wrapList([]), EMPTY_MAP]
 
     @method("Set")
     def asSet(self):
-        return self.objectSet
+        return self.asDict()
 
     @method("Any")
     def diverge(self):
-        return FlexSet(self.objectSet.copy())
+        return FlexSet(self.asDict().copy())
 
     @method("List")
     def asList(self):
-        return self.objectSet.keys()
+        return self.asDict().keys()
 
-    @method("Set", "Any", _verb="with")
+    @method("Any", "Any", _verb="with")
     def _with(self, key):
+        if self.wantsTrie(1):
+            return ConstSet.fromTrie(self.asTrie().put(key, None))
         d = self.objectSet.copy()
         d[key] = None
-        return d
+        return ConstSet(d)
 
-    @method("Set", "Any")
+    @method("Any", "Any")
     def without(self, key):
+        if self.trie is not None:
+            trie = self.trie.remove(key)
+            return self if trie is self.trie else ConstSet.fromTrie(trie)
         # If the key isn't in the map, don't bother copying.
         if key in self.objectSet:
             d = self.objectSet.copy()
             del d[key]
-            return d
+            return ConstSet(d)
         else:
-            return self.objectSet
+            return self
 
     @method("Any", "Set")
     def op__cmp(self, other):
@@ -202,21 +260,21 @@ class ConstSet(Object):
         Perform a subset comparison.
         """
 
-        if len(self.objectSet) < len(other):
-            smaller = self.objectSet
+        if len(self.asDict()) < len(other):
+            smaller = self.asDict()
             larger = other
         else:
             smaller = other
-            larger = self.objectSet
+            larger = self.asDict()
 
         for item in smaller.keys():
             if item not in larger:
                 return Incomparable
 
         # smaller is a subset of larger.
-        if len(self.objectSet) == len(other):
+        if len(self.asDict()) == len(other):
             return IntObject(0)
-        elif len(self.objectSet) < len(other):
+        elif len(self.asDict()) < len(other):
             return IntObject(-1)
         else:
             return IntObject(1)
@@ -383,7 +441,7 @@ def unwrapSet(o):
     from typhon.objects.refs import resolution
     m = resolution(o)
     if isinstance(m, ConstSet):
-        return m.objectSet
+        return m.asDict()
     if isinstance(m, FlexSet):
         return m.objectSet
     raise WrongType(u"Not a set!")
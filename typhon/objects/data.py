@@ -20,7 +20,7 @@ import string
 from rpython.rlib import rgc
 from rpython.rlib.rbigint import BASE10, rbigint
 from rpython.rlib.jit import elidable
-from rpython.rlib.objectmodel import _hash_float, specialize
+from rpython.rlib.objectmodel import _hash_float, compute_hash, specialize
 from rpython.rlib.rarithmetic import LONG_BIT, intmask, ovfcheck
 from rpython.rlib.rstring import StringBuilder, UnicodeBuilder, replace, split
 from rpython.rlib.rstruct.ieee import pack_float
@@ -1092,17 +1092,10 @@ class StrObject(Object):
         return quoteStr(self._s)
 
     def computeHash(self, depth):
-        # Cribbed from RPython's _hash_string.
-        length = len(self._s)
-        if length == 0:
-            return -1
-        x = ord(self._s[0]) << 7
-        i = 0
-        while i < length:
-            x = intmask((1000003 * x) ^ ord(self._s[i]))
-            i += 1
-        x ^= length
-        return intmask(x)
+        # RPython caches this hash on the string itself, so fresh Strs made
+        # from the same string (like map keys made to look up named
+        # arguments) don't have to walk it again.
+        return compute_hash(self._s)
 
     def sizeOf(self):
         return (rgc.get_rpy_memory_usage(self) +
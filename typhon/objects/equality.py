@@ -25,7 +25,7 @@ from typhon.objects.constants import TrueObject, FalseObject, NullObject, wrapBo
 from typhon.objects.data import (BigInt, BytesObject, CharObject,
                                  DoubleObject, IntObject, StrObject)
 from typhon.objects.refs import resolution, isResolved
-from typhon.objects.root import Object, audited
+from typhon.objects.root import HASH_DEPTH, Object, audited
 from typhon.profile import profileTyphon
 
 
@@ -265,6 +265,13 @@ def samenessHash(obj, depth, fringe, path=None):
         isinstance(o, TraversalKey)):
         return o.computeHash(depth)
 
+    # Settled composites hash as they would as map keys, which they
+    # remember. Equal objects are either both settled or both not, so they
+    # still hash alike.
+    if ((isinstance(o, ConstList) or isSelflessTransparent(o)) and
+        o.isSettled()):
+        return o.computeHash(depth)
+
     # Lists.
     if isinstance(o, ConstList):
 
@@ -302,6 +309,11 @@ def samenessHash(obj, depth, fringe, path=None):
     return -1
 
 
+def isSelflessTransparent(o):
+    stamps = o.auditorStamps()
+    return selfless in stamps and transparentStamp in stamps
+
+
 def listFringe(o, fringe, path, sofar):
     result = True
     for i, x in enumerate(unwrapList(o)):
@@ -406,9 +418,6 @@ class FringeNode(object):
         return compute_identity_hash(self.identity) ^ hashFringePath(self.path)
 
 
-# Only look at a few levels of the object graph for hash values.
-HASH_DEPTH = 7
-
 @autohelp
 @audited.DFSelfless
 class TraversalKey(Object):
@@ -16,6 +16,7 @@ from rpython.rlib.jit import JitDriver
 
 from typhon.atoms import getAtom
 from typhon.errors import Ejecting
+from typhon.nano.bytecode import BytecodeObject
 from typhon.nano.interp import InterpObject
 from typhon.objects.auditors import deepFrozenStamp
 from typhon.objects.collections.lists import unwrapList
@@ -32,11 +33,6 @@ def getLocation(method, displayName):
     return displayName
 
 
-loopDriver = JitDriver(greens=["method", "displayName"],
-                       reds=["consumer", "ejector", "iterator"],
-                       get_printable_location=getLocation)
-
-
 def slowLoop(iterable, consumer):
     iterator = iterable.call(u"_makeIterator", [])
 
@@ -54,42 +50,67 @@ def slowLoop(iterable, consumer):
     return NullObject
 
 
+def makeFastLoop(ObjectClass, name):
+    """
+    Build a loop for consumers whose scripts are run by one of the backends.
+
+    Each backend gets its own JIT driver, since their methods are different
+    kinds of code objects.
+    """
+
+    loopDriver = JitDriver(name=name, greens=["method", "displayName"],
+                           reds=["consumer", "ejector", "iterator"],
+                           get_printable_location=getLocation)
+
+    def fastLoop(iterable, consumer):
+        assert isinstance(consumer, ObjectClass)
+        displayName = consumer.getDisplayName().encode("utf-8")
+
+        # Rarer path: If the consumer doesn't actually have a method for
+        # run/2, then they're not going to be JIT'd. Again, the compiler and
+        # optimizer won't ever do this to us; it has to be intentional.
+        method = consumer.getMethod(RUN_2)
+        if method is None:
+            return slowLoop(iterable, consumer)
+
+        iterator = iterable.call(u"_makeIterator", [])
+
+        ej = Ejector()
+        try:
+            while True:
+                # JIT merge point.
+                loopDriver.jit_merge_point(method=method,
+                        displayName=displayName, consumer=consumer,
+                        ejector=ej, iterator=iterator)
+                values = unwrapList(iterator.call(u"next", [ej]))
+                consumer.runMethod(method, values, EMPTY_MAP)
+        except Ejecting as e:
+            if e.ejector is not ej:
+                raise
+        finally:
+            ej.disable()
+
+        return NullObject
+
+    return fastLoop
+
+interpLoop = makeFastLoop(InterpObject, "interpLoop")
+bytecodeLoop = makeFastLoop(BytecodeObject, "bytecodeLoop")
+
+
 @runnable(RUN_2, [deepFrozenStamp])
 def loop(iterable, consumer):
     """
     Perform an iterative loop.
     """
 
-    # If the consumer is *not* an InterpObject, then damn them to the slow
-    # path. In order for the consumer to not be InterpObject, though, the
+    # If the consumer is *not* a user-defined object, then damn them to the
+    # slow path. In order for the consumer to be something else, though, the
     # compiler and optimizer must have decided that an object could be
     # directly passed to _loop(), which is currently impossible to do without
     # manual effort. It's really not a common pathway at all.
-    if not isinstance(consumer, InterpObject):
-        return slowLoop(iterable, consumer)
-    displayName = consumer.getDisplayName().encode("utf-8")
-
-    # Rarer path: If the consumer doesn't actually have a method for run/2,
-    # then they're not going to be JIT'd. Again, the compiler and optimizer
-    # won't ever do this to us; it has to be intentional.
-    method = consumer.getMethod(RUN_2)
-    if method is None:
-        return slowLoop(iterable, consumer)
-
-    iterator = iterable.call(u"_makeIterator", [])
-
-    ej = Ejector()
-    try:
-        while True:
-            # JIT merge point.
-            loopDriver.jit_merge_point(method=method, displayName=displayName,
-                    consumer=consumer, ejector=ej, iterator=iterator)
-            values = unwrapList(iterator.call(u"next", [ej]))
-            consumer.runMethod(method, values, EMPTY_MAP)
-    except Ejecting as e:
-        if e.ejector is not ej:
-            raise
-    finally:
-        ej.disable()
-
-    return NullObject
+    if isinstance(consumer, InterpObject):
+        return interpLoop(iterable, consumer)
+    elif isinstance(consumer, BytecodeObject):
+        return bytecodeLoop(iterable, consumer)
+    return slowLoop(iterable, consumer)
@@ -0,0 +1,510 @@
+"""
+Vats in other processes.
+
+A process vat is a fresh mt-typhon, running a script whose result is the
+root of the vat. The two processes share nothing; frames pass through a pair
+of POSIX message queues, one in each direction, and their messages are
+encoded with typhon.wire, so only data can cross.
+
+A process vat runs until it is closed, or until its process exits. Like any
+other subprocess, an unfinished process vat keeps its parent running.
+"""
+
+import errno
+import os
+
+from rpython.rlib.rarithmetic import intmask
+from rpython.rtyper.lltypesystem.lltype import nullptr
+
+from typhon import ruv
+from typhon.atoms import getAtom
+from typhon.autohelp import autohelp, method
+from typhon.errors import UserException, userError
+from typhon.log import log
+from typhon.objects.collections.lists import unwrapList
+from typhon.objects.collections.maps import EMPTY_MAP
+from typhon.objects.constants import NullObject
+from typhon.objects.data import StrObject, unwrapBytes
+from typhon.objects.processes import SubProcess
+from typhon.objects.refs import (BROKEN, EVENTUAL, Promise,
+                                 WhenResolvedReactor, _WHENMORERESOLVED_1,
+                                 isBroken, makePromise, resolution)
+from typhon.objects.root import Object, audited
+from typhon.rmqueue import MQueue, mq_attr, unlink_mqueue
+from typhon.vats import currentVat, scopedVat
+from typhon.wire import (FRAME_ANSWER, FRAME_CLOSE, FRAME_SEND,
+                         FRAME_SEND_ONLY, InvalidWire, dumpFrame,
+                         dumpMessage, loadFrame, loadMessage)
+
+
+RESOLVE_1 = getAtom(u"resolve", 1)
+SMASH_1 = getAtom(u"smash", 1)
+
+
+def openQueue(name, flags):
+    return MQueue(name, flags | os.O_NONBLOCK, 0600, nullptr(mq_attr))
+
+
+def unlinkQuietly(name):
+    try:
+        unlink_mqueue(name)
+    except OSError:
+        # Already gone.
+        pass
+
+
+def queueReadCB(poll, status, events):
+    with ruv.unstashingPoll(poll) as (vat, transport):
+        status = intmask(status)
+        with scopedVat(vat):
+            if status < 0:
+                transport.failed(u"Couldn't poll inbox: %s" %
+                                 ruv.formatError(status).decode("utf-8"))
+            else:
+                transport.readable()
+
+
+def queueWriteCB(poll, status, events):
+    with ruv.unstashingPoll(poll) as (vat, transport):
+        status = intmask(status)
+        with scopedVat(vat):
+            if status < 0:
+                transport.failed(u"Couldn't poll outbox: %s" %
+                                 ruv.formatError(status).decode("utf-8"))
+            else:
+                transport.writable()
+
+
+def queueClosedCB(handle):
+    poll = ruv.rffi.cast(ruv.poll_tp, handle)
+    ruv.unstashPoll(poll)
+    ruv.free(poll)
+
+
+class Transport(object):
+    """
+    Frames passing through a pair of message queues.
+
+    Frames which don't fit into the outbox wait in a backlog, which drains as
+    the outbox empties.
+    """
+
+    closed = False
+    flushing = False
+    hangingUp = False
+
+    def __init__(self, vat, inbox, outbox):
+        self.vat = vat
+        self.inbox = inbox
+        self.outbox = outbox
+        self.backlog = []
+
+        self.reading = ruv.alloc_poll(vat.uv_loop, inbox.mqd)
+        ruv.stashPoll(self.reading, (vat, self))
+        self.writing = ruv.alloc_poll(vat.uv_loop, outbox.mqd)
+        ruv.stashPoll(self.writing, (vat, self))
+        ruv.pollStart(self.reading, ruv.UV_READABLE, queueReadCB)
+
+    def post(self, frame):
+        if self.closed or self.hangingUp:
+            raise userError(u"Process vat is closed")
+        if len(frame) > self.outbox.msgsize:
+            raise userError(u"Message is too large for process vat"
+                            u" (%d bytes, limit %d)" %
+                            (len(frame), self.outbox.msgsize))
+        self.backlog.append(frame)
+        try:
+            self.flush()
+        except OSError as ose:
+            self.shutdown()
+            raise userError(u"Couldn't send to process vat: %s" %
+                            ose.strerror.decode("utf-8"))
+
+    def flush(self):
+        while self.backlog:
+            try:
+                self.outbox.send(self.backlog[0], 0)
+            except OSError as ose:
+                if ose.errno != errno.EAGAIN:
+                    raise
+                # The outbox is full; wait for it to drain.
+                if not self.flushing:
+                    ruv.pollStart(self.writing, ruv.UV_WRITABLE,
+                                  queueWriteCB)
+                    self.flushing = True
+                return
+            self.backlog.pop(0)
+
+        if self.flushing:
+            ruv.pollStop(self.writing)
+            self.flushing = False
+        if self.hangingUp:
+            self.shutdown()
+
+    def writable(self):
+        try:
+            self.flush()
+        except OSError as ose:
+            self.failed(u"Couldn't send to process vat: %s" %
+                        ose.strerror.decode("utf-8"))
+
+    def readable(self):
+        while not self.closed:
+            try:
+                frame, _ = self.inbox.receive()
+            except OSError as ose:
+                if ose.errno != errno.EAGAIN:
+                    self.failed(u"Couldn't receive from process vat: %s" %
+                                ose.strerror.decode("utf-8"))
+                return
+            try:
+                kind, answer, message = loadFrame(frame)
+                self.received(kind, answer, message)
+            except InvalidWire as iw:
+                log(["vat", "serious"], u"Dropped a bad frame: %s" %
+                    iw.message.decode("utf-8"))
+            except UserException as ue:
+                log(["vat", "serious"], u"Couldn't deliver a frame: %s" %
+                    ue.formatError().decode("utf-8"))
+
+    def received(self, kind, answer, message):
+        pass
+
+    def hangUp(self):
+        """
+        Send a close frame, and shut down once the backlog has drained.
+        """
+
+        if self.closed or self.hangingUp:
+            return
+        self.backlog.append(dumpFrame(FRAME_CLOSE, 0, ""))
+        self.hangingUp = True
+        try:
+            self.flush()
+        except OSError:
+            self.shutdown()
+
+    def failed(self, problem):
+        log(["vat", "serious"], problem)
+        self.shutdown()
+
+    def shutdown(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.backlog = []
+
+        ruv.pollStop(self.reading)
+        if self.flushing:
+            ruv.pollStop(self.writing)
+            self.flushing = False
+        ruv.close(self.reading, queueClosedCB)
+        ruv.close(self.writing, queueClosedCB)
+        for queue in [self.inbox, self.outbox]:
+            try:
+                queue.close()
+            except OSError as ose:
+                log(["vat", "serious"], u"Couldn't close queue: %s" %
+                    ose.strerror.decode("utf-8"))
+
+        self.disconnected()
+
+    def disconnected(self):
+        pass
+
+
+class VatClient(Transport):
+    """
+    The parent's end of a process vat.
+    """
+
+    def __init__(self, vat, inbox, outbox):
+        Transport.__init__(self, vat, inbox, outbox)
+        self.answers = {}
+        self.nextAnswer = 1
+
+    def deliver(self, kind, atom, args, namedArgs, resolver):
+        try:
+            message = dumpMessage(atom, args, namedArgs)
+        except InvalidWire as iw:
+            raise userError(u"Couldn't send to process vat: %s" %
+                            iw.message.decode("utf-8"))
+        answer = 0
+        if resolver is not None:
+            answer = self.nextAnswer
+            self.nextAnswer += 1
+        self.post(dumpFrame(kind, answer, message))
+        if resolver is not None:
+            self.answers[answer] = resolver
+
+    def received(self, kind, answer, message):
+        if kind != FRAME_ANSWER:
+            raise InvalidWire("Parent can't take frame kind %s" % kind)
+        atom, args, _ = loadMessage(message)
+        resolver = self.answers.pop(answer, None)
+        if resolver is None:
+            raise InvalidWire("No such answer %d" % answer)
+        if atom is RESOLVE_1:
+            resolver.resolve(args[0])
+        elif atom is SMASH_1:
+            resolver.smash(args[0])
+        else:
+            raise InvalidWire("Answers must resolve or smash")
+
+    def disconnected(self):
+        answers, self.answers = self.answers, {}
+        for resolver in answers.values():
+            resolver.smash(StrObject(u"Process vat hung up"))
+
+
+@autohelp
+class AnswerSender(Object):
+    """
+    Send an answer back to the parent, once it is ready.
+    """
+
+    def __init__(self, server, answer):
+        self.server = server
+        self.answer = answer
+
+    def toString(self):
+        return u"<answerSender %d>" % self.answer
+
+    def smash(self, problem):
+        message = dumpMessage(SMASH_1, [StrObject(problem)], EMPTY_MAP)
+        self.server.post(dumpFrame(FRAME_ANSWER, self.answer, message))
+
+    @method("Void", "Any")
+    def run(self, ref):
+        if self.server.closed:
+            return
+        ref = resolution(ref)
+        try:
+            if isBroken(ref):
+                assert isinstance(ref, Promise)
+                self.smash(ref.optProblem().toString())
+                return
+            try:
+                message = dumpMessage(RESOLVE_1, [ref], EMPTY_MAP)
+                self.server.post(dumpFrame(FRAME_ANSWER, self.answer,
+                                           message))
+            except InvalidWire as iw:
+                self.smash(u"Couldn't send answer: %s" %
+                           iw.message.decode("utf-8"))
+            except UserException as ue:
+                self.smash(ue.formatError().decode("utf-8"))
+        except UserException as ue:
+            log(["vat", "serious"], u"Couldn't answer parent: %s" %
+                ue.formatError().decode("utf-8"))
+
+
+class VatServer(Transport):
+    """
+    A process vat's end of its queues.
+    """
+
+    def __init__(self, vat, inbox, outbox, root):
+        Transport.__init__(self, vat, inbox, outbox)
+        self.root = root
+
+    def received(self, kind, answer, message):
+        if kind == FRAME_CLOSE:
+            self.shutdown()
+            return
+        atom, args, namedArgs = loadMessage(message)
+        if kind == FRAME_SEND:
+            promise = self.vat.send(self.root, atom, args, namedArgs)
+            reactor = WhenResolvedReactor(AnswerSender(self, answer),
+                                          promise, None, self.vat)
+            self.vat.sendOnly(promise, _WHENMORERESOLVED_1, [reactor],
+                              EMPTY_MAP)
+        elif kind == FRAME_SEND_ONLY:
+            self.vat.sendOnly(self.root, atom, args, namedArgs)
+        else:
+            raise InvalidWire("Process vat can't take frame kind %s" % kind)
+
+
+def serveProcessVat(vat, prefix, root):
+    """
+    Serve `root` to the parent, over the queues named by `prefix`.
+    """
+
+    inbox = openQueue(prefix + ".to", os.O_RDONLY)
+    try:
+        outbox = openQueue(prefix + ".from", os.O_WRONLY)
+    except OSError:
+        inbox.close()
+        raise
+    # Nobody else should open these queues.
+    unlinkQuietly(prefix + ".to")
+    unlinkQuietly(prefix + ".from")
+    return VatServer(vat, inbox, outbox, root)
+
+
+class ProcessVatRef(Promise):
+    """
+    A reference to the root of a vat in another process.
+    """
+
+    def __init__(self, processVat):
+        self.processVat = processVat
+
+    def toString(self):
+        return u"<farRef into process vat (PID %d)>" % self.processVat.pid
+
+    def computeHash(self, depth):
+        raise userError(u"Non-local ref is not hashable")
+
+    def callAll(self, atom, args, namedArgs):
+        raise userError(u"not synchronously callable (%s)" %
+                        atom.repr.decode("utf-8"))
+
+    def sendAll(self, atom, args, namedArgs):
+        p, r = makePromise()
+        self.forwardAll(r, atom, args, namedArgs)
+        return p
+
+    def forwardAll(self, resolver, atom, args, namedArgs):
+        self.processVat.client.deliver(FRAME_SEND, atom, args, namedArgs,
+                                       resolver)
+
+    def sendAllOnly(self, atom, args, namedArgs):
+        self.processVat.client.deliver(FRAME_SEND_ONLY, atom, args,
+                                       namedArgs, None)
+        return NullObject
+
+    def optProblem(self):
+        if self.processVat.client.closed:
+            return StrObject(u"Process vat is closed")
+        return NullObject
+
+    def state(self):
+        if self.processVat.client.closed:
+            return BROKEN
+        return EVENTUAL
+
+    def resolution(self):
+        return self
+
+    def resolutionRef(self):
+        return self
+
+    def isResolved(self):
+        return True
+
+    def commit(self):
+        pass
+
+
+@autohelp
+class ProcessVat(SubProcess):
+    """
+    A vat in a subordinate process of the current process.
+    """
+
+    def __init__(self, vat, process, argv, env, client, prefix):
+        SubProcess.__init__(self, vat, process, argv, env)
+        self.client = client
+        self.prefix = prefix
+        self.root = ProcessVatRef(self)
+
+    def toString(self):
+        if self.pid == self.EMPTY_PID:
+            return u"<process vat (unspawned)>"
+        return u"<process vat (PID %d)>" % self.pid
+
+    def exited(self, exit_status, term_signal):
+        # If the vat died before it could open its queues, then their names
+        # are still around.
+        unlinkQuietly(self.prefix + ".to")
+        unlinkQuietly(self.prefix + ".from")
+        with scopedVat(self.vat):
+            self.client.shutdown()
+        SubProcess.exited(self, exit_status, term_signal)
+
+    @method("Any")
+    def getRoot(self):
+        return self.root
+
+    @method("Void")
+    def close(self):
+        self.client.hangUp()
+
+
+@autohelp
+@audited.DF
+class makeProcessVat(Object):
+    """
+    Run a script in a new vat, in a subordinate process on the current node,
+    and return that vat.
+
+    The script's result is the vat's root, reachable with `.getRoot()`. Only
+    data may be sent to the root or returned from it.
+    """
+
+    def __init__(self, paths):
+        self.paths = paths
+
+    @method("Any", "Bytes", "List")
+    def run(self, script, args):
+        vat = currentVat.get()
+
+        try:
+            executable = os.readlink("/proc/self/exe")
+        except OSError as ose:
+            raise userError(u"makeProcessVat: Couldn't find executable: %s"
+                            % ose.strerror.decode("utf-8"))
+        argv = [executable]
+        for path in self.paths:
+            argv.append("-l")
+            argv.append(path)
+        argv.append("--process-vat")
+        prefixIndex = len(argv)
+        argv.append("")
+        argv.append(script)
+        for arg in unwrapList(args):
+            s = unwrapBytes(arg)
+            assert s is not None, "proven impossible by hand"
+            argv.append(s)
+        env = {}
+        for (k, v) in os.environ.items():
+            env[k] = v
+        packedEnv = [k + '=' + v for (k, v) in env.items()]
+
+        # Claim a pair of queue names which nobody else is using.
+        flags = os.O_CREAT | os.O_EXCL
+        serial = 0
+        while True:
+            prefix = "/typhon.%d.%d" % (os.getpid(), serial)
+            try:
+                inbox = openQueue(prefix + ".from", flags | os.O_RDONLY)
+                break
+            except OSError as ose:
+                if ose.errno != errno.EEXIST:
+                    raise userError(u"makeProcessVat: Couldn't open queue:"
+                                    u" %s" % ose.strerror.decode("utf-8"))
+                serial += 1
+        try:
+            outbox = openQueue(prefix + ".to", flags | os.O_WRONLY)
+        except OSError as ose:
+            inbox.close()
+            unlinkQuietly(prefix + ".from")
+            raise userError(u"makeProcessVat: Couldn't open queue: %s" %
+                            ose.strerror.decode("utf-8"))
+        argv[prefixIndex] = prefix
+
+        client = VatClient(vat, inbox, outbox)
+        try:
+            process = ruv.allocProcess()
+            sub = ProcessVat(vat, process, argv, env, client, prefix)
+            ruv.spawn(vat.uv_loop, process,
+                      file=executable, args=argv, env=packedEnv,
+                      streams=[nullptr(ruv.stream_t)] * 3)
+            sub.retrievePID()
+            return sub
+        except ruv.UVError as uve:
+            client.shutdown()
+            unlinkQuietly(prefix + ".to")
+            unlinkQuietly(prefix + ".from")
+            raise userError(u"makeProcessVat: Couldn't spawn process: %s" %
+                            uve.repr().decode("utf-8"))
@@ -182,9 +182,10 @@ class RefOps(Object):
     def whenBrokenOnly(self, o, callback):
         from typhon.objects.collections.maps import EMPTY_MAP
         vat = currentVat.get()
-        return vat.sendOnly(o, _WHENMORERESOLVED_1,
-                            [WhenBrokenReactor(callback, o, None, vat)],
-                            EMPTY_MAP)
+        vat.sendOnly(o, _WHENMORERESOLVED_1,
+                     [WhenBrokenReactor(callback, o, None, vat)],
+                     EMPTY_MAP)
+        return NullObject
 
     @method("Bool", "Any")
     def isDeepFrozen(self, o):
@@ -358,8 +359,7 @@ class MessageBuffer(object):
             if resolver is None:
                 targRef.sendAllOnly(atom, args, namedArgs)
             else:
-                result = targRef.sendAll(atom, args, namedArgs)
-                resolver.resolve(result)
+                targRef.forwardAll(resolver, atom, args, namedArgs)
         rv = len(self._buf)
         self._buf = []
         return rv
@@ -407,6 +407,16 @@ class Promise(Object):
         self.sendAllOnly(atom, args, namedArgs)
         return NullObject
 
+    def forwardAll(self, resolver, atom, args, namedArgs):
+        """
+        Send a message, resolving `resolver` with the result.
+
+        Refs which can hand the resolver along should do so, instead of
+        making an intermediate promise which only forwards to `resolver`.
+        """
+
+        resolver.resolve(self.sendAll(atom, args, namedArgs))
+
     # Promise API.
 
     def resolutionRef(self):
@@ -469,6 +479,10 @@ class SwitchableRef(Promise):
         self.resolutionRef()
         return self._target.sendAllOnly(atom, args, namedArgs)
 
+    def forwardAll(self, resolver, atom, args, namedArgs):
+        self.resolutionRef()
+        self._target.forwardAll(resolver, atom, args, namedArgs)
+
     def optProblem(self):
         if self.isSwitchable:
             return NullObject
@@ -552,6 +566,13 @@ class BufferingRef(Promise):
             optMsgs.enqueue(None, atom, args, namedArgs)
         return NullObject
 
+    def forwardAll(self, resolver, atom, args, namedArgs):
+        optMsgs = self._buf()
+        if optMsgs is None:
+            resolver.resolve(self)
+        else:
+            optMsgs.enqueue(resolver, atom, args, namedArgs)
+
     def optProblem(self):
         return NullObject
 
@@ -590,6 +611,9 @@ class NearRef(Promise):
     def sendAllOnly(self, atom, args, namedArgs):
         return self.vat.sendOnly(self.target, atom, args, namedArgs)
 
+    def forwardAll(self, resolver, atom, args, namedArgs):
+        self.vat.forward(resolver, self.target, atom, args, namedArgs)
+
     def optProblem(self):
         return NullObject
 
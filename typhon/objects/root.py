@@ -62,6 +62,42 @@ def addTrail(ue, target, atom, args):
     ue.trail.append(u"In %s.%s(%s):" % (target.toQuote(), atom.verb,
                                         argString))
 
+# Sameness hashes look at most this many levels into an object graph.
+HASH_DEPTH = 7
+
+
+class HashMemo(object):
+    """
+    The sameness hashes of a settled object, by depth.
+
+    Settled objects can't change, so composites which would otherwise walk
+    their contents every time they're hashed keep one of these.
+    """
+
+    def __init__(self):
+        self.known = 0
+        self.hashes = [0] * (HASH_DEPTH + 1)
+
+    def has(self, depth):
+        return 0 <= depth <= HASH_DEPTH and bool(self.known & (1 << depth))
+
+    def remember(self, depth, h):
+        if 0 <= depth <= HASH_DEPTH:
+            self.known |= 1 << depth
+            self.hashes[depth] = h
+
+
+def memoizeHash(memo, depth, h):
+    """
+    Remember the hash of a settled object, returning the memo to keep.
+    """
+
+    if memo is None:
+        memo = HashMemo()
+    memo.remember(depth, h)
+    return memo
+
+
 class Object(object):
     """
     A Monte object.
@@ -120,7 +156,10 @@ class Object(object):
         hashed, samenessHash = self._samenessHash
 
         if not hashed:
-            self._samenessHash = _, samenessHash = True, self.computeHash(7)
+            samenessHash = self.computeHash(HASH_DEPTH)
+            # Until we're settled, our hash could still change.
+            if self.isSettled():
+                self._samenessHash = True, samenessHash
         return samenessHash
 
     def call(self, verb, arguments, namedArgs=None):
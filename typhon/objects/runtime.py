@@ -3,6 +3,7 @@ from rpython.rlib.rerased import new_erasing_pair
 
 # from typhon import ruv
 from typhon.autohelp import autohelp, method
+from typhon.nano.bytecode import BytecodeObject
 from typhon.nano.interp import InterpObject
 from typhon.objects.collections.lists import wrapList
 from typhon.objects.collections.maps import monteMap
@@ -54,6 +55,8 @@ class Heap(Object):
     def accountObject(self, obj):
         if isinstance(obj, InterpObject):
             name = obj.displayName
+        elif isinstance(obj, BytecodeObject):
+            name = obj.displayName
         else:
             name = obj.__class__.__name__.decode("utf-8")
         if name not in self.buckets:
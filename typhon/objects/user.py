@@ -27,7 +27,7 @@ from typhon.objects.collections.lists import wrapList
 from typhon.objects.data import StrObject
 from typhon.objects.ejectors import Ejector
 from typhon.objects.printers import Printer
-from typhon.objects.root import Object
+from typhon.objects.root import Object, memoizeHash
 from typhon.profile import profileTyphon
 
 # XXX AuditionStamp, Audition guard
@@ -208,10 +208,30 @@ class AuditClipboard(object):
     She's touring the facility / And picking up slack
     """
 
-    def __init__(self, fqn, ast):
+    # Kernel-AST nodes for the audited object; built on first audition.
+    ast = None
+
+    def __init__(self, fqn, mast):
         self.reportCabinet = []
         self.fqn = fqn
-        self.ast = ast
+        self.mast = mast
+
+    def getMAST(self):
+        return self.mast
+
+    def getAST(self):
+        """
+        Build the kernel-AST form of the object expression, if it hasn't been
+        built already.
+
+        Most objects are never audited beyond their static stamps, so this
+        conversion is deferred until an auditor actually wants to look.
+        """
+
+        if self.ast is None:
+            from typhon.nano.mast import BuildKernelNodes
+            self.ast = BuildKernelNodes().visitExpr(self.getMAST())
+        return self.ast
 
     def getReport(self, auditors, guards):
         """
@@ -245,7 +265,7 @@ class AuditClipboard(object):
         Do an audit, make a report from the results.
         """
 
-        with Audition(self.fqn, self.ast, guards) as audition:
+        with Audition(self.fqn, self.getAST(), guards) as audition:
             for a in auditors:
                 audition.ask(a)
         return audition.prepareReport(auditors)
@@ -271,6 +291,11 @@ class UserObjectHelper(object):
     _immutable_fields_ = "report",
     report = None
 
+    # Selfless Transparent objects can't change once they're settled, so
+    # they remember both that and their sameness hashes.
+    _isSettled = False
+    _hashMemo = None
+
     def toString(self):
         # Easily the worst part of the entire stringifying experience. We must
         # be careful to not recurse here.
@@ -298,19 +323,38 @@ class UserObjectHelper(object):
             return self.report.getStamps()
 
     def isSettled(self, sofar=None):
+        if self._isSettled:
+            return True
+
         if selfless in self.auditorStamps():
             if transparentStamp in self.auditorStamps():
                 from typhon.objects.collections.maps import EMPTY_MAP
                 if sofar is None:
                     sofar = {self: None}
                 # Uncall and recurse.
-                return self.recvNamed(_UNCALL_0, [],
-                                      EMPTY_MAP).isSettled(sofar=sofar)
+                settled = self.recvNamed(_UNCALL_0, [],
+                                         EMPTY_MAP).isSettled(sofar=sofar)
+                if settled:
+                    self._isSettled = True
+                return settled
             # XXX Semitransparent support goes here
 
         # Well, we're resolved, so I guess that we're good!
         return True
 
+    def computeHash(self, depth):
+        stamps = self.auditorStamps()
+        if depth > 0 and selfless in stamps and transparentStamp in stamps:
+            memo = self._hashMemo
+            if memo is not None and memo.has(depth):
+                return memo.hashes[depth]
+            from typhon.objects.collections.maps import EMPTY_MAP
+            h = self.recvNamed(_UNCALL_0, [], EMPTY_MAP).computeHash(depth)
+            if self.isSettled():
+                self._hashMemo = memoizeHash(memo, depth, h)
+            return h
+        return Object.computeHash(self, depth)
+
     def recvNamed(self, atom, args, namedArgs):
         method = self.getMethod(atom)
         if method:
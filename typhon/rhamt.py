@@ -0,0 +1,248 @@
+"""
+Persistent ordered maps, built from hash array mapped tries.
+
+The trie maps each key to its position in a persistent vector of items,
+which remembers insertion order. Removing a key leaves a hole in the vector;
+once there are too many holes, the map is rebuilt. Updates copy only the path
+to the changed node, so putting and removing are O(log32 n) and the old map
+stays valid.
+
+See Bagwell's "Ideal Hash Trees".
+
+Like t.rfinger, we don't know the key type; instead, we build a class for
+each kind of key equality and hashing.
+"""
+
+from typhon.rvector import emptyVector
+
+BITS = 5
+MASK = (1 << BITS) - 1
+
+
+def bitCount(i):
+    """
+    Count the set bits of a 32-bit bitmap.
+    """
+
+    i = i - ((i >> 1) & 0x55555555)
+    i = (i & 0x33333333) + ((i >> 2) & 0x33333333)
+    return (((i + (i >> 4)) & 0x0f0f0f0f) * 0x01010101 & 0xffffffff) >> 24
+
+
+def makeOrderedTrieClass(eq, hashKey):
+    """
+    Produce an ordered trie class for keys which are compared with `eq` and
+    hashed with `hashKey`.
+    """
+
+    class Node(object):
+        _immutable_ = True
+
+    class Entry(Node):
+        _immutable_ = True
+
+        def __init__(self, h, key, index):
+            self.h = h
+            self.key = key
+            self.index = index
+
+    class Collision(Node):
+        """
+        Entries whose hashes are entirely equal.
+        """
+
+        _immutable_ = True
+
+        def __init__(self, h, entries):
+            self.h = h
+            self.entries = entries
+
+    class Bitmap(Node):
+        _immutable_ = True
+
+        def __init__(self, bitmap, children):
+            self.bitmap = bitmap
+            self.children = children
+
+    EMPTY_ROOT = Bitmap(0, [])
+
+    def chunk(h, shift):
+        return (h >> shift) & MASK
+
+    def find(node, h, key):
+        shift = 0
+        while True:
+            if isinstance(node, Bitmap):
+                bit = 1 << chunk(h, shift)
+                if not node.bitmap & bit:
+                    return -1
+                node = node.children[bitCount(node.bitmap & (bit - 1))]
+                shift += BITS
+            elif isinstance(node, Entry):
+                if node.h == h and eq(node.key, key):
+                    return node.index
+                return -1
+            else:
+                assert isinstance(node, Collision)
+                if node.h == h:
+                    for entry in node.entries:
+                        if eq(entry.key, key):
+                            return entry.index
+                return -1
+
+    def merge(first, firstHash, second, secondHash, shift):
+        """
+        Put two nodes with different hashes under a new branch.
+        """
+
+        i = chunk(firstHash, shift)
+        j = chunk(secondHash, shift)
+        if i == j:
+            return Bitmap(1 << i, [merge(first, firstHash, second, secondHash,
+                                         shift + BITS)])
+        elif i < j:
+            return Bitmap((1 << i) | (1 << j), [first, second])
+        else:
+            return Bitmap((1 << i) | (1 << j), [second, first])
+
+    def insert(node, shift, entry):
+        """
+        Add an entry whose key isn't yet in the trie.
+        """
+
+        if isinstance(node, Bitmap):
+            bit = 1 << chunk(entry.h, shift)
+            index = bitCount(node.bitmap & (bit - 1))
+            children = node.children[:]
+            if node.bitmap & bit:
+                children[index] = insert(children[index], shift + BITS, entry)
+                return Bitmap(node.bitmap, children)
+            children.insert(index, entry)
+            return Bitmap(node.bitmap | bit, children)
+        elif isinstance(node, Entry):
+            if node.h == entry.h:
+                return Collision(node.h, [node, entry])
+            return merge(node, node.h, entry, entry.h, shift)
+        else:
+            assert isinstance(node, Collision)
+            if node.h == entry.h:
+                return Collision(node.h, node.entries + [entry])
+            return merge(node, node.h, entry, entry.h, shift)
+
+    def remove(node, shift, h, key):
+        """
+        Remove a key, returning None if nothing is left.
+        """
+
+        if isinstance(node, Bitmap):
+            bit = 1 << chunk(h, shift)
+            if not node.bitmap & bit:
+                return node
+            index = bitCount(node.bitmap & (bit - 1))
+            child = node.children[index]
+            new = remove(child, shift + BITS, h, key)
+            if new is child:
+                return node
+            children = node.children[:]
+            if new is None:
+                if len(children) == 1:
+                    return None
+                del children[index]
+                return Bitmap(node.bitmap & ~bit, children)
+            children[index] = new
+            return Bitmap(node.bitmap, children)
+        elif isinstance(node, Entry):
+            if node.h == h and eq(node.key, key):
+                return None
+            return node
+        else:
+            assert isinstance(node, Collision)
+            if node.h != h:
+                return node
+            entries = [entry for entry in node.entries
+                       if not eq(entry.key, key)]
+            if len(entries) == len(node.entries):
+                return node
+            elif len(entries) == 1:
+                return entries[0]
+            return Collision(node.h, entries)
+
+    class Item(object):
+        _immutable_ = True
+
+        def __init__(self, key, value):
+            self.key = key
+            self.value = value
+
+    class OrderedTrie(object):
+        """
+        An immutable map which remembers insertion order.
+        """
+
+        _immutable_ = True
+
+        def __init__(self, root, items, size):
+            self.root = root
+            # A vector of Items, with None where keys have been removed.
+            self.items = items
+            self.size = size
+
+        def get(self, key, default):
+            index = find(self.root, hashKey(key), key)
+            if index < 0:
+                return default
+            return self.items.get(index).value
+
+        def contains(self, key):
+            return find(self.root, hashKey(key), key) >= 0
+
+        def put(self, key, value):
+            h = hashKey(key)
+            index = find(self.root, h, key)
+            if index >= 0:
+                # Keep the original key and its place in line.
+                item = Item(self.items.get(index).key, value)
+                return OrderedTrie(self.root, self.items.put(index, item),
+                                   self.size)
+            index = self.items.size
+            root = insert(self.root, 0, Entry(h, key, index))
+            return OrderedTrie(root, self.items.push(Item(key, value)),
+                               self.size + 1)
+
+        def remove(self, key):
+            h = hashKey(key)
+            index = find(self.root, h, key)
+            if index < 0:
+                return self
+            root = remove(self.root, 0, h, key)
+            if root is None:
+                return emptyTrie()
+            rv = OrderedTrie(root, self.items.put(index, None), self.size - 1)
+            if rv.items.size > 2 * rv.size + 32:
+                # Too many holes; start afresh.
+                return trieFromItems(rv.iteritems())
+            return rv
+
+        def iteritems(self):
+            """
+            The keys and values, in order, as a list of pairs.
+            """
+
+            rv = []
+            for item in self.items.slice(0, self.items.size):
+                if item is not None:
+                    rv.append((item.key, item.value))
+            return rv
+
+    def emptyTrie():
+        return OrderedTrie(EMPTY_ROOT, emptyVector(), 0)
+
+    def trieFromItems(pairs):
+        trie = emptyTrie()
+        for key, value in pairs:
+            trie = trie.put(key, value)
+        return trie
+
+    OrderedTrie.empty = staticmethod(emptyTrie)
+    OrderedTrie.fromItems = staticmethod(trieFromItems)
+    return OrderedTrie
@@ -13,6 +13,7 @@ import sys
 from functools import wraps
 
 from rpython.rlib import _rsocket_rffi as s
+from rpython.rlib.debug import debug_print
 from rpython.rlib.objectmodel import current_object_addr_as_int, specialize
 from rpython.rlib.rarithmetic import intmask
 from rpython.rlib.rawstorage import alloc_raw_storage, free_raw_storage
@@ -20,6 +21,7 @@ from rpython.rtyper.lltypesystem import lltype, rffi
 from rpython.rtyper.tool import rffi_platform
 from rpython.translator.tool.cbuild import ExternalCompilationInfo
 
+from typhon.errors import UserException
 from typhon.log import log
 
 
@@ -86,6 +88,7 @@ class CConfig:
     timer_t = rffi_platform.Struct("uv_timer_t", [("data", rffi.VOIDP)])
     prepare_t = rffi_platform.Struct("uv_prepare_t", [("data", rffi.VOIDP)])
     idle_t = rffi_platform.Struct("uv_idle_t", [("data", rffi.VOIDP)])
+    poll_t = rffi_platform.Struct("uv_poll_t", [("data", rffi.VOIDP)])
     process_options_t = rffi_platform.Struct("uv_process_options_t",
                                      [("file", rffi.CCHARP),
                                       ("args", rffi.CCHARPP),
@@ -129,6 +132,7 @@ handle_tp = lltype.Ptr(cConfig["handle_t"])
 timer_tp = rffi.lltype.Ptr(cConfig["timer_t"])
 prepare_tp = rffi.lltype.Ptr(cConfig["prepare_t"])
 idle_tp = rffi.lltype.Ptr(cConfig["idle_t"])
+poll_tp = rffi.lltype.Ptr(cConfig["poll_t"])
 process_options_tp = rffi.lltype.Ptr(cConfig["process_options_t"])
 stdio_container_t = cConfig["stdio_container_t"]
 stdio_container_tp = rffi.lltype.Ptr(cConfig["stdio_container_t"])
@@ -242,6 +246,7 @@ stashFS, unstashFS, unstashingFS = stashFor("fs", fs_tp)
 stashGAI, unstashGAI, unstashingGAI = stashFor("gai", gai_tp)
 stashProcess, unstashProcess, unstashingProcess = stashFor("process",
                                                            process_tp)
+stashPoll, unstashPoll, unstashingPoll = stashFor("poll", poll_tp)
 
 
 @specialize.ll()
@@ -360,6 +365,11 @@ def closeAndFree(handleish):
     uv_close(rffi.cast(handle_tp, handleish), closeAndFreeCB)
 def closeAndFreeCB(handleish):
     free(handleish)
+uv_unref = rffi.llexternal("uv_unref", [handle_tp], lltype.Void,
+                           compilation_info=eci)
+@specialize.ll()
+def unref(handleish):
+    uv_unref(rffi.cast(handle_tp, handleish))
 
 
 timer_cb = rffi.CCallback([timer_tp], lltype.Void)
@@ -384,21 +394,25 @@ prepare_init = rffi.llexternal("uv_prepare_init", [loop_tp, prepare_tp],
                                rffi.INT, compilation_info=eci)
 prepare_start = rffi.llexternal("uv_prepare_start", [prepare_tp, prepare_cb],
                                 rffi.INT, compilation_info=eci)
+prepareStart = checking("prepare_start", prepare_start)
 prepare_stop = rffi.llexternal("uv_prepare_stop", [prepare_tp],
                                rffi.INT, compilation_info=eci)
+prepareStop = checking("prepare_stop", prepare_stop)
 
-def alloc_prepare():
-    return lltype.malloc(cConfig["prepare_t"], flavor="raw", zero=True)
+def alloc_prepare(loop):
+    prepare = lltype.malloc(cConfig["prepare_t"], flavor="raw", zero=True)
+    check("prepare_init", prepare_init(loop, prepare))
+    return prepare
 
 
 idle_cb = rffi.CCallback([idle_tp], lltype.Void)
 
 idle_init = rffi.llexternal("uv_idle_init", [loop_tp, idle_tp], rffi.INT,
                             compilation_info=eci)
-idle_start = rffi.llexternal("uv_idle_start", [loop_tp, idle_tp], rffi.INT,
+idle_start = rffi.llexternal("uv_idle_start", [idle_tp, idle_cb], rffi.INT,
                             compilation_info=eci)
 idleStart = checking("idle_start", idle_start)
-idle_stop = rffi.llexternal("uv_idle_stop", [loop_tp], rffi.INT,
+idle_stop = rffi.llexternal("uv_idle_stop", [idle_tp], rffi.INT,
                             compilation_info=eci)
 idleStop = checking("idle_stop", idle_stop)
 
@@ -408,6 +422,26 @@ def alloc_idle(loop):
     return idle
 
 
+UV_READABLE = 1
+UV_WRITABLE = 2
+
+poll_cb = rffi.CCallback([poll_tp, rffi.INT, rffi.INT], lltype.Void)
+
+poll_init = rffi.llexternal("uv_poll_init", [loop_tp, poll_tp, rffi.INT],
+                            rffi.INT, compilation_info=eci)
+poll_start = rffi.llexternal("uv_poll_start", [poll_tp, rffi.INT, poll_cb],
+                             rffi.INT, compilation_info=eci)
+pollStart = checking("poll_start", poll_start)
+poll_stop = rffi.llexternal("uv_poll_stop", [poll_tp], rffi.INT,
+                            compilation_info=eci)
+pollStop = checking("poll_stop", poll_stop)
+
+def alloc_poll(loop, fd):
+    poll = lltype.malloc(cConfig["poll_t"], flavor="raw", zero=True)
+    check("poll_init", poll_init(loop, poll, fd))
+    return poll
+
+
 class UVStream(object):
     """
     Wrapper for libuv stream_t structs.
@@ -426,11 +460,65 @@ class UVStream(object):
         if not self._refCount:
             streamJanitor.streams.append(self._stream)
 
-class StreamJanitor(object):
+class Chore(object):
+    """
+    Maintenance work, which runs outside of turns.
+
+    Chores run from libuv callbacks; anything which they raise is logged and
+    dropped.
+    """
+
+    def run(self):
+        pass
+
+
+class Housekeeping(object):
+    """
+    Maintenance work which runs on libuv's own handle, so that turns never
+    pay for it.
+
+    Chores run on a prepare handle, each time the loop is about to poll for
+    I/O. The handle doesn't keep the loop alive on its own. Between polls,
+    the main loop runs them directly.
+    """
+
+    def __init__(self):
+        self.chores = []
+        self.prepare = lltype.nullptr(cConfig["prepare_t"])
+
+    def register(self, chore):
+        self.chores.append(chore)
+
+    def install(self, loop):
+        self.prepare = alloc_prepare(loop)
+        prepareStart(self.prepare, prepareCB)
+        unref(self.prepare)
+
+    def runChores(self):
+        for chore in self.chores:
+            try:
+                chore.run()
+            except UVError as uve:
+                debug_print("Caught libuv error during housekeeping:",
+                            uve.repr())
+            except UserException as ue:
+                debug_print("Caught exception during housekeeping:",
+                            ue.formatError())
+
+housekeeping = Housekeeping()
+
+def prepareCB(prepare):
+    housekeeping.runChores()
+
+
+class StreamJanitor(Chore):
 
     def __init__(self):
         self.streams = []
 
+    def run(self):
+        self.cleanup()
+
     def cleanup(self):
         if not self.streams:
             return
@@ -441,6 +529,7 @@ class StreamJanitor(object):
         self.streams = []
 
 streamJanitor = StreamJanitor()
+housekeeping.register(streamJanitor)
 
 def wrapStream(stream, refCount):
     wrapper = UVStream(stream, refCount)
@@ -732,7 +821,8 @@ def cleanup():
     """
     Clean up any libuv resources that have been finalized.
 
-    Must be called outside of evaluation, ideally during other I/O work.
+    Must be called outside of evaluation, ideally during other I/O work. Once
+    housekeeping is installed on the loop, this happens automatically.
     """
 
     streamJanitor.cleanup()
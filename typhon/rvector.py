@@ -0,0 +1,171 @@
+"""
+Persistent vectors, as practiced by Clojure.
+
+A vector is a trie of 32-way nodes, plus a tail of up to 32 values which
+haven't been pushed into the trie yet. Updates copy only the path from the
+root to the changed leaf, so pushing and putting are O(log32 n) and the old
+vector stays valid.
+
+See Bagwell's "Ideal Hash Trees" and Hickey's PersistentVector.java.
+"""
+
+BITS = 5
+WIDTH = 1 << BITS
+MASK = WIDTH - 1
+
+
+class Node(object):
+    _immutable_ = True
+
+
+class Branch(Node):
+
+    _immutable_ = True
+
+    def __init__(self, children):
+        self.children = children
+
+
+class Leaf(Node):
+
+    _immutable_ = True
+
+    def __init__(self, values):
+        self.values = values
+
+
+def newPath(level, node):
+    """
+    Wrap a node in enough branches to hang it from the given level.
+    """
+
+    if level == 0:
+        return node
+    return Branch([newPath(level - BITS, node)])
+
+
+class PersistentVector(object):
+    """
+    An immutable vector.
+    """
+
+    _immutable_ = True
+
+    def __init__(self, size, shift, root, tail):
+        self.size = size
+        self.shift = shift
+        self.root = root
+        self.tail = tail
+
+    def tailOffset(self):
+        if self.size < WIDTH:
+            return 0
+        return ((self.size - 1) >> BITS) << BITS
+
+    def leafFor(self, i):
+        """
+        The values of the leaf holding index i.
+        """
+
+        if i >= self.tailOffset():
+            return self.tail
+        node = self.root
+        level = self.shift
+        while level > 0:
+            assert isinstance(node, Branch)
+            node = node.children[(i >> level) & MASK]
+            level -= BITS
+        assert isinstance(node, Leaf)
+        return node.values
+
+    def get(self, i):
+        if not 0 <= i < self.size:
+            raise IndexError(i)
+        return self.leafFor(i)[i & MASK]
+
+    def push(self, value):
+        if self.size - self.tailOffset() < WIDTH:
+            return PersistentVector(self.size + 1, self.shift, self.root,
+                                    self.tail + [value])
+
+        # The tail is full; hang it in the trie and start a new one.
+        leaf = Leaf(self.tail)
+        if (self.size >> BITS) > (1 << self.shift):
+            # The trie is full, too; grow a new root.
+            root = Branch([self.root, newPath(self.shift, leaf)])
+            shift = self.shift + BITS
+        else:
+            root = self.pushLeaf(self.shift, self.root, leaf)
+            shift = self.shift
+        return PersistentVector(self.size + 1, shift, root, [value])
+
+    def pushLeaf(self, level, parent, leaf):
+        assert isinstance(parent, Branch)
+        index = ((self.size - 1) >> level) & MASK
+        children = parent.children[:]
+        if level == BITS:
+            node = leaf
+        elif index < len(children):
+            node = self.pushLeaf(level - BITS, children[index], leaf)
+        else:
+            node = newPath(level - BITS, leaf)
+        if index < len(children):
+            children[index] = node
+        else:
+            children.append(node)
+        return Branch(children)
+
+    def put(self, i, value):
+        """
+        Replace the value at index i, or push it if i is one past the end.
+        """
+
+        if i == self.size:
+            return self.push(value)
+        if not 0 <= i < self.size:
+            raise IndexError(i)
+        if i >= self.tailOffset():
+            tail = self.tail[:]
+            tail[i & MASK] = value
+            return PersistentVector(self.size, self.shift, self.root, tail)
+        root = putInto(self.shift, self.root, i, value)
+        return PersistentVector(self.size, self.shift, root, self.tail)
+
+    def slice(self, start, stop):
+        """
+        The values from start to stop, as a list.
+        """
+
+        rv = []
+        i = start
+        while i < stop:
+            values = self.leafFor(i)
+            j = i & MASK
+            end = min(len(values), j + stop - i)
+            rv.extend(values[j:end])
+            i += end - j
+        return rv
+
+
+def putInto(level, node, i, value):
+    if level == 0:
+        assert isinstance(node, Leaf)
+        values = node.values[:]
+        values[i & MASK] = value
+        return Leaf(values)
+    assert isinstance(node, Branch)
+    children = node.children[:]
+    index = (i >> level) & MASK
+    children[index] = putInto(level - BITS, children[index], i, value)
+    return Branch(children)
+
+
+def emptyVector():
+    return PersistentVector(0, BITS, Branch([]), [])
+
+
+def vectorFromList(values):
+    vector = emptyVector()
+    for value in values:
+        vector = vector.push(value)
+    return vector
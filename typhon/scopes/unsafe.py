@@ -24,6 +24,7 @@ from typhon.objects.networking.endpoints import (makeTCP4ClientEndpoint,
 from typhon.objects.networking.stdio import (makeStdErr, makeStdIn,
         makeStdOut, stdio)
 from typhon.objects.processes import CurrentProcess, makeProcess
+from typhon.objects.processvats import makeProcessVat
 from typhon.objects.root import Object, audited
 from typhon.objects.runtime import CurrentRuntime
 from typhon.objects.slots import finalize
@@ -60,6 +61,7 @@ def unsafeScope(config):
         u"getAddrInfo": getAddrInfo(),
         u"makeFileResource": makeFileResource(),
         u"makeProcess": makeProcess(),
+        u"makeProcessVat": makeProcessVat(config.libraryPaths),
         u"makeStdErr": makeStdErr(),
         u"makeStdIn": makeStdIn(),
         u"makeStdOut": makeStdOut(),
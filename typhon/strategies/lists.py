@@ -8,6 +8,13 @@ from typhon.objects.data import (BytesObject, CharObject, IntObject,
                                  unwrapInt, unwrapStr)
 from typhon.objects.refs import UnconnectedRef
 from typhon.rstrategies import rstrategies
+from typhon.rvector import vectorFromList
+
+
+# Immutable lists which grow past this many elements by appending or putting
+# are kept in persistent vectors instead, so that each update doesn't copy
+# the whole list.
+VECTOR_THRESHOLD = 64
 
 
 class Strategy(object):
@@ -23,6 +30,126 @@ class Strategy(object):
     def strategy_factory(self):
         return strategyFactory
 
+    # Immutable lists share these with each other, so they must not be
+    # mutated after the copy is made.
+
+    def fetch_shared(self, w_self):
+        """
+        The boxed elements of w_self, which the caller must not mutate.
+        """
+
+        return self.fetch_all(w_self)
+
+    def box_all(self, w_self):
+        """
+        The boxed elements of the immutable w_self, which the caller must not
+        mutate.
+
+        Unboxed storage would box the elements afresh on every fetch, so
+        w_self is switched to generic storage of the boxed elements instead.
+        They're boxed only once, and not kept twice.
+        """
+
+        elements = self.fetch_all(w_self)
+        generic = self.strategy_factory().strategy_singleton_instance(
+            GenericListStrategy)
+        self.strategy_factory().set_strategy(w_self, generic)
+        generic.set_storage(w_self, elements)
+        return elements
+
+    def adopt_all(self, w_self, elements):
+        """
+        Store elements into w_self, which has just been given this strategy.
+
+        The caller hands over elements, and must not use it again, so
+        strategies which keep boxed elements may keep it without copying.
+        """
+
+        self._initialize_storage(w_self, len(elements))
+        if elements:
+            self.store_all(w_self, elements)
+
+    def copy_into(self, w_self, w_new, start, stop):
+        """
+        Give the fresh w_new this strategy, holding the elements of w_self
+        from start to stop, without boxing them.
+        """
+
+        self.strategy_factory().set_strategy(w_new, self)
+        self._initialize_storage(w_new, stop - start)
+
+    def slice_into(self, w_self, w_new, start, stop):
+        """
+        Like copy_into(), but w_new may share storage with w_self, and so
+        must never be mutated.
+        """
+
+        self.copy_into(w_self, w_new, start, stop)
+
+    def concat_into(self, w_self, w_other, w_new):
+        """
+        Give the fresh w_new this strategy, holding the elements of w_self
+        and then those of w_other, which must also have this strategy.
+        """
+
+        self.strategy_factory().set_strategy(w_new, self)
+        self._initialize_storage(w_new,
+                                 self.size(w_self) + self.size(w_other))
+
+    def append_into(self, w_self, w_new, value):
+        """
+        Give the fresh w_new this strategy, holding the elements of w_self
+        and then value, which this strategy must be able to handle.
+        """
+
+        self.strategy_factory().set_strategy(w_new, self)
+        self._initialize_storage(w_new, self.size(w_self) + 1)
+
+    def put_into(self, w_self, w_new, index0, value):
+        """
+        Give the fresh w_new the elements of w_self, but with value at
+        index0, which this strategy must be able to handle.
+        """
+
+        self.copy_into(w_self, w_new, 0, self.size(w_self))
+        self.store(w_new, index0, value)
+
+
+class StorageCopying(object):
+    """
+    Copying for strategies which keep their elements in a list.
+    """
+
+    def copy_into(self, w_self, w_new, start, stop):
+        self.strategy_factory().set_strategy(w_new, self)
+        self.set_storage(w_new, self.get_storage(w_self)[start:stop])
+
+    def concat_into(self, w_self, w_other, w_new):
+        if self.size(w_self) >= VECTOR_THRESHOLD:
+            vectorStrategy.extend_into(w_self, w_new,
+                                       self.fetch_shared(w_other))
+            return
+        self.strategy_factory().set_strategy(w_new, self)
+        self.set_storage(w_new, self.get_storage(w_self) +
+                                self.get_storage(w_other))
+
+    def append_into(self, w_self, w_new, value):
+        if self.size(w_self) >= VECTOR_THRESHOLD:
+            vectorStrategy.extend_into(w_self, w_new, [value])
+            return
+        self.strategy_factory().set_strategy(w_new, self)
+        self.set_storage(w_new, self.get_storage(w_self) +
+                                [self._unwrap(value)])
+
+    def put_into(self, w_self, w_new, index0, value):
+        size = self.size(w_self)
+        if size >= VECTOR_THRESHOLD:
+            vector = vectorFromList(self.fetch_shared(w_self))
+            vectorStrategy.adopt(w_new, vector.put(index0, value), 0, size)
+            return
+        self.copy_into(w_self, w_new, 0, size)
+        self.store(w_new, index0, value)
+
 
 @rstrategies.strategy()
 class GenericListStrategy(Strategy):
@@ -31,10 +158,23 @@ class GenericListStrategy(Strategy):
     """
 
     import_from_mixin(rstrategies.GenericStrategy)
+    import_from_mixin(StorageCopying)
 
     def default_value(self):
         return None
 
+    def fetch_shared(self, w_self):
+        # The storage is already boxed.
+        return self.get_storage(w_self)
+
+    box_all = fetch_shared
+
+    def store_all(self, w_self, elements):
+        self.set_storage(w_self, elements[:])
+
+    def adopt_all(self, w_self, elements):
+        self.set_storage(w_self, elements)
+
 
 @rstrategies.strategy(generalize=[GenericListStrategy])
 class NullListStrategy(Strategy):
@@ -70,6 +210,7 @@ def makeUnboxedListStrategy(cls, box, unbox, exemplar):
         """
 
         import_from_mixin(rstrategies.SingleTypeStrategy)
+        import_from_mixin(StorageCopying)
 
         contained_type = cls
         box = box
@@ -117,6 +258,106 @@ class EmptyListStrategy(Strategy):
     import_from_mixin(rstrategies.EmptyStrategy)
 
 
+class VectorStorage(object):
+    """
+    A window onto a persistent vector.
+    """
+
+    _immutable_ = True
+
+    def __init__(self, vector, start, stop):
+        self.vector = vector
+        self.start = start
+        self.stop = stop
+
+
+class VectorListStrategy(Strategy):
+    """
+    A large immutable list, kept in a persistent vector.
+
+    Lists are only put into this strategy by the *_into() methods, and never
+    by the factory, since it can't be mutated in place. Copies made with
+    copy_into() are flat and generic, so that they may be mutated.
+    """
+
+    def adopt(self, w_new, vector, start, stop):
+        self.strategy_factory().set_strategy(w_new, self)
+        self.set_storage(w_new, VectorStorage(vector, start, stop))
+
+    def _check_can_handle(self, index0, value):
+        return True
+
+    def size(self, w_self):
+        storage = self.get_storage(w_self)
+        return storage.stop - storage.start
+
+    def fetch(self, w_self, index0):
+        self.check_index_fetch(w_self, index0)
+        storage = self.get_storage(w_self)
+        return storage.vector.get(storage.start + index0)
+
+    def slice(self, w_self, start, end):
+        storage = self.get_storage(w_self)
+        return storage.vector.slice(storage.start + start,
+                                    storage.start + end)
+
+    def copy_into(self, w_self, w_new, start, stop):
+        generic = self.strategy_factory().strategy_singleton_instance(
+            GenericListStrategy)
+        self.strategy_factory().set_strategy(w_new, generic)
+        generic.set_storage(w_new, self.slice(w_self, start, stop))
+
+    def slice_into(self, w_self, w_new, start, stop):
+        if stop - start < VECTOR_THRESHOLD:
+            # Don't keep a big vector alive for the sake of a small slice.
+            self.copy_into(w_self, w_new, start, stop)
+            return
+        storage = self.get_storage(w_self)
+        self.adopt(w_new, storage.vector, storage.start + start,
+                   storage.start + stop)
+
+    def box_all(self, w_self):
+        # The vector is already boxed; flattening it for good would lose the
+        # sharing.
+        return self.fetch_shared(w_self)
+
+    def extend_into(self, w_self, w_new, values):
+        """
+        Give the fresh w_new this strategy, holding the elements of w_self,
+        which may have any strategy, and then values.
+        """
+
+        strategy = self.strategy_factory().get_strategy(w_self)
+        if strategy is self:
+            storage = self.get_storage(w_self)
+            vector = storage.vector
+            start = storage.start
+            stop = storage.stop
+        else:
+            vector = vectorFromList(strategy.fetch_shared(w_self))
+            start = 0
+            stop = vector.size
+        for value in values:
+            # Putting at the end of our window pushes onto the vector, or
+            # else overwrites values which aren't visible to us.
+            vector = vector.put(stop, value)
+            stop += 1
+        self.adopt(w_new, vector, start, stop)
+
+    def concat_into(self, w_self, w_other, w_new):
+        self.extend_into(w_self, w_new, self.fetch_shared(w_other))
+
+    def append_into(self, w_self, w_new, value):
+        self.extend_into(w_self, w_new, [value])
+
+    def put_into(self, w_self, w_new, index0, value):
+        storage = self.get_storage(w_self)
+        self.adopt(w_new, storage.vector.put(storage.start + index0, value),
+                   storage.start, storage.stop)
+
+vectorStrategy = VectorListStrategy()
+
+
 class StrategyFactory(rstrategies.StrategyFactory):
     pass
 
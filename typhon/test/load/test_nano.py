@@ -0,0 +1,82 @@
+from unittest import TestCase
+
+from rpython.rlib.rbigint import rbigint
+
+from typhon.load.nano import (InvalidMAST, MASTStream, MASTWriter, dumpMAST,
+                              loadMASTBytes)
+from typhon.nano.mast import MastIR
+
+
+SIMPLE_DEF = (
+    "Mont\xe0MAST\x00" # magic
+    "LN"               # null
+    "N\x03Int"         # Int
+    "PF\x01x\x01"      # x :Int
+    "LI\x54"           # 42
+    "D\x00\x00\x02"    # def x :Int := 42
+)
+
+
+class TestMASTWriter(TestCase):
+
+    def testVarIntRoundTrip(self):
+        w = MASTWriter()
+        for i in [0, 1, 0x7f, 0x80, 300, 2 ** 40]:
+            w.writeInt(i)
+        stream = MASTStream(w.getvalue())
+        for i in [0, 1, 0x7f, 0x80, 300, 2 ** 40]:
+            self.assertEqual(stream.nextInt(), i)
+        self.assertTrue(stream.exhausted())
+
+    def testBigIntZigZag(self):
+        w = MASTWriter()
+        w.writeBigInt(rbigint.fromint(42))
+        self.assertEqual(w.getvalue(), "\x54")
+
+    def testDoubleRoundTrip(self):
+        w = MASTWriter()
+        w.writeDouble(-2.5)
+        self.assertEqual(MASTStream(w.getvalue()).nextDouble(), -2.5)
+
+
+class TestDumpMAST(TestCase):
+
+    def testSimpleDef(self):
+        bs = dumpMAST(loadMASTBytes(SIMPLE_DEF))
+        expr = loadMASTBytes(bs)
+        self.assertTrue(isinstance(expr, MastIR.DefExpr))
+        self.assertEqual(expr.patt.name, u"x")
+        self.assertEqual(dumpMAST(expr), bs)
+
+    def testNegativeInt(self):
+        expr = MastIR.IntExpr(rbigint.fromint(-7))
+        expr = loadMASTBytes(dumpMAST(expr))
+        self.assertEqual(expr.i.toint(), -7)
+
+
+class TestMASTStream(TestCase):
+
+    def testVarIntOverflowsToBigInt(self):
+        w = MASTWriter()
+        w.writeBigInt(rbigint.fromlong(2 ** 100))
+        w.writeBigInt(rbigint.fromlong(-(2 ** 70)))
+        stream = MASTStream(w.getvalue())
+        self.assertEqual(stream.nextBigInt().tolong(), 2 ** 100)
+        self.assertEqual(stream.nextBigInt().tolong(), -(2 ** 70))
+        self.assertTrue(stream.exhausted())
+
+    def testSmallBigInts(self):
+        w = MASTWriter()
+        for i in [0, -1, 1, -64, 64, -(2 ** 40)]:
+            w.writeBigInt(rbigint.fromint(i))
+        stream = MASTStream(w.getvalue())
+        for i in [0, -1, 1, -64, 64, -(2 ** 40)]:
+            self.assertEqual(stream.nextBigInt().toint(), i)
+
+    def testIntOverflow(self):
+        stream = MASTStream("\xff" * 10 + "\x01")
+        self.assertRaises(InvalidMAST, stream.nextInt)
+
+    def testOversizedSequence(self):
+        bs = SIMPLE_DEF + "S\x05\x00"
+        self.assertRaises(InvalidMAST, loadMASTBytes, bs)
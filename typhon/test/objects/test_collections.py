@@ -16,11 +16,16 @@
 
 from unittest import TestCase
 
+from rpython.rlib.rbigint import rbigint
+
 from typhon.errors import UserException
-from typhon.objects.collections.lists import wrapList, FlexList, unwrapList
+from typhon.objects.collections.lists import (ConstList, FlexList, unwrapList,
+                                              wrapList)
 from typhon.objects.collections.maps import ConstMap, monteMap
 from typhon.objects.collections.sets import ConstSet, monteSet
-from typhon.objects.data import CharObject, IntObject
+from typhon.objects.data import (BigInt, CharObject, IntObject, StrObject,
+                                 unwrapInt)
+from typhon.strategies.lists import vectorStrategy
 
 
 class TestConstMap(TestCase):
@@ -45,6 +50,54 @@ class TestConstMap(TestCase):
         result = m.call(u"get", [IntObject(1)])
         self.assertEqual(result.getInt(), 2)
 
+    def testStrKeys(self):
+        d = monteMap()
+        d[StrObject(u"key")] = IntObject(5)
+        m = ConstMap(d)
+        self.assertEqual(m.extractStringKey(u"key", None).getInt(), 5)
+        self.assertIs(m.extractStringKey(u"other", None), None)
+
+    def testIntKeysMeetBigInts(self):
+        d = monteMap()
+        d[IntObject(5)] = IntObject(5)
+        m = ConstMap(d)
+        self.assertTrue(m.contains(BigInt(rbigint.fromint(5))))
+        self.assertFalse(m.contains(StrObject(u"5")))
+
+    def testWithManyUsesTrie(self):
+        m = ConstMap(monteMap())
+        for i in range(100):
+            m = m.call(u"with", [IntObject(i), IntObject(i * 2)])
+        self.assertIsNot(m.trie, None)
+        self.assertEqual(m.call(u"size", []).getInt(), 100)
+        self.assertEqual(m.call(u"get", [IntObject(42)]).getInt(), 84)
+        self.assertEqual([k.getInt() for k in m.call(u"getKeys", []).asList()],
+                         range(100))
+
+    def testTrieWithout(self):
+        m = ConstMap(monteMap())
+        for i in range(100):
+            m = m.call(u"with", [IntObject(i), IntObject(i)])
+        n = m.call(u"without", [IntObject(5)])
+        self.assertFalse(n.contains(IntObject(5)))
+        self.assertTrue(m.contains(IntObject(5)))
+        self.assertIs(n.call(u"without", [IntObject(5)]), n)
+        self.assertRaises(UserException, n.call, u"get", [IntObject(5)])
+
+    def testTrieOr(self):
+        d = monteMap()
+        for i in range(100):
+            d[IntObject(i)] = IntObject(i)
+        m = ConstMap(d)
+        e = monteMap()
+        e[IntObject(0)] = IntObject(7)
+        e[IntObject(100)] = IntObject(7)
+        result = m.call(u"or", [ConstMap(e)])
+        self.assertEqual(result.call(u"size", []).getInt(), 101)
+        self.assertEqual(result.call(u"get", [IntObject(0)]).getInt(), 0)
+        # Unchanged.
+        self.assertEqual(len(d), 100)
+
 
 class TestwrapList(TestCase):
 
@@ -60,6 +113,27 @@ class TestwrapList(TestCase):
         result = a.call(u"op__cmp", [b])
         self.assertEqual(result.getInt(), 1)
 
+    def testAsListBoxesOnce(self):
+        l = wrapList([IntObject(1), IntObject(2)])
+        boxed = l.asList()
+        self.assertIs(l.asList(), boxed)
+        # Only the boxed elements are kept.
+        self.assertIs(l.strategy.fetch_shared(l), boxed)
+        self.assertEqual([unwrapInt(x) for x in l.asList()], [1, 2])
+
+    def testFromFreshList(self):
+        objs = [IntObject(1), StrObject(u"two")]
+        l = ConstList.fromFreshList(objs)
+        # Boxed storage is taken over, not copied.
+        self.assertIs(l.asList(), objs)
+        ints = ConstList.fromFreshList([IntObject(1), IntObject(2)])
+        self.assertEqual([unwrapInt(x) for x in ints.asList()], [1, 2])
+        self.assertEqual(ConstList.fromFreshList([]).size(), 0)
+
+    def testReverse(self):
+        l = wrapList([IntObject(1), IntObject(2)]).call(u"reverse", [])
+        self.assertEqual([unwrapInt(x) for x in unwrapList(l)], [2, 1])
+
     def testGetNegative(self):
         l = wrapList([])
         self.assertRaises(UserException, l.call, u"get", [IntObject(-1)])
@@ -85,6 +159,89 @@ class TestwrapList(TestCase):
         chars = [char._c for char in unwrapList(result)]
         self.assertEqual(chars, list("def"))
 
+    def testSliceClamps(self):
+        l = wrapList(map(CharObject, "abc"))
+        result = l.call(u"slice", [IntObject(2), IntObject(6)])
+        chars = [char._c for char in unwrapList(result)]
+        self.assertEqual(chars, list("c"))
+
+    def testWithKeepsStrategy(self):
+        l = wrapList([IntObject(1), IntObject(2)])
+        result = l.call(u"with", [IntObject(3)])
+        self.assertIs(result.strategy, l.strategy)
+        self.assertEqual([i.getInt() for i in unwrapList(result)], [1, 2, 3])
+
+    def testWithGeneralizes(self):
+        l = wrapList([IntObject(1)])
+        result = l.call(u"with", [CharObject(u'a')])
+        self.assertIsNot(result.strategy, l.strategy)
+        self.assertEqual(len(unwrapList(result)), 2)
+
+    def testPutDoesNotMutate(self):
+        l = wrapList([IntObject(1), IntObject(2)])
+        result = l.call(u"with", [IntObject(0), IntObject(7)])
+        self.assertEqual([i.getInt() for i in unwrapList(l)], [1, 2])
+        self.assertEqual([i.getInt() for i in unwrapList(result)], [7, 2])
+
+    def testAddSameStrategy(self):
+        a = wrapList([IntObject(1)])
+        b = wrapList([IntObject(2)])
+        result = a.call(u"add", [b])
+        self.assertIs(result.strategy, a.strategy)
+        self.assertEqual([i.getInt() for i in unwrapList(result)], [1, 2])
+
+    def testAddFlexList(self):
+        a = wrapList([IntObject(1)])
+        b = FlexList([CharObject(u'a')])
+        result = a.call(u"add", [b])
+        self.assertEqual(len(unwrapList(result)), 2)
+
+    def testWithManyUsesVector(self):
+        l = wrapList([])
+        for i in range(200):
+            l = l.call(u"with", [IntObject(i)])
+        self.assertIs(l.strategy, vectorStrategy)
+        self.assertEqual([i.getInt() for i in unwrapList(l)], range(200))
+
+    def testVectorSliceWithAndPut(self):
+        l = wrapList([])
+        for i in range(200):
+            l = l.call(u"with", [IntObject(i)])
+        s = l.call(u"slice", [IntObject(10), IntObject(100)])
+        self.assertIs(s.strategy, vectorStrategy)
+        # Appending to the slice mustn't disturb the original.
+        t = s.call(u"with", [CharObject(u'a')])
+        self.assertEqual(l.call(u"get", [IntObject(100)]).getInt(), 100)
+        self.assertEqual(t.call(u"get", [IntObject(90)])._c, u'a')
+        u = t.call(u"with", [IntObject(0), CharObject(u'b')])
+        self.assertEqual(t.call(u"get", [IntObject(0)]).getInt(), 10)
+        self.assertEqual(u.call(u"get", [IntObject(0)])._c, u'b')
+        self.assertEqual(u.call(u"size", []).getInt(), 91)
+
+    def testVectorAdd(self):
+        l = wrapList([IntObject(i) for i in range(100)])
+        l = l.call(u"add", [wrapList([CharObject(u'a')])])
+        self.assertIs(l.strategy, vectorStrategy)
+        l = l.call(u"add", [l])
+        self.assertEqual(len(unwrapList(l)), 202)
+        self.assertEqual(unwrapList(l)[201]._c, u'a')
+
+    def testVectorDiverge(self):
+        l = wrapList([])
+        for i in range(100):
+            l = l.call(u"with", [IntObject(i)])
+        f = l.call(u"diverge", [])
+        f.call(u"push", [IntObject(100)])
+        self.assertEqual(len(unwrapList(f)), 101)
+        self.assertEqual(len(unwrapList(l)), 100)
+
+    def testDivergeIsIndependent(self):
+        l = wrapList([IntObject(1)])
+        f = l.call(u"diverge", [])
+        f.call(u"push", [CharObject(u'a')])
+        self.assertEqual(len(unwrapList(l)), 1)
+        self.assertEqual(len(unwrapList(f)), 2)
+
 
 class TestFlexList(TestCase):
 
@@ -127,6 +284,12 @@ class TestFlexList(TestCase):
         expected = [IntObject(5), IntObject(7)]
         self.assertEqual(l.strategy.size(l), len(expected))
 
+    def testSnapshotIsIndependent(self):
+        l = FlexList([IntObject(5)])
+        snapshot = l.call(u"snapshot", [])
+        l.put(0, IntObject(7))
+        self.assertEqual(unwrapList(snapshot)[0].getInt(), 5)
+
 
 class TestConstSet(TestCase):
 
@@ -146,3 +309,15 @@ class TestConstSet(TestCase):
         d = monteSet()
         d[IntObject(42)] = None
         self.assertEqual(ConstSet(d).toString(), u"[42].asSet()")
+
+    def testWithManyUsesTrie(self):
+        s = ConstSet(monteSet())
+        for i in range(100):
+            s = s.call(u"with", [IntObject(i % 90)])
+        self.assertIsNot(s.trie, None)
+        self.assertEqual(s.call(u"size", []).getInt(), 90)
+        self.assertTrue(s.call(u"contains", [IntObject(89)]).isTrue())
+        s = s.call(u"without", [IntObject(89)])
+        self.assertFalse(s.call(u"contains", [IntObject(89)]).isTrue())
+        keys = [k.getInt() for k in s.call(u"asList", []).asList()]
+        self.assertEqual(keys, range(89))
@@ -14,12 +14,13 @@
 
 from unittest import TestCase
 
-from typhon.objects.collections.lists import wrapList, unwrapList
-from typhon.objects.collections.maps import ConstMap, unwrapMap
-from typhon.objects.constants import unwrapBool, wrapBool
+from typhon.atoms import getAtom
+from typhon.objects.collections.lists import FlexList, wrapList, unwrapList
+from typhon.objects.collections.maps import EMPTY_MAP, ConstMap, unwrapMap
+from typhon.objects.constants import NullObject, unwrapBool, wrapBool
 from typhon.objects.data import (DoubleObject, IntObject, promoteToDouble,
                                  unwrapInt)
-from typhon.objects.refs import isResolved, makePromise, resolution
+from typhon.objects.refs import RefOps, isResolved, makePromise, resolution
 from typhon.vats import scopedVat, testingVat
 
 
@@ -88,3 +89,46 @@ class TestUnwrappers(TestCase):
         with scopedVat(testingVat()):
             p = makeNear(ConstMap({}))
             self.assertEqual(unwrapMap(p).items(), [])
+
+
+class TestForwarding(TestCase):
+
+    def testPipelinedSend(self):
+        vat = testingVat()
+        with scopedVat(vat):
+            p, r = makePromise()
+            result = p.sendAll(getAtom(u"add", 1), [IntObject(1)], EMPTY_MAP)
+            r.resolve(IntObject(41))
+            # The buffered send is now a single turn, resolving the result
+            # directly.
+            self.assertEqual(vat.pendingTurns(), 1)
+            vat.takeSomeTurns()
+            self.assertEqual(unwrapInt(resolution(result)), 42)
+
+    def testChainedPromises(self):
+        vat = testingVat()
+        with scopedVat(vat):
+            p, r = makePromise()
+            p2, r2 = makePromise()
+            result = p.sendAll(getAtom(u"add", 1), [IntObject(1)], EMPTY_MAP)
+            r.resolve(p2)
+            # Still buffered, now on p2, without any turns taken.
+            self.assertEqual(vat.pendingTurns(), 0)
+            r2.resolve(IntObject(1))
+            vat.takeSomeTurns()
+            self.assertEqual(unwrapInt(resolution(result)), 2)
+
+    def testWhenAfterSend(self):
+        # p <- push(1); when (p) -> {...}
+        vat = testingVat()
+        with scopedVat(vat):
+            p, r = makePromise()
+            vat.sendOnly(p, getAtom(u"push", 1), [IntObject(1)], EMPTY_MAP)
+            RefOps().call(u"whenResolvedOnly", [p, NullObject])
+            vat.takeSomeTurns()
+            flex = FlexList([])
+            r.resolve(flex)
+            # The send is delivered before the reactor hears about it.
+            vat.takeSomeTurns(budget=1)
+            self.assertEqual(len(unwrapList(flex.snapshot())), 1)
+            self.assertEqual(vat.pendingTurns(), 1)
@@ -0,0 +1,22 @@
+from unittest import TestCase
+
+from typhon.arguments import Configuration
+from typhon.errors import UsageError
+
+
+class TestConfiguration(TestCase):
+
+    def testTurnBudget(self):
+        config = Configuration(["typhon", "--turn-budget", "5", "script"])
+        self.assertEqual(config.turnBudget, 5)
+        self.assertEqual(config.argv, ["typhon", "script"])
+
+    def testMalformedInt(self):
+        self.assertRaises(UsageError, Configuration,
+                          ["typhon", "--poll-every", "often"])
+
+    def testProcessVat(self):
+        config = Configuration(["typhon", "--process-vat", "/typhon.1.0",
+                                "script"])
+        self.assertEqual(config.processVat, "/typhon.1.0")
+        self.assertEqual(config.argv, ["typhon", "script"])
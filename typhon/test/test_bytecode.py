@@ -0,0 +1,226 @@
+from unittest import TestCase
+
+from rpython.rlib.rbigint import rbigint
+
+from typhon.nano.bytecode import (CALL, JUMP, JUMP_IF_FALSE, ArithSite,
+                                  BytecodeObject, Machine, compileModule)
+from typhon.nano.interp import (MakeProfileNames, backendSettings, env2scope,
+                                lowerMonte, runLowered)
+from typhon.nano.mast import MastIR as M
+from typhon.nano.mix import mix
+from typhon.objects.collections.lists import FlexList, unwrapList, wrapList
+from typhon.objects.data import unwrapInt, unwrapStr
+from typhon.objects.iteration import loop
+
+
+def i(x):
+    return M.IntExpr(rbigint.fromint(x))
+
+
+def call(obj, verb, *args):
+    return M.CallExpr(obj, verb, list(args), [])
+
+
+def final(name):
+    return M.FinalPatt(name, M.NullExpr())
+
+
+def run(expr):
+    return runLowered(lowerMonte(expr, [], u"test"), {})[0]
+
+
+def compiled(expr):
+    lowered = lowerMonte(expr, [], u"test")
+    ast = mix(lowered.ast, env2scope(lowered.outerNames, {}))
+    return compileModule(MakeProfileNames().visitExpr(ast))
+
+
+def opcodes(code):
+    return code.instructions[::2]
+
+
+def methodCode(code):
+    """
+    The code of the first method of the first object built by some code.
+    """
+
+    return code.objects[0].script.methods[0].code
+
+
+class TestBytecode(TestCase):
+
+    def setUp(self):
+        backendSettings.enableBytecode()
+
+    def tearDown(self):
+        backendSettings.bytecode = False
+
+    def testCall(self):
+        # The receiver is a parameter, so the mixer can't fold the call.
+        method = M.MethodExpr(None, u"run", [final(u"x")], [], M.NullExpr(),
+                              call(M.NounExpr(u"x"), u"size"))
+        obj = M.ObjectExpr(None, final(u"o"), [M.NullExpr()], [method], [])
+        expr = M.SeqExpr([obj, call(M.NounExpr(u"o"), u"run",
+                                    M.StrExpr(u"abc"))])
+        code = compiled(expr)
+        self.assertIn(CALL, opcodes(code))
+        self.assertIn(CALL, opcodes(methodCode(code)))
+        self.assertEqual(unwrapInt(run(expr)), 3)
+
+    def testDefAndSeq(self):
+        expr = M.SeqExpr([
+            M.DefExpr(final(u"x"), M.NullExpr(), i(5)),
+            call(M.NounExpr(u"x"), u"multiply", M.NounExpr(u"x")),
+        ])
+        self.assertEqual(unwrapInt(run(expr)), 25)
+
+    def testIf(self):
+        method = M.MethodExpr(None, u"run", [final(u"x")], [], M.NullExpr(),
+                              M.IfExpr(call(M.NounExpr(u"x"), u"isZero"),
+                                       M.StrExpr(u"yes"), M.StrExpr(u"no")))
+        obj = M.ObjectExpr(None, final(u"o"), [M.NullExpr()], [method], [])
+        expr = M.SeqExpr([obj, call(M.NounExpr(u"o"), u"run", i(0))])
+        ops = opcodes(methodCode(compiled(expr)))
+        self.assertIn(JUMP_IF_FALSE, ops)
+        self.assertIn(JUMP, ops)
+        self.assertEqual(unwrapStr(run(expr)), u"yes")
+        expr = M.SeqExpr([obj, call(M.NounExpr(u"o"), u"run", i(1))])
+        self.assertEqual(unwrapStr(run(expr)), u"no")
+
+    def testEscape(self):
+        expr = M.EscapeOnlyExpr(final(u"ej"), M.SeqExpr([
+            call(M.NounExpr(u"ej"), u"run", i(42)),
+            i(0),
+        ]))
+        self.assertEqual(unwrapInt(run(expr)), 42)
+
+    def testEscapeCatch(self):
+        expr = M.EscapeExpr(final(u"ej"),
+                            call(M.NounExpr(u"ej"), u"run", i(6)),
+                            final(u"v"),
+                            call(M.NounExpr(u"v"), u"add", i(1)))
+        self.assertEqual(unwrapInt(run(expr)), 7)
+
+    def testTry(self):
+        expr = M.TryExpr(call(i(1), u"notAVerb"), M.IgnorePatt(M.NullExpr()),
+                         i(7))
+        self.assertEqual(unwrapInt(run(expr)), 7)
+
+    def testObject(self):
+        method = M.MethodExpr(None, u"double", [final(u"x")], [],
+                              M.NullExpr(),
+                              call(M.NounExpr(u"x"), u"multiply", i(2)))
+        obj = M.ObjectExpr(None, final(u"o"), [M.NullExpr()], [method], [])
+        expr = M.SeqExpr([obj, call(M.NounExpr(u"o"), u"double", i(21))])
+        self.assertEqual(unwrapInt(run(expr)), 42)
+
+    def testObjectClosure(self):
+        method = M.MethodExpr(None, u"get", [], [], M.NullExpr(),
+                              M.NounExpr(u"y"))
+        obj = M.ObjectExpr(None, final(u"o"), [M.NullExpr()], [method], [])
+        expr = M.SeqExpr([
+            M.DefExpr(final(u"y"), M.NullExpr(), i(3)),
+            obj,
+            call(M.NounExpr(u"o"), u"get"),
+        ])
+        self.assertEqual(unwrapInt(run(expr)), 3)
+
+    def testMatcher(self):
+        matcher = M.MatcherExpr(M.IgnorePatt(M.NullExpr()), i(9))
+        obj = M.ObjectExpr(None, final(u"o"), [M.NullExpr()], [], [matcher])
+        expr = M.SeqExpr([obj, call(M.NounExpr(u"o"), u"anything", i(1))])
+        self.assertEqual(unwrapInt(run(expr)), 9)
+
+    def testLoop(self):
+        # _loop() takes its fast path for bytecode consumers, too.
+        method = M.MethodExpr(None, u"run", [final(u"k"), final(u"v")], [],
+                              M.NullExpr(),
+                              call(M.NounExpr(u"v"), u"push",
+                                   M.NounExpr(u"k")))
+        consumer = run(M.ObjectExpr(None, final(u"o"), [M.NullExpr()],
+                                    [method], []))
+        self.assertIsInstance(consumer, BytecodeObject)
+        flexes = [FlexList([]), FlexList([])]
+        loop().call(u"run", [wrapList(flexes), consumer])
+        pushed = unwrapList(flexes[1].snapshot())
+        self.assertEqual([unwrapInt(x) for x in pushed], [1])
+
+
+def getter(name, value):
+    method = M.MethodExpr(None, u"get", [], [], M.NullExpr(), i(value))
+    return M.ObjectExpr(None, final(name), [M.NullExpr()], [method], [])
+
+
+def megamorphic():
+    """
+    Send get/0 to more distinct scripts than a call site will remember.
+    """
+
+    method = M.MethodExpr(None, u"run", [final(u"x")], [], M.NullExpr(),
+                          call(M.NounExpr(u"x"), u"get"))
+    caller = M.ObjectExpr(None, final(u"caller"), [M.NullExpr()], [method],
+                          [])
+    exprs = [caller]
+    total = i(0)
+    for j in range(6):
+        name = u"g%d" % j
+        exprs.append(getter(name, j))
+        # Call twice, so that cached entries are hit as well.
+        for _ in range(2):
+            total = call(total, u"add",
+                         call(M.NounExpr(u"caller"), u"run",
+                              M.NounExpr(name)))
+    exprs.append(total)
+    return M.SeqExpr(exprs)
+
+
+class TestCallSites(TestCase):
+
+    def tearDown(self):
+        backendSettings.bytecode = False
+
+    def testMegamorphicEvaluator(self):
+        self.assertEqual(unwrapInt(run(megamorphic())), 30)
+
+    def testMegamorphicBytecode(self):
+        backendSettings.enableBytecode()
+        self.assertEqual(unwrapInt(run(megamorphic())), 30)
+
+    def testArithmeticInMethod(self):
+        # The operands aren't literals, so this can't be folded away.
+        method = M.MethodExpr(None, u"run", [final(u"x")], [], M.NullExpr(),
+                              call(call(M.NounExpr(u"x"), u"add", i(1)),
+                                   u"op__cmp", i(3)))
+        obj = M.ObjectExpr(None, final(u"o"), [M.NullExpr()], [method], [])
+        for backend in (False, True):
+            backendSettings.bytecode = backend
+            expr = M.SeqExpr([obj, call(M.NounExpr(u"o"), u"run", i(2))])
+            self.assertEqual(unwrapInt(run(expr)), 0)
+            expr = M.SeqExpr([obj, call(M.NounExpr(u"o"), u"run",
+                                        M.StrExpr(u"x"))])
+            self.assertRaises(Exception, run, expr)
+
+    def testArithmeticOnUserObject(self):
+        # A user-defined add/1 misses the fast path and goes through the
+        # call site's cache.
+        adder = M.ObjectExpr(None, final(u"adder"), [M.NullExpr()],
+                             [M.MethodExpr(None, u"add", [final(u"y")], [],
+                                           M.NullExpr(), M.NounExpr(u"y"))],
+                             [])
+        method = M.MethodExpr(None, u"run", [final(u"x")], [], M.NullExpr(),
+                              call(M.NounExpr(u"x"), u"add", i(40)))
+        caller = M.ObjectExpr(None, final(u"caller"), [M.NullExpr()],
+                              [method], [])
+        expr = M.SeqExpr([caller, adder,
+                          call(M.NounExpr(u"caller"), u"run",
+                               M.NounExpr(u"adder"))])
+        for backend in (False, True):
+            backendSettings.bytecode = backend
+            self.assertEqual(unwrapInt(run(expr)), 40)
+
+        lowered = lowerMonte(expr, [], u"test")
+        code = compiled(expr)
+        Machine([], lowered.localSize, None, None).run(code, [])
+        site = methodCode(code).calls[0]
+        self.assertIsInstance(site, ArithSite)
+        self.assertEqual(site.size, 1)
@@ -0,0 +1,97 @@
+from unittest import TestCase
+
+from typhon.load.nano import MAGIC as MAST_MAGIC
+from typhon.load.nano import dumpMAST, loadMASTBytes
+from typhon.nano.cache import InvalidCache, dumpLowered, loadLowered
+from typhon.nano.interp import lowerMonte
+from typhon.nano.mast import MastIR
+from typhon.nano.structure import SplitAuditorsIR, prettifyStructure
+
+
+SIMPLE_DEF = (
+    "Mont\xe0MAST\x00" # magic
+    "LN"               # null
+    "N\x03Int"         # Int
+    "PF\x01x\x01"      # x :Int
+    "LI\x54"           # 42
+    "D\x00\x00\x02"    # def x :Int := 42
+)
+
+
+def objectExpr(name, auditor, methods):
+    return MastIR.ObjectExpr(u"", MastIR.FinalPatt(name, MastIR.NullExpr()),
+                             [auditor], methods, [])
+
+def runMethod(body):
+    return MastIR.MethodExpr(u"", u"run", [], [], MastIR.NullExpr(), body)
+
+# object outer as A { method run() { object inner as A {} } };
+# object clear {}
+OBJECTS = MastIR.SeqExpr([
+    objectExpr(u"outer", MastIR.NounExpr(u"A"), [
+        runMethod(objectExpr(u"inner", MastIR.NounExpr(u"A"), [])),
+    ]),
+    objectExpr(u"clear", MastIR.NullExpr(), []),
+])
+
+
+def auditedMASTs(ast):
+    """
+    Re-encode the MAST of every audited object in some lowered IR.
+    """
+
+    masts = []
+    stack = [ast]
+    while stack:
+        expr = stack.pop()
+        if isinstance(expr, SplitAuditorsIR.SeqExpr):
+            stack.extend(expr.exprs)
+        elif isinstance(expr, SplitAuditorsIR.ObjectExpr):
+            masts.append(dumpMAST(expr.clipboard.getMAST()))
+            for method in expr.script.methods:
+                stack.append(method.body)
+    return masts
+
+
+class TestLoweredCache(TestCase):
+
+    def lower(self, source, outerNames):
+        mast = loadMASTBytes(source)
+        lowered = lowerMonte(mast, outerNames, u"test")
+        return lowered, dumpLowered(lowered, source, mast)
+
+    def assertRoundTrips(self, source, outerNames):
+        lowered, bs = self.lower(source, outerNames)
+        restored = loadLowered(bs)
+        self.assertEqual(prettifyStructure(restored.ast),
+                         prettifyStructure(lowered.ast))
+        self.assertEqual(restored.localSize, lowered.localSize)
+        self.assertEqual(restored.topLocalNames, lowered.topLocalNames)
+        self.assertEqual(restored.outerNames, lowered.outerNames)
+        return lowered, restored
+
+    def testRoundTrip(self):
+        self.assertRoundTrips(SIMPLE_DEF, [u"Int"])
+
+    def testRoundTripObjects(self):
+        lowered, restored = self.assertRoundTrips(dumpMAST(OBJECTS), [u"A"])
+        outer, clear = restored.ast.exprs
+        self.assertTrue(isinstance(outer, SplitAuditorsIR.ObjectExpr))
+        self.assertTrue(isinstance(clear, SplitAuditorsIR.ClearObjectExpr))
+        self.assertEqual(len(auditedMASTs(lowered.ast)), 2)
+        self.assertEqual(auditedMASTs(restored.ast),
+                         auditedMASTs(lowered.ast))
+
+    def testMASTStoredOnce(self):
+        _, bs = self.lower(dumpMAST(OBJECTS), [u"A"])
+        self.assertEqual(bs.count(MAST_MAGIC), 1)
+        # Without audited objects, there's no need for the MAST at all.
+        _, bs = self.lower(SIMPLE_DEF, [u"Int"])
+        self.assertEqual(bs.count(MAST_MAGIC), 0)
+
+    def testTruncated(self):
+        _, bs = self.lower(SIMPLE_DEF, [u"Int"])
+        self.assertRaises(InvalidCache, loadLowered, bs[:-1])
+
+    def testWrongMagic(self):
+        self.assertRaises(InvalidCache, loadLowered, "Mont\xe0MAST\x00")
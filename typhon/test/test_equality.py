@@ -16,12 +16,15 @@ from unittest import TestCase
 
 from rpython.rlib.rbigint import rbigint
 
+from typhon.errors import UserException
 from typhon.objects.collections.lists import wrapList
+from typhon.objects.collections.maps import ConstMap, monteMap
 from typhon.objects.constants import NullObject
 from typhon.objects.data import (BigInt, CharObject, DoubleObject, IntObject,
                                  StrObject)
 from typhon.objects.equality import EQUAL, INEQUAL, NOTYET, optSame
 from typhon.objects.refs import makePromise
+from typhon.objects.root import HASH_DEPTH
 from typhon.vats import scopedVat, testingVat
 
 
@@ -92,16 +95,16 @@ class TestOptSame(TestCase):
     def testListEqualityRecursionReflexive(self):
         first = wrapList([IntObject(42), NullObject])
         # Hax.
-        first.objs.append(first)
+        first.strategy.append(first, [first])
         self.assertEqual(optSame(first, first), EQUAL)
 
     def testListEqualityRecursion(self):
         first = wrapList([IntObject(42), NullObject])
         # Hax.
-        first.objs.append(first)
+        first.strategy.append(first, [first])
         second = wrapList([IntObject(42), NullObject])
         # Hax.
-        second.objs.append(second)
+        second.strategy.append(second, [second])
         self.assertEqual(optSame(first, second), EQUAL)
 
     def testListInequality(self):
@@ -148,3 +151,35 @@ class TestOptSame(TestCase):
         first = DoubleObject(float("nan"))
         second = IntObject(42)
         self.assertEqual(optSame(first, second), INEQUAL)
+
+
+class TestSamenessHash(TestCase):
+
+    def testListMemo(self):
+        l = wrapList([IntObject(1), IntObject(2)])
+        h = l.samenessHash()
+        self.assertEqual(l.samenessHash(), h)
+        self.assertEqual(wrapList([IntObject(1), IntObject(2)]).samenessHash(),
+                         h)
+        self.assertTrue(l._hashMemo.has(HASH_DEPTH))
+
+    def testListUnsettled(self):
+        with scopedVat(testingVat()):
+            p, r = makePromise()
+            l = wrapList([IntObject(1), p])
+            # Hashing an unresolved promise fails, and nothing is memoized.
+            self.assertRaises(UserException, l.samenessHash)
+            self.assertIsNone(l._hashMemo)
+            r.resolve(IntObject(2))
+            h = l.samenessHash()
+            self.assertEqual(l.samenessHash(), h)
+            self.assertTrue(l._hashMemo.has(HASH_DEPTH))
+
+    def testMapMemo(self):
+        d = monteMap()
+        d[IntObject(1)] = wrapList([IntObject(2)])
+        m = ConstMap(d)
+        h = m.samenessHash()
+        self.assertEqual(m.samenessHash(), h)
+        self.assertTrue(m._isSettled)
+        self.assertTrue(m._hashMemo.has(HASH_DEPTH))
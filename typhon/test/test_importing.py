@@ -0,0 +1,25 @@
+from unittest import TestCase
+
+from typhon.importing import AstModule
+from typhon.metrics import Recorder
+from typhon.objects.constants import NullObject
+
+
+NULL_MAST = "Mont\xe0MAST\x00LN"
+
+
+class TestAstModule(TestCase):
+
+    def testLoadIsLazy(self):
+        mod = AstModule(Recorder(), u"test")
+        mod.load(NULL_MAST)
+        self.assertEqual(mod.astSource, None)
+
+    def testLoweringIsReused(self):
+        mod = AstModule(Recorder(), u"test")
+        mod.load(NULL_MAST)
+        result, _ = mod.eval({})
+        self.assertEqual(result, NullObject)
+        lowered = mod.lower([])
+        self.assertEqual(mod.astSource, None)
+        self.assertTrue(mod.lower([]) is lowered)
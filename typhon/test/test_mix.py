@@ -0,0 +1,85 @@
+from unittest import TestCase
+
+from rpython.rlib.rarithmetic import LONG_BIT
+from rpython.rlib.rbigint import rbigint
+
+from typhon.nano.interp import lowerMonte
+from typhon.nano.mast import MastIR as M
+from typhon.nano.mix import (ADD, BELOW_ZERO, CMP, MULTIPLY, SUBTRACT, MixIR,
+                             fastArith, mix)
+from typhon.objects.constants import unwrapBool
+from typhon.objects.data import (CharObject, DoubleObject, IntObject,
+                                 StrObject)
+
+
+class TestFastArith(TestCase):
+
+    def testIntAdd(self):
+        rv = fastArith(ADD, IntObject(2), [IntObject(3)])
+        self.assertEqual(rv.getInt(), 5)
+
+    def testIntOverflow(self):
+        big = IntObject(2 ** (LONG_BIT - 2))
+        self.assertEqual(fastArith(MULTIPLY, big, [IntObject(4)]), None)
+
+    def testIntCmp(self):
+        rv = fastArith(CMP, IntObject(2), [IntObject(3)])
+        self.assertEqual(rv.getInt(), -1)
+
+    def testIntBelowZero(self):
+        self.assertTrue(unwrapBool(fastArith(BELOW_ZERO, IntObject(-1), [])))
+
+    def testDoubleInt(self):
+        rv = fastArith(SUBTRACT, DoubleObject(2.5), [IntObject(1)])
+        self.assertEqual(rv.getDouble(), 1.5)
+
+    def testCharCmp(self):
+        rv = fastArith(CMP, CharObject(u"b"), [CharObject(u"a")])
+        self.assertEqual(rv.getInt(), 1)
+
+    def testFallBack(self):
+        self.assertEqual(fastArith(ADD, IntObject(1), [StrObject(u"x")]),
+                         None)
+        self.assertEqual(fastArith(ADD, StrObject(u"x"), [IntObject(1)]),
+                         None)
+
+
+def i(x):
+    return M.IntExpr(rbigint.fromint(x))
+
+
+def call(obj, verb, *args):
+    return M.CallExpr(obj, verb, list(args), [])
+
+
+def mixed(expr):
+    return mix(lowerMonte(expr, [], u"test").ast, [])
+
+
+class TestElideDeadCode(TestCase):
+
+    def testFoldedCall(self):
+        ast = mixed(call(M.StrExpr(u"a"), u"add", M.StrExpr(u"b")))
+        self.assertTrue(isinstance(ast, MixIR.LiveExpr))
+        self.assertEqual(ast.obj.toString(), u"ab")
+
+    def testIfTrue(self):
+        ast = mixed(M.IfExpr(call(i(0), u"isZero"), M.StrExpr(u"yes"),
+                             M.StrExpr(u"no")))
+        self.assertTrue(isinstance(ast, MixIR.LiveExpr))
+        self.assertEqual(ast.obj.toString(), u"yes")
+
+    def testIfNonBool(self):
+        # Not a Bool, so this must still fail when it's run.
+        ast = mixed(M.IfExpr(i(1), M.StrExpr(u"yes"), M.StrExpr(u"no")))
+        self.assertTrue(isinstance(ast, MixIR.IfExpr))
+
+    def testUnreachableMatchers(self):
+        matchers = [
+            M.MatcherExpr(M.FinalPatt(u"m", M.NullExpr()), i(1)),
+            M.MatcherExpr(M.IgnorePatt(M.NullExpr()), i(2)),
+        ]
+        obj = M.ObjectExpr(None, M.FinalPatt(u"o", M.NullExpr()),
+                           [M.NullExpr()], [], matchers)
+        ast = mixed(obj)
+        self.assertEqual(len(ast.script.matchers), 1)
@@ -0,0 +1,75 @@
+from unittest import TestCase
+
+from typhon.rhamt import bitCount, makeOrderedTrieClass
+
+
+def eq(x, y):
+    return x == y
+
+IntTrie = makeOrderedTrieClass(eq, lambda x: x)
+# Every key collides.
+CollidingTrie = makeOrderedTrieClass(eq, lambda x: 7)
+
+
+class TestBitCount(TestCase):
+
+    def testBitCount(self):
+        for i in [0, 1, 2, 3, 0xff, 0x80000000, 0xffffffff, 0x12345678]:
+            self.assertEqual(bitCount(i), bin(i).count("1"))
+
+
+class TestOrderedTrie(TestCase):
+
+    def testPutGet(self):
+        t = IntTrie.fromItems([(i * 37, i) for i in range(2000)])
+        self.assertEqual(t.size, 2000)
+        for i in range(2000):
+            self.assertEqual(t.get(i * 37, None), i)
+        self.assertEqual(t.get(1, None), None)
+
+    def testNegativeHashes(self):
+        t = IntTrie.fromItems([(-i, i) for i in range(100)])
+        for i in range(100):
+            self.assertTrue(t.contains(-i))
+
+    def testOrder(self):
+        keys = [5, 3, 1 << 40, 9, -2]
+        t = IntTrie.fromItems([(k, k) for k in keys])
+        self.assertEqual([k for k, _ in t.iteritems()], keys)
+        # Replacing a value keeps its place.
+        t = t.put(3, 0)
+        self.assertEqual([k for k, _ in t.iteritems()], keys)
+        self.assertEqual(t.get(3, None), 0)
+
+    def testRemove(self):
+        t = IntTrie.fromItems([(i, i) for i in range(100)])
+        u = t.remove(50)
+        self.assertFalse(u.contains(50))
+        self.assertTrue(t.contains(50))
+        self.assertEqual(u.size, 99)
+        self.assertIs(u.remove(50), u)
+        # Putting it back puts it at the end.
+        u = u.put(50, 50)
+        self.assertEqual(u.iteritems()[-1], (50, 50))
+
+    def testRemoveMany(self):
+        t = IntTrie.fromItems([(i, i) for i in range(300)])
+        for i in range(0, 300, 3):
+            t = t.remove(i)
+        self.assertEqual([k for k, _ in t.iteritems()],
+                         [i for i in range(300) if i % 3])
+        for i in range(300):
+            t = t.remove(i)
+        self.assertEqual(t.size, 0)
+        self.assertEqual(t.iteritems(), [])
+
+    def testCollisions(self):
+        t = CollidingTrie.fromItems([(i, i) for i in range(10)])
+        for i in range(10):
+            self.assertEqual(t.get(i, None), i)
+        t = t.remove(4)
+        self.assertFalse(t.contains(4))
+        self.assertEqual(t.size, 9)
+        for i in range(10):
+            t = t.remove(i)
+        self.assertEqual(t.size, 0)
@@ -0,0 +1,44 @@
+from unittest import TestCase
+
+from typhon.rvector import emptyVector, vectorFromList
+
+
+class TestPersistentVector(TestCase):
+
+    def testPushGet(self):
+        # Enough to need a few levels of trie.
+        v = vectorFromList(range(2000))
+        self.assertEqual(v.size, 2000)
+        for i in range(2000):
+            self.assertEqual(v.get(i), i)
+
+    def testPushIsPersistent(self):
+        v = vectorFromList(range(40))
+        w = v.push(40)
+        self.assertEqual(v.size, 40)
+        self.assertEqual(w.size, 41)
+        self.assertEqual(w.get(40), 40)
+
+    def testPut(self):
+        v = vectorFromList(range(1100))
+        for i in [0, 31, 32, 1023, 1024, 1099]:
+            w = v.put(i, -1)
+            self.assertEqual(w.get(i), -1)
+            self.assertEqual(v.get(i), i)
+
+    def testPutEndPushes(self):
+        v = vectorFromList(range(3))
+        self.assertEqual(v.put(3, 3).slice(0, 4), range(4))
+
+    def testGetOutOfBounds(self):
+        v = vectorFromList(range(3))
+        self.assertRaises(IndexError, v.get, 3)
+        self.assertRaises(IndexError, v.get, -1)
+        self.assertRaises(IndexError, emptyVector().get, 0)
+
+    def testSlice(self):
+        v = vectorFromList(range(1100))
+        self.assertEqual(v.slice(0, 1100), range(1100))
+        self.assertEqual(v.slice(30, 70), range(30, 70))
+        self.assertEqual(v.slice(1050, 1100), range(1050, 1100))
+        self.assertEqual(v.slice(5, 5), [])
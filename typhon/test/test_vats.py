@@ -1,6 +1,13 @@
 from unittest import TestCase
 
-from typhon.vats import Vat, VatCheckpointed
+from typhon import vats
+from typhon.atoms import getAtom
+from typhon.metrics import Histogram
+from typhon.objects.collections.maps import EMPTY_MAP, ConstMap, monteMap
+from typhon.objects.data import IntObject, StrObject
+from typhon.objects.refs import makePromise
+from typhon.vats import (BATCH, TurnQueue, Vat, VatCheckpointed,
+                         VatManager, scopedVat, testingVat, withMirandaFail)
 
 class TestVat(TestCase):
 
@@ -35,3 +42,150 @@ class TestVat(TestCase):
         v = Vat(None, None, name=u"test", checkpoints=2)
         # 2 isn't enough for a deduction of 3.
         self.assertRaises(VatCheckpointed, v.checkpoint, points=3)
+
+    def testBatchStamp(self):
+        vat = Vat(None, None, name=u"test", checkpoints=-1)
+        opened = vat._pending.openedAt
+        vat.sendOnly(IntObject(1), getAtom(u"isZero", 0), [], EMPTY_MAP)
+        with scopedVat(vat):
+            vat.takeSomeTurns()
+        # The batch kept its stamp, and the next batch starts collecting
+        # when this one is taken.
+        self.assertEqual(vat._draining.openedAt, opened)
+        self.assertTrue(vat._pending.openedAt >= opened)
+        self.assertEqual(vat.latencies.count, 1)
+
+    def testClockReadOncePerBatch(self):
+        vat = Vat(None, None, name=u"test", checkpoints=-1)
+        isZero = getAtom(u"isZero", 0)
+        for i in range(3):
+            vat.sendOnly(IntObject(i), isZero, [], EMPTY_MAP)
+        readings = [0]
+        def clock():
+            readings[0] += 1
+            return 1.0
+        original = vats.time
+        vats.time = clock
+        try:
+            with scopedVat(vat):
+                self.assertEqual(vat.takeSomeTurns(), 3)
+        finally:
+            vats.time = original
+        # Without a deadline, the clock is read once for the whole batch.
+        self.assertEqual(readings[0], 1)
+        self.assertEqual(vat.latencies.count, 3)
+
+
+class TestTurnQueue(TestCase):
+
+    def testFIFO(self):
+        q = TurnQueue(capacity=2)
+        # Wrap around the ring before growing it.
+        q.push(None, IntObject(0), None, [], EMPTY_MAP)
+        q.pop()
+        for i in range(5):
+            q.push(None, IntObject(i), None, [], EMPTY_MAP)
+        self.assertEqual(q.size, 5)
+        for i in range(5):
+            self.assertEqual(q.pop()[1].getInt(), i)
+        self.assertEqual(q.size, 0)
+
+
+class TestVatManager(TestCase):
+
+    def testTakeSomeTurns(self):
+        manager = VatManager()
+        vats = [Vat(manager, None, name=u"test", checkpoints=-1)
+                for _ in range(2)]
+        manager.vats.extend(vats)
+        for vat in vats:
+            vat.sendOnly(IntObject(1), getAtom(u"isZero", 0), [], EMPTY_MAP)
+        self.assertTrue(manager.anyVatHasTurns())
+        manager.takeSomeTurns()
+        self.assertFalse(manager.anyVatHasTurns())
+
+    def testBudget(self):
+        manager = VatManager()
+        manager.turnBudget = 2
+        batch = Vat(manager, None, name=u"batch", checkpoints=-1,
+                    priority=BATCH)
+        manager.vats.append(batch)
+        for _ in range(3):
+            batch.sendOnly(IntObject(1), getAtom(u"isZero", 0), [],
+                           EMPTY_MAP)
+        manager.takeSomeTurns()
+        self.assertEqual(batch.pendingTurns(), 1)
+        manager.takeSomeTurns()
+        self.assertFalse(manager.anyVatHasTurns())
+        self.assertEqual(batch.maxDepth, 3)
+        self.assertEqual(batch.latencies.count, 3)
+
+    def testCoalescedSends(self):
+        vat = Vat(None, None, name=u"test", checkpoints=-1)
+        isZero = getAtom(u"isZero", 0)
+        one = IntObject(1)
+        for _ in range(3):
+            vat.sendOnly(one, isZero, [], EMPTY_MAP)
+        vat.sendOnly(IntObject(2), isZero, [], EMPTY_MAP)
+        vat.sendOnly(one, isZero, [], EMPTY_MAP)
+        with scopedVat(vat):
+            self.assertEqual(vat.takeSomeTurns(), 5)
+        self.assertEqual(vat.turnCount, 3)
+        self.assertEqual(vat.latencies.count, 5)
+
+    def testCoalescedSendsDeadline(self):
+        vat = Vat(None, None, name=u"test", checkpoints=-1)
+        isZero = getAtom(u"isZero", 0)
+        one = IntObject(1)
+        for _ in range(3):
+            vat.sendOnly(one, isZero, [], EMPTY_MAP)
+        # A clock which ticks once per reading: the batch is stamped at 1,
+        # the first delivery starts at 2, and the deadline passes at 3.
+        ticks = [0.0]
+        def clock():
+            ticks[0] += 1.0
+            return ticks[0]
+        original = vats.time
+        vats.time = clock
+        try:
+            with scopedVat(vat):
+                self.assertEqual(vat.takeSomeTurns(deadline=3.0), 1)
+        finally:
+            vats.time = original
+        self.assertEqual(vat.pendingTurns(), 2)
+        self.assertEqual(vat.latencies.count, 1)
+
+
+class TestHistogram(TestCase):
+
+    def testPercentile(self):
+        h = Histogram()
+        for _ in range(99):
+            h.record(0.000001)
+        h.record(1.0)
+        self.assertEqual(h.percentile(50), 0.000002)
+        self.assertTrue(h.percentile(100) >= 1.0)
+
+    def testSamples(self):
+        h = Histogram()
+        h.record(0.000001, 3)
+        self.assertEqual(h.count, 3)
+        self.assertEqual(h.buckets[1], 3)
+
+
+class TestMirandaFail(TestCase):
+
+    def testAdded(self):
+        with scopedVat(testingVat()):
+            _, r = makePromise()
+        namedArgs = withMirandaFail(EMPTY_MAP, r)
+        self.assertTrue(namedArgs.extractStringKey(u"FAIL", None) is not None)
+        self.assertEqual(len(EMPTY_MAP.objectMap), 0)
+
+    def testSenderWins(self):
+        with scopedVat(testingVat()):
+            _, r = makePromise()
+        d = monteMap()
+        d[StrObject(u"FAIL")] = IntObject(0)
+        namedArgs = ConstMap(d)
+        self.assertTrue(withMirandaFail(namedArgs, r) is namedArgs)
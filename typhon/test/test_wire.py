@@ -0,0 +1,126 @@
+import sys
+from unittest import TestCase
+
+from rpython.rlib.rbigint import rbigint
+
+from typhon.atoms import getAtom
+from typhon.load.nano import MASTWriter
+from typhon.objects.collections.lists import ConstList
+from typhon.objects.collections.maps import EMPTY_MAP, ConstMap, monteMap
+from typhon.objects.constants import NullObject, TrueObject
+from typhon.objects.data import (BigInt, BytesObject, CharObject,
+                                 DoubleObject, IntObject, StrObject)
+from typhon.objects.collections.helpers import asSet
+from typhon.objects.collections.sets import ConstSet
+from typhon.objects.equality import EQUAL, optSame
+from typhon.objects.guards import AnyOfGuard, anyGuard
+from typhon.objects.refs import makePromise
+from typhon.vats import scopedVat, testingVat
+from typhon.wire import (FRAME_SEND, MAGIC, InvalidWire, MakerTable,
+                         dumpFrame, dumpMessage, loadFrame, loadMessage)
+
+
+def message(payload):
+    """
+    A hand-built message for run/1, with the given encoded argument.
+    """
+
+    w = MASTWriter()
+    w.writeBytes(MAGIC)
+    w.writeStr(u"run")
+    w.writeInt(1)
+    w.writeBytes(payload)
+    # No named arguments.
+    w.writeByte("M")
+    w.writeInt(0)
+    return w.getvalue()
+
+
+class TestWire(TestCase):
+
+    def testRoundTrip(self):
+        d = monteMap()
+        d[StrObject(u"key")] = ConstList([IntObject(-5), CharObject(u"x")])
+        args = [
+            NullObject,
+            TrueObject,
+            IntObject(42),
+            BigInt(rbigint.fromlong(2 ** 100)),
+            DoubleObject(1.5),
+            StrObject(u"\u2603"),
+            BytesObject("\x00\xff"),
+            ConstMap(d),
+            ConstSet(asSet([IntObject(1), StrObject(u"two")])),
+            IntObject(-1),
+            IntObject(-sys.maxint - 1),
+            IntObject(sys.maxint),
+        ]
+        atom, loaded, namedArgs = loadMessage(
+            dumpMessage(getAtom(u"run", len(args)), args, EMPTY_MAP))
+        self.assertEqual(atom, getAtom(u"run", len(args)))
+        self.assertEqual(len(loaded), len(args))
+        for x, y in zip(args, loaded):
+            self.assertEqual(optSame(x, y), EQUAL)
+        self.assertEqual(len(namedArgs.objectMap), 0)
+
+    def testUnresolved(self):
+        with scopedVat(testingVat()):
+            p, _ = makePromise()
+        self.assertRaises(InvalidWire, dumpMessage, getAtom(u"run", 1), [p],
+                          EMPTY_MAP)
+
+    def testTruncated(self):
+        bs = dumpMessage(getAtom(u"run", 1), [StrObject(u"hi")], EMPTY_MAP)
+        self.assertRaises(InvalidWire, loadMessage, bs[:-2])
+
+    def testTransparent(self):
+        guard = AnyOfGuard([])
+        makers = MakerTable([anyGuard])
+        bs = dumpMessage(getAtom(u"run", 1), [guard], EMPTY_MAP, makers)
+        _, args, _ = loadMessage(bs, makers)
+        self.assertTrue(isinstance(args[0], AnyOfGuard))
+        self.assertFalse(args[0] is guard)
+
+    def testTooDeep(self):
+        bs = message("L\x01" * 100000 + "N")
+        self.assertRaises(InvalidWire, loadMessage, bs)
+
+    def testTooDeepToSend(self):
+        l = ConstList([])
+        for _ in range(1000):
+            l = ConstList([l])
+        self.assertRaises(InvalidWire, dumpMessage, getAtom(u"run", 1), [l],
+                          EMPTY_MAP)
+
+    def testMakerThrows(self):
+        w = MASTWriter()
+        w.writeByte("U")
+        w.writeInt(0)
+        w.writeStr(u"noSuchVerb")
+        w.writeByte("L")
+        w.writeInt(0)
+        w.writeByte("M")
+        w.writeInt(0)
+        makers = MakerTable([anyGuard])
+        self.assertRaises(InvalidWire, loadMessage, message(w.getvalue()),
+                          makers)
+
+    def testUnknownMaker(self):
+        self.assertRaises(InvalidWire, dumpMessage, getAtom(u"run", 1),
+                          [AnyOfGuard([])], EMPTY_MAP)
+
+
+class TestFrame(TestCase):
+
+    def testRoundTrip(self):
+        bs = dumpMessage(getAtom(u"run", 1), [IntObject(42)], EMPTY_MAP)
+        kind, answer, message = loadFrame(dumpFrame(FRAME_SEND, 300, bs))
+        self.assertEqual(kind, FRAME_SEND)
+        self.assertEqual(answer, 300)
+        self.assertEqual(message, bs)
+
+    def testUnknownKind(self):
+        self.assertRaises(InvalidWire, loadFrame, dumpFrame("X", 0, ""))
+
+    def testTruncated(self):
+        self.assertRaises(InvalidWire, loadFrame, "S\x80")
@@ -14,12 +14,16 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+from time import time
+
+from rpython.rlib.debug import debug_print
 from rpython.rlib.rthread import ThreadLocalReference, allocate_lock
 
 from typhon import log
 from typhon.atoms import getAtom
 from typhon.autohelp import autohelp, method
 from typhon.errors import Ejecting, UserException, userError
+from typhon.metrics import Histogram
 from typhon.objects.auditors import deepFrozenStamp
 from typhon.objects.root import Object
 from typhon.objects.data import StrObject
@@ -30,6 +34,13 @@ RUN_1 = getAtom(u"run", 1)
 SEED_1 = getAtom(u"seed", 1)
 SPROUT_2 = getAtom(u"sprout", 2)
 
+FAIL = StrObject(u"FAIL")
+
+# Priority classes for vats. Higher classes take their turns first, and get
+# larger turn budgets.
+BATCH, NORMAL, INTERACTIVE = range(3)
+PRIORITIES = [INTERACTIVE, NORMAL, BATCH]
+
 
 class VatCheckpointed(Exception):
     """The raising vat decided to abort its current turn.
@@ -39,6 +50,79 @@ class VatCheckpointed(Exception):
     """
 
 
+class TurnQueue(object):
+    """
+    A FIFO of pending turns.
+
+    Turns are stored column-wise in a ring buffer whose capacity is always a
+    power of two; it doubles when full.
+
+    Rather than stamping each turn with the time it was queued, which would
+    put the clock on every send, the queue remembers when it started
+    collecting turns; see Vat.takeSomeTurns().
+    """
+
+    # When this queue last started collecting turns.
+    openedAt = 0.0
+
+    def __init__(self, capacity=16):
+        assert capacity > 0 and not capacity & (capacity - 1)
+        self.head = 0
+        self.size = 0
+        self.resolvers = [None] * capacity
+        self.targets = [None] * capacity
+        self.atoms = [None] * capacity
+        self.argss = [None] * capacity
+        self.namedArgss = [None] * capacity
+
+    def push(self, resolver, target, atom, args, namedArgs):
+        capacity = len(self.targets)
+        if self.size == capacity:
+            self.grow()
+            capacity = len(self.targets)
+        i = (self.head + self.size) & (capacity - 1)
+        self.resolvers[i] = resolver
+        self.targets[i] = target
+        self.atoms[i] = atom
+        self.argss[i] = args
+        self.namedArgss[i] = namedArgs
+        self.size += 1
+
+    def pop(self):
+        assert self.size > 0, "Popped an empty turn queue"
+        i = self.head
+        turn = (self.resolvers[i], self.targets[i], self.atoms[i],
+                self.argss[i], self.namedArgss[i])
+        # Don't keep the turn's objects alive.
+        self.resolvers[i] = None
+        self.targets[i] = None
+        self.atoms[i] = None
+        self.argss[i] = None
+        self.namedArgss[i] = None
+        self.head = (i + 1) & (len(self.targets) - 1)
+        self.size -= 1
+        return turn
+
+    def peekTarget(self):
+        """
+        The target of the next turn, if any.
+        """
+
+        return self.targets[self.head] if self.size else None
+
+    def grow(self):
+        capacity = len(self.targets)
+        # Unroll the ring so that the head is at the front again.
+        order = [(self.head + j) & (capacity - 1) for j in range(self.size)]
+        extra = [None] * capacity
+        self.resolvers = [self.resolvers[j] for j in order] + extra
+        self.targets = [self.targets[j] for j in order] + extra
+        self.atoms = [self.atoms[j] for j in order] + extra
+        self.argss = [self.argss[j] for j in order] + extra
+        self.namedArgss = [self.namedArgss[j] for j in order] + extra
+        self.head = 0
+
+
 @autohelp
 class Vat(Object):
     """
@@ -47,9 +131,11 @@ class Vat(Object):
 
     name = u"pa"
 
-    def __init__(self, manager, uv_loop, name=None, checkpoints=0):
+    def __init__(self, manager, uv_loop, name=None, checkpoints=0,
+                 priority=NORMAL):
         assert checkpoints != 0, "No, you can't create a zero-checkpoint vat"
         self.checkpoints = checkpoints
+        self.priority = priority
 
         self._manager = manager
         self.uv_loop = uv_loop
@@ -59,8 +145,25 @@ class Vat(Object):
 
         self._callbacks = []
 
+        # Senders hold this lock only long enough to push one turn, and the
+        # vat holds it only to swap queues, once per batch. All vats share
+        # one thread (see VatManager), so it's never contended, and there's
+        # no other thread's loop to wake up when a turn arrives.
         self._pendingLock = allocate_lock()
-        self._pending = []
+        self._pending = TurnQueue()
+        self._pending.openedAt = time()
+        # Turns taken off of _pending in a single batch; only the vat's own
+        # thread touches this queue, so it needs no lock.
+        self._draining = TurnQueue()
+
+        # Metrics: The deepest that the queue has been at the start of a
+        # batch, how many turns have been taken, and how long messages
+        # waited in the queue. Waits are measured from when the message's
+        # batch started collecting, to when its turn was taken or, without a
+        # deadline, to when its batch started draining.
+        self.maxDepth = 0
+        self.turnCount = 0
+        self.latencies = Histogram()
 
     def log(self, message, tags=[]):
         log.log(["vat"] + tags, u"Vat %s: %s" % (self.name, message))
@@ -71,7 +174,7 @@ class Vat(Object):
         else:
             checkpoints = u"immortal"
         return u"<vat(%s, %s, %d turns pending)>" % (self.name, checkpoints,
-                                                     len(self._pending))
+                                                     self.pendingTurns())
 
     @method("Any", "Any")
     def seed(self, f):
@@ -83,10 +186,17 @@ class Vat(Object):
         return packLocalRef(self.send(f, RUN_0, [], EMPTY_MAP), self,
                             currentVat.get())
 
-    @method("Any", "Str", "Int")
-    def sprout(self, name, checkpoints):
+    @method("Any", "Str", "Int", priority="Any")
+    def sprout(self, name, checkpoints, priority=None):
+        from typhon.objects.data import unwrapInt
+        if priority is None:
+            p = NORMAL
+        else:
+            p = unwrapInt(priority)
+            if p not in PRIORITIES:
+                raise userError(u"sprout/2: Unknown priority %d" % p)
         vat = Vat(self._manager, self.uv_loop, name,
-                  checkpoints=checkpoints)
+                  checkpoints=checkpoints, priority=p)
         self._manager.vats.append(vat)
         return vat
 
@@ -106,16 +216,24 @@ class Vat(Object):
     def send(self, target, atom, args, namedArgs):
         from typhon.objects.refs import makePromise
         promise, resolver = makePromise()
+        self.forward(resolver, target, atom, args, namedArgs)
+        return promise
+
+    def forward(self, resolver, target, atom, args, namedArgs):
+        """
+        Plan to send a message, resolving an existing resolver with the
+        result.
+        """
+
         with self._pendingLock:
-            self._pending.append((resolver, target, atom, args, namedArgs))
+            self._pending.push(resolver, target, atom, args, namedArgs)
             # self.log(u"Planning to send: %s<-%s(%s) (resolver: yes)" %
             #          (target.toQuote(), atom.verb,
             #           u", ".join([arg.toQuote() for arg in args])))
-        return promise
 
     def sendOnly(self, target, atom, args, namedArgs):
         with self._pendingLock:
-            self._pending.append((None, target, atom, args, namedArgs))
+            self._pending.push(None, target, atom, args, namedArgs)
             # self.log(u"Planning to send: %s<-%s(%s) (resolver: no)" %
             #          (target.toQuote(), atom.verb,
             #           u", ".join([arg.toQuote() for arg in args])))
@@ -126,17 +244,26 @@ class Vat(Object):
         # we'll take zero turns and then run our callbacks. This prevents
         # callbacks prepared in the initial turn from being skipped in the
         # event that there are no queued turns.
-        return len(self._pending) or len(self._callbacks)
+        return self.pendingTurns() or len(self._callbacks)
 
-    def takeTurn(self):
-        from typhon.objects.refs import Promise, resolution
+    def pendingTurns(self):
+        return self._pending.size + self._draining.size
 
-        with self._pendingLock:
-            resolver, target, atom, args, namedArgs = self._pending.pop(0)
+    def deliver(self, resolver, target, atom, args, namedArgs):
+        from typhon.objects.refs import resolution
 
         # If the target is a promise, then we should send to it instead of
         # calling. Try to resolve it as much as possible first, though.
-        target = resolution(target)
+        self.deliverResolved(resolver, resolution(target), atom, args,
+                             namedArgs)
+
+    def deliverResolved(self, resolver, target, atom, args, namedArgs):
+        """
+        Deliver a message to a target which has already been resolved as far
+        as it can be.
+        """
+
+        from typhon.objects.refs import Promise
 
         # self.log(u"Taking turn: %s<-%s(%s) (resolver: %s)" %
         #          (target.toQuote(), atom.verb,
@@ -163,14 +290,9 @@ class Vat(Object):
                          tags=["serious"])
 
         else:
-            from typhon.objects.collections.maps import ConstMap, monteMap
             from typhon.objects.exceptions import sealException
-            from typhon.objects.refs import Smash
 
-            # XXX monteMap()
-            mirandaArgs = monteMap()
-            mirandaArgs[StrObject(u"FAIL")] = Smash(resolver)
-            namedArgs = ConstMap(namedArgs._or(mirandaArgs))
+            namedArgs = withMirandaFail(namedArgs, resolver)
             try:
                 # call/send.
                 if isinstance(target, Promise):
@@ -191,14 +313,81 @@ class Vat(Object):
                          tags=["serious"])
                 resolver.smash(sealException(userError(u"Ejector tried to escape from vat")))
 
-    def takeSomeTurns(self):
+    def takeSomeTurns(self, budget=-1, deadline=0.0):
+        """
+        Take pending turns, stopping after `budget` messages (if not
+        negative) or once `deadline` has passed (if not zero).
+
+        Return the number of messages delivered.
+        """
+
         # Limit the number of continuous turns to keep network latency low.
         # It's possible that more turns will be queued while we're taking
-        # these turns, after all.
-        count = len(self._pending)
-        # print "Taking", count, "turn(s) on", self.repr()
-        for _ in range(count):
-            self.takeTurn()
+        # these turns, after all. Those turns land in the other queue, and
+        # wait for the next batch. If a previous batch was interrupted, then
+        # finish it first, to keep turns in order.
+        # Without a deadline, the clock is only needed for queue latency, so
+        # it's read once here, rather than once per turn.
+        now = time()
+        if not self._draining.size:
+            # Stamp the batch here, once, instead of stamping every send.
+            with self._pendingLock:
+                self._pending, self._draining = self._draining, self._pending
+                self._pending.openedAt = now
+            if self._draining.size > self.maxDepth:
+                self.maxDepth = self._draining.size
+        from typhon.objects.refs import resolution
+        draining = self._draining
+        taken = 0
+        while draining.size and taken != budget:
+            if deadline:
+                now = time()
+                if now >= deadline:
+                    break
+            resolver, target, atom, args, namedArgs = draining.pop()
+            resolved = resolution(target)
+            self.deliverResolved(resolver, resolved, atom, args, namedArgs)
+            delivered = 1
+            # Messages queued back to back for the same target, as from a
+            # loop of sends, share the turn: the target is resolved once, and
+            # the group's queue latency is recorded once. Each message is
+            # still delivered on its own, in order, with its own exception
+            # handling, and within the deadline.
+            while (draining.size and taken + delivered != budget and
+                   draining.peekTarget() is target):
+                if deadline and time() >= deadline:
+                    break
+                resolver, _, atom, args, namedArgs = draining.pop()
+                self.deliverResolved(resolver, resolved, atom, args,
+                                     namedArgs)
+                delivered += 1
+            self.latencies.record(now - draining.openedAt, delivered)
+            taken += delivered
+            self.turnCount += 1
+        return taken
+
+
+def withMirandaFail(namedArgs, resolver):
+    """
+    Add a FAIL named argument which smashes `resolver`, unless the sender
+    already gave one.
+    """
+
+    from typhon.objects.collections.maps import ConstMap, monteMap
+    from typhon.objects.refs import Smash
+
+    # The sender's FAIL wins, as with .or/1; in that case, there's nothing to
+    # build. Otherwise, copy the sender's map once, and only if it's got
+    # anything in it; most sends have no named arguments at all.
+    objectMap = namedArgs.asDict()
+    if FAIL in objectMap:
+        return namedArgs
+    if objectMap:
+        d = objectMap.copy()
+    else:
+        d = monteMap()
+    d[FAIL] = Smash(resolver)
+    return ConstMap(d)
 
 
 currentVat = ThreadLocalReference(Vat)
@@ -248,8 +437,21 @@ class CurrentVatProxy(Object):
 class VatManager(object):
     """
     A collection of vats.
+
+    All vats share the main thread and its libuv loop, and take turns in
+    order of priority, each within a budget so that a busy vat can't starve
+    the others or I/O. RPython's GC and JIT aren't thread-safe without a
+    global lock, which would serialize turns anyway, so vats aren't given
+    their own threads; use separate processes for more cores.
     """
 
+    # The number of messages a BATCH vat may deliver in one pass; higher
+    # priorities get twice as many per class. Negative for no limit.
+    turnBudget = 1000
+
+    # Wall-clock seconds a vat may spend in one pass, or zero for no limit.
+    timeBudget = 0.0
+
     def __init__(self):
         self.vats = []
 
@@ -258,3 +460,34 @@ class VatManager(object):
             if vat.hasTurns():
                 return True
         return False
+
+    def takeSomeTurns(self):
+        """
+        Let each vat with pending work take some turns.
+        """
+
+        # Vats sprouted during these turns are appended, and will get their
+        # turns on the next pass.
+        vats = self.vats[:]
+        for priority in PRIORITIES:
+            for vat in vats:
+                if vat.priority != priority or not vat.hasTurns():
+                    continue
+                budget = self.turnBudget
+                if budget >= 0:
+                    budget <<= priority
+                deadline = 0.0
+                if self.timeBudget > 0.0:
+                    deadline = time() + self.timeBudget
+                with scopedVat(vat) as vat:
+                    vat.takeSomeTurns(budget, deadline)
+
+    def printResults(self):
+        debug_print("Vat queues:")
+        for vat in self.vats:
+            debug_print("~", vat.name.encode("utf-8") + ":",
+                        "max depth", vat.maxDepth,
+                        "turns", vat.turnCount,
+                        "messages", vat.latencies.count,
+                        "p50", vat.latencies.percentile(50),
+                        "p99", vat.latencies.percentile(99))
@@ -0,0 +1,307 @@
+"""
+A compact binary form for messages between vats which share nothing.
+
+Only data which can be copied without losing identity may cross: null,
+Booleans, the scalar data types, Lists, Maps, and Sets of such data, and
+Transparent objects whose makers both sides have agreed upon. Each value is
+a one-byte tag followed by its payload; varints, doubles, and strings are
+encoded exactly as in MAST.
+
+Vats in the same process don't need any of this, since DeepFrozen data is
+already shared between them by reference.
+"""
+
+from rpython.rlib.rarithmetic import LONG_BIT, intmask, r_uint
+
+from typhon.atoms import getAtom
+from typhon.errors import UserException
+from typhon.load.nano import InvalidMAST, MASTStream, MASTWriter
+from typhon.objects.auditors import selfless, transparentStamp
+from typhon.objects.collections.helpers import monteSet
+from typhon.objects.collections.lists import ConstList, unwrapList
+from typhon.objects.collections.maps import ConstMap, monteMap
+from typhon.objects.collections.sets import ConstSet
+from typhon.objects.constants import FalseObject, NullObject, TrueObject
+from typhon.objects.data import (BigInt, BytesObject, CharObject,
+                                 DoubleObject, IntObject, StrObject,
+                                 unwrapStr)
+from typhon.objects.refs import resolution
+
+
+class InvalidWire(Exception):
+    """
+    A message could not be encoded or decoded.
+    """
+
+    def __init__(self, message):
+        self.message = message
+
+
+# Bump this whenever the format changes shape.
+MAGIC = "Mont\xe0W\x00\x02"
+
+# How deeply Lists, Maps, Sets, and uncalls may nest. The codec recurses, so
+# this keeps a hostile message from overflowing the stack.
+MAX_DEPTH = 256
+
+
+class MakerTable(object):
+    """
+    The makers of Transparent objects which may be sent, in an order which
+    both ends agree upon.
+    """
+
+    def __init__(self, makers):
+        self.makers = makers
+        self.indices = {}
+        for i, maker in enumerate(makers):
+            self.indices[maker] = i
+
+    def indexOf(self, maker):
+        return self.indices.get(maker, -1)
+
+    def makerAt(self, index):
+        if not 0 <= index < len(self.makers):
+            raise InvalidWire("Unknown maker %d" % index)
+        return self.makers[index]
+
+NO_MAKERS = MakerTable([])
+
+
+def writeSmallInt(w, i):
+    """
+    Write a machine int as a zigzagged varint, as read by nextBigInt().
+    """
+
+    # Skip the rbigint which writeBigInt() would need.
+    z = (r_uint(i) << 1) ^ r_uint(i >> (LONG_BIT - 1))
+    while z >= 0x80:
+        w.writeByte(chr(intmask(z & 0x7f) | 0x80))
+        z >>= 7
+    w.writeByte(chr(intmask(z)))
+
+
+def writeObject(w, obj, makers, depth=0):
+    if depth > MAX_DEPTH:
+        raise InvalidWire("Data is nested too deeply")
+    obj = resolution(obj)
+    if obj is NullObject:
+        w.writeByte("N")
+    elif obj is TrueObject:
+        w.writeByte("T")
+    elif obj is FalseObject:
+        w.writeByte("F")
+    elif isinstance(obj, IntObject):
+        w.writeByte("I")
+        writeSmallInt(w, obj.getInt())
+    elif isinstance(obj, BigInt):
+        w.writeByte("I")
+        w.writeBigInt(obj.bi)
+    elif isinstance(obj, DoubleObject):
+        w.writeByte("D")
+        w.writeDouble(obj.getDouble())
+    elif isinstance(obj, CharObject):
+        w.writeByte("C")
+        w.writeInt(ord(obj.getChar()))
+    elif isinstance(obj, StrObject):
+        w.writeByte("S")
+        w.writeStr(obj.getString())
+    elif isinstance(obj, BytesObject):
+        bs = obj.getBytes()
+        w.writeByte("B")
+        w.writeInt(len(bs))
+        w.writeBytes(bs)
+    elif isinstance(obj, ConstList):
+        w.writeByte("L")
+        objs = obj.asList()
+        w.writeInt(len(objs))
+        for o in objs:
+            writeObject(w, o, makers, depth + 1)
+    elif isinstance(obj, ConstMap):
+        w.writeByte("M")
+        d = obj.asDict()
+        w.writeInt(len(d))
+        for k, v in d.iteritems():
+            writeObject(w, k, makers, depth + 1)
+            writeObject(w, v, makers, depth + 1)
+    elif isinstance(obj, ConstSet):
+        w.writeByte("E")
+        d = obj.asDict()
+        w.writeInt(len(d))
+        for k in d.keys():
+            writeObject(w, k, makers, depth + 1)
+    elif obj.auditedBy(selfless) and obj.auditedBy(transparentStamp):
+        # Send the uncall, and call it again on the other side.
+        uncall = unwrapList(obj.call(u"_uncall", []))
+        if len(uncall) != 4:
+            raise InvalidWire("Malformed uncall")
+        index = makers.indexOf(resolution(uncall[0]))
+        if index < 0:
+            raise InvalidWire("Can't send %s; its maker is unknown" %
+                              obj.toString().encode("utf-8"))
+        w.writeByte("U")
+        w.writeInt(index)
+        w.writeStr(unwrapStr(uncall[1]))
+        writeObject(w, uncall[2], makers, depth + 1)
+        writeObject(w, uncall[3], makers, depth + 1)
+    else:
+        raise InvalidWire("Can't send %s between processes" %
+                          obj.toString().encode("utf-8"))
+
+
+def readObject(stream, makers, depth=0):
+    if depth > MAX_DEPTH:
+        raise InvalidWire("Data is nested too deeply")
+    tag = stream.nextByte()
+    if tag == "N":
+        return NullObject
+    elif tag == "T":
+        return TrueObject
+    elif tag == "F":
+        return FalseObject
+    elif tag == "I":
+        bi = stream.nextBigInt()
+        try:
+            return IntObject(bi.toint())
+        except OverflowError:
+            return BigInt(bi)
+    elif tag == "D":
+        return DoubleObject(stream.nextDouble())
+    elif tag == "C":
+        c = stream.nextInt()
+        if c > 0x10ffff:
+            raise InvalidWire("Char is out of range")
+        return CharObject(unichr(c))
+    elif tag == "S":
+        return StrObject(stream.nextStr())
+    elif tag == "B":
+        return BytesObject(stream.nextBytes(stream.nextInt()))
+    elif tag == "L":
+        size = stream.nextInt()
+        if size > stream.remaining():
+            raise InvalidWire("List is larger than the message")
+        return ConstList.fromFreshList([readObject(stream, makers, depth + 1)
+                                        for _ in range(size)])
+    elif tag == "M":
+        size = stream.nextInt()
+        if size > stream.remaining():
+            raise InvalidWire("Map is larger than the message")
+        d = monteMap()
+        for _ in range(size):
+            k = readObject(stream, makers, depth + 1)
+            d[k] = readObject(stream, makers, depth + 1)
+        return ConstMap(d)
+    elif tag == "E":
+        size = stream.nextInt()
+        if size > stream.remaining():
+            raise InvalidWire("Set is larger than the message")
+        d = monteSet()
+        for _ in range(size):
+            d[readObject(stream, makers, depth + 1)] = None
+        return ConstSet(d)
+    elif tag == "U":
+        index = stream.nextInt()
+        maker = makers.makerAt(index)
+        verb = stream.nextStr()
+        args = readObject(stream, makers, depth + 1)
+        namedArgs = readObject(stream, makers, depth + 1)
+        if not isinstance(args, ConstList):
+            raise InvalidWire("Uncalled arguments aren't a List")
+        if not isinstance(namedArgs, ConstMap):
+            raise InvalidWire("Uncalled named arguments aren't a Map")
+        try:
+            return maker.call(verb, args.asList(), namedArgs)
+        except UserException:
+            raise InvalidWire("Maker %d couldn't rebuild an object" % index)
+    else:
+        raise InvalidWire("Unknown tag %s" % tag)
+
+
+def dumpMessage(atom, args, namedArgs, makers=NO_MAKERS):
+    """
+    Encode a message for a vat in another process.
+    """
+
+    w = MASTWriter()
+    w.writeBytes(MAGIC)
+    w.writeStr(atom.verb)
+    w.writeInt(len(args))
+    for arg in args:
+        writeObject(w, arg, makers)
+    writeObject(w, namedArgs, makers)
+    return w.getvalue()
+
+
+def loadMessage(bs, makers=NO_MAKERS):
+    """
+    Decode a message from a vat in another process.
+
+    Returns the atom, the arguments, and the named arguments. Transparent
+    objects are rebuilt by calling their makers, so this may run user code.
+    """
+
+    if not bs.startswith(MAGIC):
+        raise InvalidWire("Wrong magic")
+    stream = MASTStream(bs)
+    stream.index = len(MAGIC)
+    try:
+        verb = stream.nextStr()
+        size = stream.nextInt()
+        if size > stream.remaining():
+            raise InvalidWire("Too many arguments")
+        args = [readObject(stream, makers) for _ in range(size)]
+        namedArgs = readObject(stream, makers)
+    except InvalidMAST:
+        raise InvalidWire("Malformed message")
+    if not isinstance(namedArgs, ConstMap):
+        raise InvalidWire("Named arguments aren't a Map")
+    if not stream.exhausted():
+        raise InvalidWire("Trailing garbage")
+    return getAtom(verb, len(args)), args, namedArgs
+
+
+# The kinds of frame which pass between a process vat and its parent. Each
+# frame is a kind, an answer ID, and then an encoded message.
+
+# Deliver the message to the root, and answer it.
+FRAME_SEND = "S"
+# Deliver the message to the root, without answering it.
+FRAME_SEND_ONLY = "O"
+# Deliver resolve/1 or smash/1 to the answer's resolver.
+FRAME_ANSWER = "A"
+# Hang up; no more frames will follow.
+FRAME_CLOSE = "C"
+
+FRAME_KINDS = FRAME_SEND + FRAME_SEND_ONLY + FRAME_ANSWER + FRAME_CLOSE
+
+
+def dumpFrame(kind, answer, message):
+    """
+    Frame an encoded message.
+    """
+
+    w = MASTWriter()
+    w.writeByte(kind)
+    w.writeInt(answer)
+    w.writeBytes(message)
+    return w.getvalue()
+
+
+def loadFrame(bs):
+    """
+    Take a frame apart.
+
+    Returns the kind, the answer ID, and the still-encoded message.
+    """
+
+    stream = MASTStream(bs)
+    try:
+        kind = stream.nextByte()
+        answer = stream.nextInt()
+    except InvalidMAST:
+        raise InvalidWire("Malformed frame")
+    if kind not in FRAME_KINDS:
+        raise InvalidWire("Unknown frame kind %s" % kind)
+    start = stream.index
+    assert start >= 0, "proven impossible by hand"
+    return kind, answer, bs[start:]